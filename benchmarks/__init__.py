@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+"""
+Mesures de performance des deux chaînes de traitement (tarifs CNH, XML de commande).
+
+  - datagen : jeux de données synthétiques déterministes (graine + volume)
+  - run     : scénarios chronométrés (temps, pic mémoire) -> rapport JSON
+
+Exemple :
+    python -m benchmarks.run --lines 100000 --out bench.json
+    python -m benchmarks.run --lines 100000 --compare bench.json
+"""
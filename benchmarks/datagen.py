@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+Générateur de données synthétiques pour les benchmarks.
+
+Tout est déterministe pour une graine donnée (random.Random), afin que deux
+rapports produits sur des commits différents mesurent exactement les mêmes
+fichiers. Les formats suivent ceux lus par l'application :
+  - tarif CNH (largeur fixe, tarif_core.OFFSETS) : cnh_tarif_text
+  - tarif fournisseur (largeur fixe latin1, xml_core.TARIF_COLSPECS) : supplier_tarif_bytes
+  - stock (csv ';' latin1) : stock_csv_bytes
+  - purchase Format A / Format B (xlsx, xml_core.FORMAT_SPECS) : purchase_xlsx_bytes
+  - infos (xlsx donnee / valeur) : infos_xlsx_bytes
+
+Exemple (écrit un jeu complet dans un dossier) :
+    python -m benchmarks.datagen --lines 100000 --out bench_data/
+"""
+
+import argparse
+import io
+import random
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+from tarif_core import DEFAULT_REMISE, HEADER_PREFIX, OFFSETS
+from xml_core import FORMAT_SPECS, TARIF_COLSPECS
+
+DEFAULT_SEED = 42
+
+DESCRIPTIONS = [
+    "FILTRE A HUILE", "JOINT TORIQUE", "ÉCROU M12", "VIS TH 10X40", "ROULEMENT",
+    "COURROIE TRAPÉZOÏDALE", "SUPPORT", "BAGUE D'ÉTANCHÉITÉ", "PIGNON Z=17", "KIT RÉPARATION",
+]
+
+# Codes remise CNH : ceux de la table par défaut + quelques codes inconnus / vides
+REMISE_CODES = list(DEFAULT_REMISE) + ["X", " "]
+
+
+def _widths(offsets):
+    return [b - a for a, b in zip(offsets, offsets[1:])]
+
+
+# ==================== TARIF CNH ====================
+def cnh_refs(n, seed=DEFAULT_SEED):
+    """Références pièce CNH (uniques) d'un tarif de `n` lignes."""
+    r = random.Random(seed)
+    return [str(v) for v in r.sample(range(10**7, 10**9), n)]
+
+
+def cnh_tarif_text(n, seed=DEFAULT_SEED, refs=None):
+    """
+    Tarif CNH de `n` lignes (texte, fins de ligne CRLF), précédé de la ligne
+    d'en-tête CNEUR01FR_FR…. Quelques lignes vides, champs vides et lignes
+    tronquées sont insérés à intervalles fixes, comme dans les vrais fichiers.
+    """
+    r = random.Random(seed)
+    refs = refs if refs is not None else cnh_refs(n, seed)
+    w = _widths(OFFSETS)   # 18, 40, 1, 1, 8, 11, 13, 5, 4, 1, 5, 5, 1, 3
+    lines = [f"{HEADER_PREFIX}_FR20260105".ljust(OFFSETS[-1])]
+    for i, ref in enumerate(refs):
+        prix = f"{r.randint(1, 10**7):0{w[5]}d}" if i % 53 else " " * w[5]
+        qte  = f"{r.randint(1, 500):>{w[7]}}" if i % 7 else " " * w[7]
+        mpc  = f"{r.randint(0, 99999):05d}" if i % 11 else " " * w[11]
+        line = (
+            ref.ljust(w[0])
+            + r.choice(DESCRIPTIONS).ljust(w[1])
+            + r.choice("AB ") + r.choice("X ")
+            + ("20260105" if i % 17 else " " * w[4])
+            + prix
+            + f"{r.randint(0, 10**8):>{w[6]}}"
+            + qte
+            + r.choice(["ABCD", "EFGH", "    "])
+            + r.choice(REMISE_CODES)
+            + r.choice(["P1234", "P5678", "     "])
+            + mpc
+            + r.choice("Y ")
+            + r.choice(["001", "002", ""])
+        )
+        if i % 499 == 0:
+            line = line[:OFFSETS[6]]        # ligne tronquée
+        if i % 997 == 0:
+            lines.append("")                # ligne vide
+        lines.append(line)
+    return "\r\n".join(lines) + "\r\n"
+
+
+# ==================== FICHIERS FOURNISSEUR (XML) ====================
+def supplier_articles(n, seed=DEFAULT_SEED):
+    """Références article (uniques) d'un tarif fournisseur de `n` lignes."""
+    r = random.Random(seed + 1)
+    return [str(v) for v in r.sample(range(10**6, 10**8), n)]
+
+
+def supplier_tarif_bytes(n, seed=DEFAULT_SEED, articles=None):
+    """Tarif fournisseur de `n` lignes (largeur fixe, latin1), avec ligne d'en-tête."""
+    r = random.Random(seed + 2)
+    articles = articles if articles is not None else supplier_articles(n, seed)
+    w = [b - a for a, b in TARIF_COLSPECS]
+    lines = ["EUR".ljust(w[0]) + "ARTICLE".ljust(w[1]) + "PRIX".ljust(w[2]) + "REM"]
+    for article in articles:
+        prix = f"{r.randint(1, 999999) / 100:.2f}".replace(".", ",")
+        fields = [
+            "EUR", article, prix, r.choice("ABC "), "20260101", r.choice(DESCRIPTIONS),
+            f"{r.randint(10**12, 10**13 - 1)}", f"{r.randint(1, 9999) / 100:.2f}".replace(".", ","),
+            "KUHN", "X", "1", "1", "N", "84339000",
+        ]
+        lines.append("".join(v.ljust(width)[:width] for v, width in zip(fields, w)))
+    return ("\n".join(lines) + "\n").encode("latin1")
+
+
+def stock_csv_bytes(articles, seed=DEFAULT_SEED, share=0.3):
+    """Stock (csv ';', latin1) contenant une part `share` des articles."""
+    r = random.Random(seed + 3)
+    refs = r.sample(articles, int(len(articles) * share))
+    stock = pd.DataFrame({
+        "Fournisseur":   ["408"] * len(refs),
+        "Référence Frn": refs,
+        "Qté":           [r.randint(0, 50) for _ in refs],
+    })
+    return stock.to_csv(sep=";", index=False).encode("latin1")
+
+
+def infos_xlsx_bytes():
+    """Fichier infos (xlsx donnee / valeur) avec identifiant et remises A / B / C."""
+    infos = pd.DataFrame({
+        "donnee": ["nomfact", "adr1fact", "paysfact", "villefact", "cpfact", "code_client",
+                   "nomadrlivr", "adr1livr", "payslivr", "villelivr", "cplivr", "emaillivr",
+                   "mtport", "identifiant", "remise : A", "remise : B", "remise : C"],
+        "valeur": ["Agrizone & Cie", "1 rue de la Gare", "FR", "Lyon", "69000", "C001",
+                   "Dépôt central", "ZI Nord", "FR", "Lyon", "69001", "depot@example.com",
+                   "0", "KUH", "0.3", "0.25", "0.1"],
+    })
+    bio = io.BytesIO()
+    infos.to_excel(bio, index=False)
+    return bio.getvalue()
+
+
+def purchase_frame(fmt, n, articles, seed=DEFAULT_SEED, orders=1):
+    """
+    Lignes d'un purchase au format "A" ou "B" (colonnes de FORMAT_SPECS),
+    réparties sur `orders` n° de PO ; ~5 % de références hors tarif.
+    """
+    r = random.Random(seed + 4)
+    spec = FORMAT_SPECS[next(k for k in FORMAT_SPECS if k.startswith(f"Format {fmt}"))]
+    refs = [r.choice(articles) if r.random() > 0.05 else f"HT{r.randint(0, 99999)}" for _ in range(n)]
+    qte  = [r.randint(1, 20) for _ in range(n)]
+    data = {
+        spec["purchase_order"]: [str(4500000000 + i * orders // max(n, 1)) for i in range(n)],
+        spec["vendor_ref"]:     refs,
+        spec["description"]:    [r.choice(DESCRIPTIONS) for _ in range(n)],
+        spec["quantite"]:       qte,
+        spec["valeur_ligne"]:   [round(q * r.randint(100, 99999) / 100, 2) for q in qte],
+        spec["discount1"]:      [-r.choice([0, 10, 25, 35]) for _ in range(n)],
+    }
+    if spec["prix_unitaire"]:
+        data[spec["prix_unitaire"]] = [r.randint(100, 99999) / 100 for _ in range(n)]
+    return pd.DataFrame(data)
+
+
+def purchase_xlsx_bytes(fmt, n, articles, seed=DEFAULT_SEED, orders=1):
+    """
+    Classeur purchase (bytes). Format A : bandeau de titre puis en-tête en
+    ligne 4 ; Format B : en-tête en ligne 1 et ligne de total en fin de tableau.
+    """
+    df = purchase_frame(fmt, n, articles, seed, orders)
+    bio = io.BytesIO()
+    with pd.ExcelWriter(bio, engine="openpyxl") as writer:
+        if fmt == "A":
+            pd.DataFrame([["Rapport achats"], [""], [""]]).to_excel(writer, index=False, header=False)
+            df.to_excel(writer, index=False, startrow=3)
+        else:
+            total = pd.DataFrame([{df.columns[2]: "Total"}], columns=df.columns)
+            pd.concat([df, total], ignore_index=True).to_excel(writer, index=False)
+    return bio.getvalue()
+
+
+# ==================== JEU COMPLET ====================
+def dataset(lines, purchase_lines, seed=DEFAULT_SEED, orders=1):
+    """
+    Jeu complet en mémoire : {nom de fichier: contenu (str ou bytes)}.
+    `lines` : lignes des tarifs ; `purchase_lines` : lignes des purchases.
+    Le tarif "case" partage la moitié de ses références avec le tarif "nh".
+    """
+    refs_nh   = cnh_refs(lines, seed)
+    refs_case = refs_nh[: lines // 2] + cnh_refs(lines - lines // 2, seed + 100)
+    articles  = supplier_articles(lines, seed)
+    return {
+        "tarif_nh.txt":     cnh_tarif_text(lines, seed, refs_nh),
+        "tarif_case.txt":   cnh_tarif_text(lines, seed + 1, refs_case),
+        "tarif.txt":        supplier_tarif_bytes(lines, seed, articles),
+        "stock.csv":        stock_csv_bytes(articles, seed),
+        "infos.xlsx":       infos_xlsx_bytes(),
+        "purchase_A.xlsx":  purchase_xlsx_bytes("A", purchase_lines, articles, seed, orders),
+        "purchase_B.xlsx":  purchase_xlsx_bytes("B", purchase_lines, articles, seed, orders),
+    }
+
+
+def write_dataset(out_dir, lines, purchase_lines, seed=DEFAULT_SEED, orders=1):
+    """Écrit le jeu complet dans `out_dir`. Retourne la liste des fichiers écrits."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    written = []
+    for name, content in dataset(lines, purchase_lines, seed, orders).items():
+        path = out_dir / name
+        if isinstance(content, str):
+            path.write_text(content, encoding="utf-8", newline="")
+        else:
+            path.write_bytes(content)
+        written.append(path)
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.datagen",
+                                     description="Génère un jeu de données synthétiques.")
+    parser.add_argument("--lines", type=int, default=100_000, help="lignes des tarifs (défaut : 100000)")
+    parser.add_argument("--purchase-lines", type=int, default=10_000,
+                        help="lignes des fichiers purchase (défaut : 10000)")
+    parser.add_argument("--orders", type=int, default=1, help="nb de n° de PO par purchase (défaut : 1)")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--out", required=True, help="dossier de sortie")
+    args = parser.parse_args(argv)
+
+    for path in write_dataset(args.out, args.lines, args.purchase_lines, args.seed, args.orders):
+        print(f"{path} ({path.stat().st_size / 1e6:.1f} Mo)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
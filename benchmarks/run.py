@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+Scénarios de benchmark chronométrés -> rapport JSON comparable entre commits.
+
+Chaque scénario est exécuté `--repeat` fois (temps min / médian), puis une
+fois de plus sous tracemalloc pour le pic mémoire (allocations Python et
+numpy/pandas). La préparation des entrées n'est pas chronométrée.
+
+Exemple :
+    python -m benchmarks.run --lines 100000 --out bench.json
+    python -m benchmarks.run --lines 100000 --compare bench.json
+"""
+
+import argparse
+import fnmatch
+import gc
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import tarif_core as tc
+import xml_core as xc
+from benchmarks import datagen
+
+REPORT_VERSION = 1
+
+
+# ==================== SCÉNARIOS ====================
+def read_tarif_fwf(raw):
+    """Lecture d'origine du tarif fournisseur (pd.read_fwf) : référence de read_tarif."""
+    tarif = pd.read_fwf(io.BytesIO(raw), colspecs=xc.TARIF_COLSPECS, names=xc.TARIF_COLUMNS, encoding="latin1")
+    tarif = tarif[tarif["Prix"].str.contains(r"^\d", na=False)].copy()
+    tarif["Prix"] = tarif["Prix"].str.replace(",", ".").astype(float)
+    return tarif
+
+
+def build_scenarios(data, index_dir):
+    """
+    Jeu de données (datagen.dataset) -> liste de (nom, nb de lignes, fonction).
+    Les entrées des scénarios (tarifs découpés, purchase normalisé…) sont
+    préparées ici, une fois, hors chronométrage. `index_dir` : dossier des
+    index tarif sur disque (jamais TARIF_INDEX_DIR, partagé avec l'application).
+    """
+    nh_text, case_text = data["tarif_nh.txt"], data["tarif_case.txt"]
+    df_nh   = tc.parse_tarif_txt(nh_text, engine="columnar")
+    df_case = tc.parse_tarif_txt(case_text, engine="columnar")
+    nh_refs = tc.tarif_refs(nh_text)
+    nh_raw  = nh_text.encode("utf-8")
+    df_xlsx = df_nh.head(tc.XLSX_MAX_ROWS - 1)
+
+    config      = xc.compile_infos(xc.read_infos(io.BytesIO(data["infos.xlsx"])))
+    stock       = xc.load_stock_index(io.BytesIO(data["stock.csv"]))
+    tarif_index = xc.build_tarif_index(xc.read_tarif(data["tarif.txt"]), config.remises)
+    store       = xc.tarif_store(data["tarif.txt"], config.remises, index_dir)
+
+    raw_purchase, fmt = xc.load_purchase_autodetect(io.BytesIO(data["purchase_B.xlsx"]))
+    spec     = xc.FORMAT_SPECS[fmt]
+    purchase = xc.normalize_purchase(raw_purchase, spec)
+    agence_00, agence_A1 = xc.split_agences(purchase, stock)
+
+    def load(name):
+        return lambda: xc.load_purchase_autodetect(io.BytesIO(data[name]))
+
+    return [
+        # ---------- Tarifs CNH ----------
+        ("parse_tarif_txt[python]",   len(df_nh), lambda: tc.parse_tarif_txt(nh_text, engine="python")),
+        ("parse_tarif_txt[columnar]", len(df_nh), lambda: tc.parse_tarif_txt(nh_text, engine="columnar")),
+        ("tarif_refs",                len(df_nh), lambda: tc.tarif_refs(nh_text)),
+        ("tarif_refs[bytes]",         len(df_nh), lambda: tc.tarif_refs(nh_raw)),
+        ("apply_case_prefix",         len(df_case), lambda: tc.apply_case_prefix(df_case, nh_refs)),
+        ("to_xlsx_bytes",             len(df_xlsx), lambda: tc.to_xlsx_bytes(df_xlsx)),
+        ("to_csv_bytes",              len(df_nh), lambda: tc.to_csv_bytes(df_nh)),
+        ("to_csv_bytes[python]",      len(df_nh), lambda: tc.to_csv_bytes(df_nh, engine="python")),
+        ("to_csv_bytes[pandas]",      len(df_nh), lambda: tc.to_csv_bytes(df_nh, engine="pandas")),
+    ] + ([
+        ("to_parquet_bytes",          len(df_nh), lambda: tc.to_parquet_bytes(df_nh)),
+        ("to_feather_bytes",          len(df_nh), lambda: tc.to_feather_bytes(df_nh)),
+    ] if tc.columnar_available() else []) + [
+        # ---------- XML de commande ----------
+        ("read_tarif",                len(tarif_index), lambda: xc.read_tarif(data["tarif.txt"])),
+        ("read_tarif[read_fwf]",      len(tarif_index), lambda: read_tarif_fwf(data["tarif.txt"])),
+        ("build_tarif_index",         len(tarif_index),
+         lambda: xc.build_tarif_index(xc.read_tarif(data["tarif.txt"]), config.remises)),
+        ("tarif_store[open]",         len(tarif_index), lambda: xc.tarif_store(data["tarif.txt"], config.remises, index_dir)),
+        ("prix_achat[dict]",          len(purchase), lambda: xc.prix_achat(tarif_index, purchase["_vendor_ref"])),
+        ("prix_achat[store]",         len(purchase), lambda: xc.prix_achat(store, purchase["_vendor_ref"])),
+        ("load_purchase_autodetect[A]", len(purchase), load("purchase_A.xlsx")),
+        ("load_purchase_autodetect[B]", len(purchase), load("purchase_B.xlsx")),
+        ("normalize_purchase",        len(purchase), lambda: xc.normalize_purchase(raw_purchase, spec)),
+        ("create_xml[00]",            len(agence_00),
+         lambda: xc.create_xml(agence_00, "00", xc.AGENCE_SUFFIXES["00"], config, tarif_index)),
+        ("create_xml[A1]",            len(agence_A1),
+         lambda: xc.create_xml(agence_A1, "A1", xc.AGENCE_SUFFIXES["A1"], config, tarif_index)),
+    ]
+
+
+# ==================== MESURE ====================
+def measure(fn, repeat=3, memory=True):
+    """Temps de `repeat` exécutions (s) et pic mémoire d'une exécution (Mo, None si désactivé)."""
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+
+    peak_mb = None
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            fn()
+            peak_mb = tracemalloc.get_traced_memory()[1] / 2**20
+        finally:
+            tracemalloc.stop()
+    return times, peak_mb
+
+
+def _git_revision():
+    """Commit courant (+ indicateur de modifications locales), None hors dépôt git."""
+    root = Path(__file__).resolve().parent.parent
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=root,
+                             capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=root,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return rev + ("-dirty" if dirty else "")
+
+
+def run(lines, purchase_lines, seed=datagen.DEFAULT_SEED, repeat=3, memory=True, only=None, log=print):
+    """Génère le jeu de données, exécute les scénarios et retourne le rapport (dict)."""
+    start = time.perf_counter()
+    data = datagen.dataset(lines, purchase_lines, seed)
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="bench_tarif_index") as index_dir:
+        scenarios = build_scenarios(data, index_dir)
+        log(f"Données générées et préparées en {time.perf_counter() - start:.1f} s")
+
+        for name, rows, fn in scenarios:
+            if only and not any(fnmatch.fnmatch(name, pattern) for pattern in only):
+                continue
+            times, peak_mb = measure(fn, repeat, memory)
+            results[name] = {
+                "rows":     rows,
+                "times_s":  [round(t, 6) for t in times],
+                "min_s":    round(min(times), 6),
+                "median_s": round(statistics.median(times), 6),
+                "peak_mb":  round(peak_mb, 2) if peak_mb is not None else None,
+            }
+            mem = f"{peak_mb:8.1f} Mo" if peak_mb is not None else ""
+            log(f"{name:32s} {rows:>9d} lignes  {min(times):8.3f} s {mem}")
+
+    return {
+        "version": REPORT_VERSION,
+        "meta": {
+            "git":       _git_revision(),
+            "date":      datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python":    platform.python_version(),
+            "pandas":    pd.__version__,
+            "numpy":     np.__version__,
+            "platform":  platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "params": {"lines": lines, "purchase_lines": purchase_lines, "seed": seed, "repeat": repeat},
+        "scenarios": results,
+    }
+
+
+def compare(report, baseline, log=print):
+    """Affiche, par scénario commun, le rapport des temps min (nouveau / référence)."""
+    if report["params"] != baseline["params"]:
+        log(f"⚠ paramètres différents : {baseline['params']} -> {report['params']}")
+    log(f"{'scénario':32s} {'référence':>10s} {'actuel':>10s} {'ratio':>7s}")
+    for name, res in report["scenarios"].items():
+        ref = baseline["scenarios"].get(name)
+        if ref:
+            ratio = res["min_s"] / ref["min_s"] if ref["min_s"] else float("nan")
+            log(f"{name:32s} {ref['min_s']:10.3f} {res['min_s']:10.3f} {ratio:7.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run",
+                                     description="Benchmarks des tarifs CNH et de la génération XML.")
+    parser.add_argument("--lines", type=int, default=100_000,
+                        help="lignes des tarifs générés (défaut : 100000 ; ex. 10000 à 2000000)")
+    parser.add_argument("--purchase-lines", type=int, default=10_000,
+                        help="lignes des fichiers purchase générés (défaut : 10000)")
+    parser.add_argument("--seed", type=int, default=datagen.DEFAULT_SEED)
+    parser.add_argument("--repeat", type=int, default=3, help="exécutions chronométrées par scénario")
+    parser.add_argument("--no-memory", action="store_true", help="ne pas mesurer le pic mémoire")
+    parser.add_argument("--only", action="append", metavar="MOTIF",
+                        help="scénarios à exécuter (motif glob, répétable), ex: 'parse_tarif_txt*'")
+    parser.add_argument("--out", help="fichier JSON du rapport")
+    parser.add_argument("--compare", help="rapport JSON de référence à comparer")
+    args = parser.parse_args(argv)
+
+    report = run(args.lines, args.purchase_lines, args.seed, args.repeat,
+                 memory=not args.no_memory, only=args.only)
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"Rapport écrit dans {args.out}")
+    if args.compare:
+        compare(report, json.loads(Path(args.compare).read_text(encoding="utf-8")))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,16 +7,18 @@ Détection automatique du format purchase.
 Si non reconnu → interface de mapping manuel visible dans Streamlit.
 """
 
-import pandas as pd
-import xml.etree.ElementTree as ET
 import streamlit as st
-from io import BytesIO
-import re
-import json
-import base64
+from contextlib import nullcontext
 from pathlib import Path
 
-from theme import apply_theme, page_header
+import perf
+from theme import PERF_LOG, apply_theme, page_header, perf_expander, perf_options
+from mapping_store import DEFAULT_NAME, DEFAULT_SUPPLIER, open_store
+from xml_core import (
+    FORMAT_SPECS, load_purchase_autodetect, normalize_purchase,
+    cached_infos, cached_stock_index, cached_tarif_store,
+    split_agences, generate_order_xmls, generate_split_xmls, zip_xmls,
+)
 
 # set_page_config doit être la 1re commande Streamlit exécutée
 st.set_page_config(page_title="Générateur XML — Agrizone", page_icon="🧾", layout="wide")
@@ -32,6 +34,8 @@ apply_theme()
 #   branch = "main"                        # branche cible (optionnel, défaut: main)
 #
 # En local sans secrets → fallback sur fichier JSON local.
+# Le fichier contient plusieurs mappings nommés par fournisseur (identifiant
+# du fichier infos) ; l'ancien format à un seul mapping reste lisible.
 
 MAPPING_FILE_LOCAL = Path(__file__).parent / "mapping_saved.json"
 
@@ -45,132 +49,17 @@ def _github_cfg():
         pass
     return None
 
-def _github_headers(cfg):
-    return {
-        "Authorization": f"token {cfg['token']}",
-        "Accept": "application/vnd.github+json",
-    }
-
-def _github_api_url(cfg):
-    branch = cfg.get("branch", "main")
-    return (
-        f"https://api.github.com/repos/{cfg['repo']}/contents/{cfg['path']}",
-        branch,
-    )
-
-def load_mapping_from_disk():
-    """
-    Charge le mapping :
-    1. Depuis GitHub si secrets configurés
-    2. Sinon depuis le fichier JSON local (dev)
-    """
-    import requests
-
-    cfg = _github_cfg()
-    if cfg:
-        url, branch = _github_api_url(cfg)
-        try:
-            r = requests.get(url, headers=_github_headers(cfg),
-                             params={"ref": branch}, timeout=10)
-            if r.status_code == 200:
-                content = r.json().get("content", "")
-                return json.loads(base64.b64decode(content).decode("utf-8"))
-        except Exception:
-            pass
-        return None
-
-    # Fallback local
-    try:
-        if MAPPING_FILE_LOCAL.exists():
-            return json.loads(MAPPING_FILE_LOCAL.read_text(encoding="utf-8"))
-    except Exception:
-        pass
-    return None
-
-def save_mapping_to_disk(mapping: dict):
+@st.cache_resource
+def get_mapping_store():
     """
-    Sauvegarde le mapping :
-    1. Via GitHub API (commit) si secrets configurés
-    2. Sinon dans le fichier JSON local (dev)
+    Store des mappings partagé par toutes les sessions (voir mapping_store.py) :
+    le fichier GitHub est gardé en cache et écrit en arrière-plan.
     """
-    import requests
-
-    cfg = _github_cfg()
-    if cfg:
-        url, branch = _github_api_url(cfg)
-        headers = _github_headers(cfg)
-        content_b64 = base64.b64encode(
-            json.dumps(mapping, ensure_ascii=False, indent=2).encode("utf-8")
-        ).decode("utf-8")
-
-        # Récupérer le SHA du fichier existant (requis pour mettre à jour)
-        sha = None
-        try:
-            r = requests.get(url, headers=headers,
-                             params={"ref": branch}, timeout=10)
-            if r.status_code == 200:
-                sha = r.json().get("sha")
-        except Exception:
-            pass
-
-        payload = {
-            "message": "chore: mise à jour mapping colonnes purchase",
-            "content": content_b64,
-            "branch":  branch,
-        }
-        if sha:
-            payload["sha"] = sha
-
-        try:
-            r = requests.put(url, headers=headers,
-                             json=payload, timeout=15)
-            if r.status_code in (200, 201):
-                return True
-            st.error(f"GitHub API erreur {r.status_code} : {r.json().get('message', r.text)}")
-        except Exception as e:
-            st.error(f"Impossible de contacter GitHub : {e}")
-        return False
-
-    # Fallback local
-    try:
-        MAPPING_FILE_LOCAL.write_text(
-            json.dumps(mapping, ensure_ascii=False, indent=2), encoding="utf-8"
-        )
-        return True
-    except Exception as e:
-        st.error(f"Impossible d'écrire le fichier de mapping : {e}")
-        return False
-
-
-# ==================== MAPPING DES FORMATS CONNUS ====================
-# Chaque format mappe les colonnes du fichier fournisseur vers les champs internes.
-# "prix_unitaire": None → calculé depuis valeur_ligne / quantite
-FORMAT_SPECS = {
-    "Format A – Ancien (Qty Pu / Pu Value)": {
-        "purchase_order": "Purchase Order",
-        "vendor_ref":     "Vendor Product Number",
-        "description":    "Product Description",
-        "quantite":       "Qty Pu",
-        "valeur_ligne":   "Pu Value",
-        "prix_unitaire":  None,
-        "discount1":      "Disc1",   # colonne la plus courante dans le Format A — mappable manuellement
-    },
-    "Format B – Nouveau (Purchase Row Quantity)": {
-        "purchase_order": "Po Number",
-        "vendor_ref":     "Vendor Product Number",
-        "description":    "Product Description",
-        "quantite":       "Purchase Row Quantity",
-        "valeur_ligne":   "Purchase Row Value Euro",
-        "prix_unitaire":  "Gross Value Per Unit",
-        "discount1":      "Discount 1",
-    },
-}
+    return open_store(_github_cfg(), MAPPING_FILE_LOCAL)
 
-FORMAT_SIGNATURES = {
-    "Format A – Ancien (Qty Pu / Pu Value)":           ["Qty Pu", "Pu Value", "Purchase Order"],
-    "Format B – Nouveau (Purchase Row Quantity)": ["Purchase Row Quantity", "Gross Value Per Unit", "Po Number"],
-}
 
+# ==================== INTERFACE DE MAPPING ====================
+# Formats connus (FORMAT_SPECS / FORMAT_SIGNATURES) : voir xml_core.py
 # Labels affichés dans l'interface de mapping
 CHAMPS_INTERNES = {
     "purchase_order": "N° de commande (purchase_order)",
@@ -183,45 +72,6 @@ CHAMPS_INTERNES = {
 }
 
 
-# ==================== CHARGEMENT DU FICHIER PURCHASE ====================
-def try_load_excel(uploaded_file, header_row=0):
-    uploaded_file.seek(0)
-    df = pd.read_excel(uploaded_file, header=header_row)
-    df.columns = df.columns.astype(str).str.replace("\ufeff", "", regex=False).str.strip()
-    return df
-
-
-def load_purchase_autodetect(uploaded_file):
-    """
-    Tente de détecter le format automatiquement.
-    Retourne (df, nom_format) si trouvé, sinon (df_brut, None) pour mapping manuel.
-    """
-    # Tentative header ligne 1 (Format B)
-    df = try_load_excel(uploaded_file, header_row=0)
-    cols = set(df.columns)
-    for fmt_name, signature in FORMAT_SIGNATURES.items():
-        if all(c in cols for c in signature):
-            return df, fmt_name
-
-    # Tentative header dynamique (Format A)
-    uploaded_file.seek(0)
-    df_raw = pd.read_excel(uploaded_file, header=None)
-    for i in range(0, min(40, len(df_raw))):
-        for j in range(df_raw.shape[1]):
-            if str(df_raw.iloc[i, j]).strip() == "Vendor Product Number":
-                df = try_load_excel(uploaded_file, header_row=i)
-                cols = set(df.columns)
-                for fmt_name, signature in FORMAT_SIGNATURES.items():
-                    if all(c in cols for c in signature):
-                        return df, fmt_name
-                # Header trouvé mais format inconnu → mapping manuel
-                return df, None
-
-    # Aucune détection → retourner header ligne 1 pour mapping manuel
-    return try_load_excel(uploaded_file, header_row=0), None
-
-
-# ==================== INTERFACE DE MAPPING ====================
 def show_mapping_ui(df, spec_auto=None, expanded=False):
     """
     Affiche l'interface de mapping dans Streamlit.
@@ -266,174 +116,55 @@ def show_mapping_ui(df, spec_auto=None, expanded=False):
     return mapping if all_mapped else None
 
 
-# ==================== NORMALISATION ====================
-def normalize_purchase(df, spec):
-    df = df.copy()
-
-    # ── Filtrer les lignes sans référence fournisseur (ex : ligne de total) ──
-    vendor_col = spec["vendor_ref"]
-    df = df[df[vendor_col].notna() & (df[vendor_col].astype(str).str.strip() != "") & (df[vendor_col].astype(str).str.strip() != "nan")]
-
-    df["_purchase_order"] = df[spec["purchase_order"]].astype(str)
-    df["_vendor_ref"]     = df[spec["vendor_ref"]].astype(str).str.strip()
-    df["_description"]    = df[spec["description"]].astype(str)
-    df["_quantite"]       = pd.to_numeric(df[spec["quantite"]], errors="coerce").fillna(0)
-
-    if spec.get("prix_unitaire"):
-        df["_prix_unitaire"] = pd.to_numeric(df[spec["prix_unitaire"]], errors="coerce").fillna(0)
-    elif spec.get("valeur_ligne"):
-        valeur = pd.to_numeric(df[spec["valeur_ligne"]], errors="coerce").fillna(0)
-        df["_prix_unitaire"] = (valeur / df["_quantite"].replace(0, float("nan"))).fillna(0)
-    else:
-        df["_prix_unitaire"] = 0.0
-
-    # ── Remise ligne (Discount 1) : format -35 → taux 0.35 ──
-    if spec.get("discount1") and spec["discount1"] in df.columns:
-        raw_discount = pd.to_numeric(df[spec["discount1"]], errors="coerce").fillna(0)
-        # La valeur est négative (ex : -35), on prend la valeur absolue pour le taux
-        df["_discount1"] = raw_discount.abs() / 100
-    else:
-        df["_discount1"] = 0.0
-
-    # ── Prix de vente HT = prix unitaire * (1 - remise) arrondi à 2 décimales ──
-    df["_prixvente"] = (df["_prix_unitaire"] * (1 - df["_discount1"])).round(2)
+def saved_mapping_ui(store, supplier, df, spec_auto=None):
+    """
+    Mappings enregistrés du fournisseur : choix, édition (show_mapping_ui),
+    enregistrement sous un nom, suppression.
+    Les mappings communs (DEFAULT_SUPPLIER, dont l'ancien mapping_saved.json)
+    sont aussi proposés ; à nom égal, celui du fournisseur l'emporte.
+    Retourne le mapping à utiliser : le mapping enregistré choisi, sinon spec_auto.
+    """
+    own   = store.mappings(supplier)
+    saved = {**(store.mappings(DEFAULT_SUPPLIER) if supplier != DEFAULT_SUPPLIER else {}), **own}
+    names = sorted(saved, key=lambda n: (n != DEFAULT_NAME, n))
+    # Sélection par défaut : 1er mapping enregistré dont les colonnes existent dans le fichier
+    usable  = [n for n in names if all(not v or v in df.columns for v in saved[n].values())]
+    options = ["— aucun —"] + names
+    choice  = st.selectbox(f"Mapping enregistré — fournisseur {supplier}", options,
+                           index=options.index(usable[0]) if usable else 0, key="mapping_choice")
+    selected = saved.get(choice)
+
+    mapping_ui = show_mapping_ui(df, spec_auto=selected or spec_auto)
+    col_name, col_save, col_delete = st.columns([2, 1, 1])
+    with col_name:
+        name = st.text_input("Nom du mapping", value=choice if selected else DEFAULT_NAME,
+                             key=f"mapping_name_{choice}").strip()
+    with col_save:
+        if mapping_ui and name and st.button(f"💾 Enregistrer ({store.label})", key="btn_save_mapping"):
+            # GitHub : écriture en arrière-plan (le Future n'est pas attendu)
+            future = store.save(supplier, name, mapping_ui)
+            if future.done() and not future.result():
+                st.error(store.last_error)
+            else:
+                selected = mapping_ui
+                st.success(f"Mapping « {name} » enregistré ({store.label}) ✔")
+    with col_delete:
+        # Seuls les mappings propres au fournisseur sont supprimables ici
+        if choice in own and st.button("🗑️ Supprimer", key="btn_delete_mapping"):
+            store.delete(supplier, choice)
+            selected = None
+            st.info(f"Mapping « {choice} » supprimé.")
 
-    return df.reset_index(drop=True)
+    if store.last_error:
+        st.warning(f"⚠️ Synchronisation des mappings : {store.last_error}")
+    return selected or spec_auto
 
 
 # ==================== UTILITAIRES ====================
-def load_file(label, file_type, header=None):
+def upload_bytes(label, file_type):
+    """Contenu (bytes) du fichier chargé, ou None."""
     uploaded_file = st.file_uploader(label, type=file_type)
-    if uploaded_file is not None:
-        if file_type == "csv":
-            return pd.read_csv(uploaded_file, sep=';', dtype={'Fournisseur': str, 'Référence Frn': str}, encoding='latin1')
-        elif file_type == "xlsx":
-            return pd.read_excel(uploaded_file, header=header if header is not None else 0)
-        elif file_type == "txt":
-            colspecs = [(0,10),(10,20),(20,30),(30,36),(36,44),(44,69),(69,84),(84,94),
-                        (94,102),(102,105),(105,109),(109,115),(115,119),(119,134)]
-            columns  = ['Monnaie','Article','Prix','Remise','Date','Designation','Code EAN',
-                        'Poids','Societe','PDR','Qte','Cond','VoirLP','HS Code']
-            return pd.read_fwf(uploaded_file, colspecs=colspecs, names=columns, encoding='latin1')
-    return None
-
-
-def get_info(key, default=""):
-    value = infos.loc[infos['donnee'] == key, 'valeur']
-    return value.values[0] if not value.empty else default
-
-
-def indent_xml(elem, level=0):
-    i = "\n" + level * "  "
-    if len(elem):
-        if not elem.text or not elem.text.strip():
-            elem.text = i + "  "
-        if not elem.tail or not elem.tail.strip():
-            elem.tail = i
-        for child in elem:
-            indent_xml(child, level + 1)
-        if not elem.tail or not elem.tail.strip():
-            elem.tail = i
-    else:
-        if level and (not elem.tail or not elem.tail.strip()):
-            elem.tail = i
-
-
-# ==================== CRÉATION XML ====================
-def create_ligne_xml(parent, index, row):
-    ligne = ET.SubElement(parent, "ligne")
-    ET.SubElement(ligne, "NumLigtransaction").text = f"{index:05d}"
-    ET.SubElement(ligne, "refagrizone").text       = f"{identifiant} {row['_vendor_ref']}"
-    ET.SubElement(ligne, "reffour").text           = row['_vendor_ref']
-    ET.SubElement(ligne, "libelle").text           = row['_description']
-    ET.SubElement(ligne, "qte").text               = f"{row['_quantite']:.2f}"
-
-    tarif_row = tarif[tarif['Article'] == row['_vendor_ref']]
-    if not tarif_row.empty:
-        prix          = float(tarif_row['Prix'].values[0])
-        remise_lettre = tarif_row['Remise'].values[0]
-        remise_taux   = remise_mapping.get(remise_lettre, 0)
-        prixachat     = round(prix * (1 - remise_taux), 2)
-    else:
-        prixachat = 0.00
-
-    ET.SubElement(ligne, "prixachat").text    = f"{prixachat:.2f}"
-    # Prix de vente HT = Gross Value Per Unit * ((100 - abs(Discount 1)) / 100)
-    ET.SubElement(ligne, "prixventeHT").text  = f"{row['_prixvente']:.2f}"
-    ET.SubElement(ligne, "prixventeTTC").text = "0.00"
-    if agence == "00":
-        ET.SubElement(ligne, "codefour").text = "408"
-    ET.SubElement(ligne, "departlivr").text = ""
-
-
-def create_xml(data, agence_code, suffix):
-    global agence
-    agence         = agence_code
-    transaction    = ET.Element("transaction")
-    entete         = ET.SubElement(transaction, "entetetransaction")
-    numtransaction = f"{data.iloc[0]['_purchase_order']}{suffix}" if not data.empty else ""
-
-    ET.SubElement(entete, "numtransaction").text  = numtransaction
-    ET.SubElement(entete, "passtransaction").text = numtransaction
-    ET.SubElement(entete, "agence").text          = agence
-    if agence == "00":
-        ET.SubElement(entete, "code_edo").text    = ""
-        ET.SubElement(entete, "nivcommande").text = "0"
-
-    adrfact = ET.SubElement(entete, "adrfact")
-    ET.SubElement(adrfact, "emailfact").text = "vendor.invoices@kramp.com" if agence == "00" else ""
-    ET.SubElement(adrfact, "nomfact").text   = get_info('nomfact', 'Nom Facturation Inconnu')
-    ET.SubElement(adrfact, "adr1fact").text  = get_info('adr1fact', '')
-    if agence == "00":
-        for tag in ["adr2fact","adr3fact","telephonefact","numtva","numsiret"]:
-            ET.SubElement(adrfact, tag).text = ""
-    ET.SubElement(adrfact, "paysfact").text    = get_info('paysfact', '')
-    ET.SubElement(adrfact, "villefact").text   = get_info('villefact', '')
-    ET.SubElement(adrfact, "cpfact").text      = get_info('cpfact', '')
-    ET.SubElement(adrfact, "code_client").text = get_info('code_client', '')
-
-    adrlivr = ET.SubElement(entete, "adrlivr")
-    if agence == "00":
-        ET.SubElement(adrlivr, "typadrlivr").text      = "CL"
-        ET.SubElement(adrlivr, "nominterloclivr").text = get_info('nomadrlivr', '')
-    ET.SubElement(adrlivr, "emaillivr").text  = "vendor.invoices@kramp.com" if agence == "00" else get_info('emaillivr', '')
-    ET.SubElement(adrlivr, "nomadrlivr").text = get_info('nomadrlivr', '')
-    ET.SubElement(adrlivr, "adr1livr").text   = get_info('adr1livr', '')
-    ET.SubElement(adrlivr, "adr2livr").text   = get_info('adr2livr', '')
-    if agence == "00":
-        ET.SubElement(adrlivr, "adr3livr").text      = ""
-        ET.SubElement(adrlivr, "telephonelivr").text = ""
-    ET.SubElement(adrlivr, "payslivr").text = get_info('payslivr', '')
-    ET.SubElement(adrlivr, "villelivr").text = get_info('villelivr', '')
-    ET.SubElement(adrlivr, "cplivr").text    = get_info('cplivr', '')
-
-    if agence == "00":
-        livr = ET.SubElement(entete, "livr")
-        for tag in ["trans","mode","idrelai","departlivr","delailivr","infolivr"]:
-            ET.SubElement(livr, tag).text = ""
-        ET.SubElement(entete, "tauxwtva").text = "20"
-
-    lignes = ET.SubElement(transaction, "lignes")
-    for index, row in data.iterrows():
-        create_ligne_xml(lignes, index + 1, row)
-
-    pied = ET.SubElement(transaction, "pied")
-    ET.SubElement(pied, "modepaiement").text = "TRANSFER"
-    for tag in ["mtport","mtht","remise","mttva","mtttc"]:
-        ET.SubElement(pied, tag).text = get_info(tag, "")
-    if agence == "00":
-        for tag in ["numtvacee","domiciliation","rib","iban","bic"]:
-            ET.SubElement(pied, tag).text = ""
-
-    indent_xml(transaction)
-    encoding        = "utf-8" if agence == "00" else "ISO-8859-1"
-    tree            = ET.ElementTree(transaction)
-    xml_body        = BytesIO()
-    tree.write(xml_body, encoding=encoding, xml_declaration=False)
-    xml_declaration = f'<?xml version="1.0" encoding="{encoding.upper()}"?>\n'.encode(encoding)
-    xml_string      = xml_body.getvalue().decode(encoding)
-    xml_string      = re.sub(r"<(\w+)(\s*)/>", r"<\1></\1>", xml_string)
-    return xml_declaration + xml_string.encode(encoding), numtransaction
+    return uploaded_file.getvalue() if uploaded_file is not None else None
 
 
 # ==================== INTERFACE STREAMLIT ====================
@@ -442,36 +173,26 @@ page_header(
     "Commandes fournisseur — détection automatique du format & mapping des colonnes",
     "🧾",
 )
+perf_enabled, perf_memory = perf_options()
 
 # --- Fichier infos ---
-infos = load_file("Charger le fichier infos (XLSX)", "xlsx", header=0)
-if infos is not None:
-    if 'donnee' not in infos.columns or 'valeur' not in infos.columns:
-        st.error("Les colonnes 'donnee' et 'valeur' sont absentes du fichier infos.")
-        infos = None
+# Fichiers de référence : préparés une fois par contenu (cache partagé entre
+# les reruns et les sessions), seules les structures de recherche sont gardées.
+infos = None
+infos_raw = upload_bytes("Charger le fichier infos (XLSX)", "xlsx")
+if infos_raw is not None:
+    try:
+        infos = cached_infos(infos_raw)
+    except ValueError as e:
+        st.error(str(e))
 
 # --- Fichier purchase ---
 uploaded_purchase = st.file_uploader("Charger le fichier purchase (XLSX)", type="xlsx")
 purchase = None
 
-# Charger le mapping persisté dans session_state au premier run
-if "saved_mapping" not in st.session_state:
-    disk_mapping = load_mapping_from_disk()
-    if disk_mapping:
-        st.session_state["saved_mapping"] = disk_mapping
-
-# Label du bouton selon le backend disponible
-_use_github   = bool(_github_cfg())
-_save_label   = "💾 Enregistrer (GitHub)" if _use_github else "💾 Enregistrer (local)"
-_save_caption = "GitHub" if _use_github else "fichier local `mapping_saved.json`"
-
-def _do_reset():
-    st.session_state.pop("saved_mapping", None)
-    if not _use_github:
-        if MAPPING_FILE_LOCAL.exists():
-            MAPPING_FILE_LOCAL.unlink()
-    # Pour GitHub : on pourrait supprimer le fichier via API,
-    # mais laisser un fichier vide est suffisant — on efface juste la session.
+# Mappings enregistrés : rangés sous l'identifiant fournisseur du fichier infos
+store    = get_mapping_store()
+supplier = str(infos.identifiant) if infos is not None else DEFAULT_SUPPLIER
 
 if uploaded_purchase is not None:
     purchase_raw, fmt_detecte = load_purchase_autodetect(uploaded_purchase)
@@ -481,40 +202,14 @@ if uploaded_purchase is not None:
         spec_auto = FORMAT_SPECS[fmt_detecte]
 
         with st.expander("🔍 Voir / modifier le mapping détecté", expanded=False):
-            st.caption(f"Modifiez le mapping si nécessaire, puis cliquez sur **{_save_label}** — sauvegardé dans {_save_caption}.")
-            prefill    = st.session_state.get("saved_mapping", spec_auto)
-            mapping_ui = show_mapping_ui(purchase_raw, spec_auto=prefill)
-            col_save, col_reset = st.columns([1, 1])
-            with col_save:
-                if mapping_ui and st.button(_save_label, key="btn_save_mapping"):
-                    if save_mapping_to_disk(mapping_ui):
-                        st.session_state["saved_mapping"] = mapping_ui
-                        st.success(f"Mapping enregistré dans {_save_caption} ✔")
-            with col_reset:
-                if st.button("🗑️ Réinitialiser", key="btn_reset_mapping"):
-                    _do_reset()
-                    st.info("Mapping réinitialisé.")
-
-        mapping = st.session_state.get("saved_mapping", spec_auto)
+            st.caption(f"Modifiez le mapping si nécessaire, puis enregistrez-le sous un nom — sauvegardé dans {store.label}.")
+            mapping = saved_mapping_ui(store, supplier, purchase_raw, spec_auto)
 
     else:
         st.warning("⚠️ Format non reconnu. Veuillez mapper les colonnes manuellement.")
         st.markdown("### 🔧 Mapping des colonnes")
-        st.caption(f"Associez chaque champ, puis cliquez sur **{_save_label}** — sauvegardé dans {_save_caption}.")
-        prefill    = st.session_state.get("saved_mapping", None)
-        mapping_ui = show_mapping_ui(purchase_raw, spec_auto=prefill)
-        col_save, col_reset = st.columns([1, 1])
-        with col_save:
-            if mapping_ui and st.button(_save_label, key="btn_save_mapping"):
-                if save_mapping_to_disk(mapping_ui):
-                    st.session_state["saved_mapping"] = mapping_ui
-                    st.success(f"Mapping enregistré dans {_save_caption} ✔")
-        with col_reset:
-            if st.button("🗑️ Réinitialiser", key="btn_reset_mapping"):
-                _do_reset()
-                st.info("Mapping réinitialisé.")
-
-        mapping = st.session_state.get("saved_mapping")
+        st.caption(f"Associez chaque champ, puis enregistrez le mapping sous un nom — sauvegardé dans {store.label}.")
+        mapping = saved_mapping_ui(store, supplier, purchase_raw)
 
     if mapping:
         missing = [v for v in mapping.values() if v and v not in purchase_raw.columns]
@@ -529,37 +224,53 @@ if uploaded_purchase is not None:
             )
 
 # --- Autres fichiers ---
-stock = load_file("Charger le fichier stock (CSV)", "csv")
-tarif = load_file("Charger le fichier tarif (TXT)", "txt")
+stock_raw = upload_bytes("Charger le fichier stock (CSV)", "csv")
+tarif_raw = upload_bytes("Charger le fichier tarif (TXT)", "txt")
 
 # --- Génération ---
-if infos is not None and purchase is not None and stock is not None and tarif is not None:
+if infos is not None and purchase is not None and stock_raw is not None and tarif_raw is not None:
     st.success("Tous les fichiers sont chargés.")
 
-    if 'Prix' in tarif.columns:
-        tarif = tarif[tarif['Prix'].str.contains(r'^\d', na=False)]
-        tarif['Prix'] = tarif['Prix'].str.replace(',', '.').astype(float)
-    else:
-        st.error("La colonne 'Prix' est absente du fichier tarif.txt.")
-        st.stop()
-
-    remise_mapping = {
-        row['donnee'].split(': ')[1].strip(): float(row['valeur'])
-        for _, row in infos[infos['donnee'].str.contains('remise :', na=False)].iterrows()
-    }
-    identifiant = infos.loc[infos['donnee'] == 'identifiant', 'valeur'].values[0] \
-        if 'identifiant' in infos['donnee'].values else 'INCONNU'
-
-    agence_00 = purchase[purchase['_vendor_ref'].isin(stock['Référence Frn'])]
-    agence_A1 = purchase[~purchase['_vendor_ref'].isin(stock['Référence Frn'])]
+    stock       = cached_stock_index(stock_raw)
+    tarif_index = cached_tarif_store(tarif_raw, infos.remises)
+
+    agence_00, agence_A1 = split_agences(purchase, stock)
     st.info(f"🏭 Agence 00 : {len(agence_00)} lignes | Agence A1 : {len(agence_A1)} lignes")
 
+    # Export consolidé (plusieurs n° de PO) : une commande par PO × agence, en ZIP
+    n_orders = purchase["_purchase_order"].nunique()
+    split    = n_orders > 1 and st.checkbox(
+        f"Une commande par n° de PO ({n_orders} PO) — archive ZIP", value=True)
+
     if st.button("Générer les fichiers XML"):
-        xml_00, num_00 = create_xml(agence_00, "00", "KUH1")
-        xml_A1, num_A1 = create_xml(agence_A1, "A1", "KUH2")
-        st.session_state.update({"xml_00": xml_00, "num_00": num_00, "xml_A1": xml_A1, "num_A1": num_A1})
+        for key in ("xml_00", "num_00", "xml_A1", "num_A1", "xml_zip", "zip_count", "xml_perf"):
+            st.session_state.pop(key, None)
+        recording = (
+            perf.recording("Génération XML", memory=perf_memory, log_path=PERF_LOG)
+            if perf_enabled else nullcontext()
+        )
+        with recording as rec:
+            if split:
+                files = generate_split_xmls(purchase, stock, infos, tarif_index)
+                st.session_state.update({"xml_zip": zip_xmls(files), "zip_count": len(files)})
+            else:
+                xmls = generate_order_xmls(purchase, stock, infos, tarif_index)
+                (xml_00, num_00), (xml_A1, num_A1) = xmls["00"], xmls["A1"]
+                st.session_state.update({"xml_00": xml_00, "num_00": num_00, "xml_A1": xml_A1, "num_A1": num_A1})
+        if rec:
+            st.session_state["xml_perf"] = rec.report()
         st.success("Fichiers XML générés avec succès.")
 
+    if "xml_perf" in st.session_state:
+        perf_expander(st.session_state["xml_perf"], "generation_xml_performance.json")
+
+    if "xml_zip" in st.session_state:
+        st.header("Téléchargement")
+        st.download_button(f"⬇️ Télécharger les {st.session_state['zip_count']} XML (ZIP)",
+            data=st.session_state["xml_zip"],
+            file_name="IN_TRANS.zip",
+            mime="application/zip")
+
     if "xml_00" in st.session_state:
         st.header("Téléchargement")
         st.download_button("⬇️ Télécharger agence_00.xml",
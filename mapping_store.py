@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+"""
+Persistance des mappings de colonnes purchase (sans Streamlit).
+
+Plusieurs mappings nommés par fournisseur, dans un seul document JSON :
+    {"version": 2, "fournisseurs": {"<identifiant>": {"<nom>": {mapping}}}}
+L'ancien format (un seul mapping à plat, mapping_saved.json) est lu comme le
+mapping DEFAULT_NAME du fournisseur DEFAULT_SUPPLIER.
+
+Deux backends, même interface (mappings / get / save / delete) :
+  - LocalMappingStore  : fichier JSON local (développement), écriture immédiate
+  - GitHubMappingStore : fichier d'un repo GitHub (API contents). Le document
+    est gardé en mémoire et relu en arrière-plan au-delà de `ttl` secondes
+    (requête conditionnelle If-None-Match / ETag) ; les écritures sont
+    appliquées tout de suite au cache puis envoyées par un thread dédié, avec
+    nouvelles tentatives. Seul le tout premier chargement est bloquant.
+"""
+
+import base64
+import copy
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+
+DOC_VERSION      = 2
+DEFAULT_SUPPLIER = "défaut"
+DEFAULT_NAME     = "défaut"
+COMMIT_MESSAGE   = "chore: mise à jour mapping colonnes purchase"
+
+
+# ==================== DOCUMENT ====================
+def empty_document():
+    return {"version": DOC_VERSION, "fournisseurs": {}}
+
+
+def parse_document(data):
+    """Contenu JSON décodé -> document v2 (l'ancien mapping à plat est converti)."""
+    if not isinstance(data, dict) or not data:
+        return empty_document()
+    if "fournisseurs" in data:
+        return {"version": DOC_VERSION, "fournisseurs": dict(data["fournisseurs"] or {})}
+    return {"version": DOC_VERSION, "fournisseurs": {DEFAULT_SUPPLIER: {DEFAULT_NAME: data}}}
+
+
+def dump_document(doc):
+    return json.dumps(doc, ensure_ascii=False, indent=2)
+
+
+def _set_mapping(supplier, name, mapping):
+    def mutation(doc):
+        doc["fournisseurs"].setdefault(supplier, {})[name] = dict(mapping)
+    return mutation
+
+
+def _delete_mapping(supplier, name):
+    def mutation(doc):
+        named = doc["fournisseurs"].get(supplier, {})
+        named.pop(name, None)
+        if not named:
+            doc["fournisseurs"].pop(supplier, None)
+    return mutation
+
+
+def _done(result):
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+# ==================== INTERFACE COMMUNE ====================
+class _MappingStore:
+    """
+    Lecture commune ; les backends fournissent _document(), _apply(mutation)
+    et le verrou _lock qui protège le document en cache.
+    Le fournisseur est toujours une clé texte (clé JSON) : un identifiant
+    numérique lu dans le fichier infos (408) désigne le même fournisseur que "408".
+    """
+    label = ""
+    last_error = None
+
+    def mappings(self, supplier):
+        """{nom: mapping} du fournisseur (copie)."""
+        doc = self._document()
+        # Copie sous verrou : le thread d'écriture / de relecture modifie le même dict
+        with self._lock:
+            return copy.deepcopy(doc["fournisseurs"].get(str(supplier), {}))
+
+    def get(self, supplier, name=DEFAULT_NAME):
+        return self.mappings(supplier).get(name)
+
+    def save(self, supplier, name, mapping):
+        """Enregistre un mapping nommé. Retourne un Future (True si écrit)."""
+        return self._apply(_set_mapping(str(supplier), name, mapping))
+
+    def delete(self, supplier, name):
+        """Supprime un mapping nommé. Retourne un Future (True si écrit)."""
+        return self._apply(_delete_mapping(str(supplier), name))
+
+
+# ==================== BACKEND LOCAL ====================
+class LocalMappingStore(_MappingStore):
+    """Fichier JSON local, relu seulement si sa date de modification change."""
+    label = "fichier local"
+
+    def __init__(self, path):
+        self.path   = Path(path)
+        self._lock  = threading.Lock()
+        self._doc   = None
+        self._mtime = None
+
+    def _document(self):
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except OSError:
+            mtime = None
+        with self._lock:
+            if self._doc is None or mtime != self._mtime:
+                try:
+                    data = json.loads(self.path.read_text(encoding="utf-8")) if mtime else None
+                except (OSError, ValueError) as e:
+                    self.last_error = f"Lecture de {self.path.name} impossible : {e}"
+                    data = None
+                self._doc, self._mtime = parse_document(data), mtime
+            return self._doc
+
+    def _apply(self, mutation):
+        self._document()
+        with self._lock:
+            doc = copy.deepcopy(self._doc)
+            mutation(doc)
+            try:
+                # Écriture atomique : fichier temporaire puis remplacement
+                fd, tmp = tempfile.mkstemp(dir=self.path.parent, suffix=".tmp")
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    f.write(dump_document(doc))
+                os.replace(tmp, self.path)
+            except OSError as e:
+                self.last_error = f"Impossible d'écrire le fichier de mapping : {e}"
+                return _done(False)
+            self._doc, self._mtime = doc, self.path.stat().st_mtime_ns
+            self.last_error = None
+        return _done(True)
+
+
+# ==================== BACKEND GITHUB ====================
+class GitHubMappingStore(_MappingStore):
+    """
+    Fichier `path` du repo GitHub `repo` (API contents), mis en cache en mémoire.
+
+    `ttl`     : âge (s) au-delà duquel le cache est relu en arrière-plan.
+    `retries` : nouvelles tentatives d'une écriture (attente backoff * 2**n s).
+    Un conflit de version (409 / 422 : sha périmé) relit le fichier distant et
+    y rejoue les modifications en attente avant de renvoyer. Le cache est
+    toujours le dernier document distant connu (_base) + les modifications en
+    attente : une écriture abandonnée en disparaît.
+    """
+    label = "GitHub"
+
+    def __init__(self, repo, path, token, branch="main", ttl=60.0, retries=3,
+                 backoff=1.0, timeout=10, api_url="https://api.github.com"):
+        self.url     = f"{api_url.rstrip('/')}/repos/{repo}/contents/{path}"
+        self.branch  = branch
+        self.token   = token
+        self.ttl     = ttl
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+        self._lock       = threading.Lock()
+        self._doc        = None
+        self._base       = None     # dernier document distant connu
+        self._sha        = None
+        self._etag       = None
+        self._loaded_at  = 0.0
+        self._refreshing = False
+        self._pending    = []       # modifications pas encore écrites sur GitHub
+        self._writer     = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mapping-store")
+
+    def _headers(self):
+        return {
+            "Authorization": f"token {self.token}",
+            "Accept": "application/vnd.github+json",
+        }
+
+    # ---------- Lecture ----------
+    def _fetch(self, conditional=True):
+        """GET du fichier -> (statut, document, sha, etag) ; statut 304 = inchangé."""
+        import requests
+
+        headers = self._headers()
+        if conditional and self._etag:
+            headers["If-None-Match"] = self._etag
+        r = requests.get(self.url, headers=headers, params={"ref": self.branch}, timeout=self.timeout)
+        if r.status_code == 200:
+            body    = r.json()
+            content = base64.b64decode(body.get("content", "")).decode("utf-8")
+            return 200, parse_document(json.loads(content) if content.strip() else None), \
+                body.get("sha"), r.headers.get("ETag")
+        if r.status_code in (304, 404):
+            return r.status_code, empty_document(), None, None
+        raise RuntimeError(f"GitHub API erreur {r.status_code} : {r.text[:200]}")
+
+    def refresh(self):
+        """Relit le fichier distant (bloquant). Retourne True si le cache est à jour."""
+        try:
+            status, doc, sha, etag = self._fetch()
+            ok = True
+        except Exception as e:
+            self.last_error = f"Impossible de contacter GitHub : {e}"
+            ok = False
+        with self._lock:
+            self._loaded_at  = time.monotonic()
+            self._refreshing = False
+            if not ok:
+                if self._doc is None:
+                    self._base = empty_document()
+                    self._doc  = self._replay()
+                return False
+            if status != 304:
+                # Modifications en attente rejouées sur le document distant
+                self._base, self._sha, self._etag = doc, sha, etag
+                self._doc = self._replay()
+            self.last_error = None
+        return True
+
+    def _replay(self):
+        """Document distant connu + modifications en attente (appelé sous verrou)."""
+        doc = copy.deepcopy(self._base)
+        for mutation in self._pending:
+            mutation(doc)
+        return doc
+
+    def _document(self):
+        with self._lock:
+            doc, stale = self._doc, time.monotonic() - self._loaded_at > self.ttl
+            start = doc is not None and stale and not self._refreshing
+            if start:
+                self._refreshing = True
+        if doc is None:
+            self.refresh()
+        elif start:
+            threading.Thread(target=self.refresh, name="mapping-store-refresh", daemon=True).start()
+        with self._lock:
+            return self._doc
+
+    # ---------- Écriture ----------
+    def _apply(self, mutation):
+        self._document()
+        with self._lock:
+            mutation(self._doc)
+            self._pending.append(mutation)
+        return self._writer.submit(self._push)
+
+    def _push(self):
+        """Envoie le document du cache (PUT) ; traite la 1re modification en attente."""
+        import requests
+
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            with self._lock:
+                sent    = copy.deepcopy(self._doc)
+                payload = {
+                    "message": COMMIT_MESSAGE,
+                    "content": base64.b64encode(dump_document(sent).encode("utf-8")).decode("utf-8"),
+                    "branch":  self.branch,
+                }
+                if self._sha:
+                    payload["sha"] = self._sha
+            try:
+                r = requests.put(self.url, headers=self._headers(), json=payload, timeout=self.timeout)
+            except Exception as e:
+                error = f"Impossible de contacter GitHub : {e}"
+                continue
+
+            if r.status_code in (200, 201):
+                with self._lock:
+                    self._base = sent
+                    self._sha  = r.json().get("content", {}).get("sha")
+                    self._etag = None
+                    self._pending.pop(0)
+                    self._loaded_at = time.monotonic()
+                    self.last_error = None
+                return True
+
+            error = f"GitHub API erreur {r.status_code} : {r.text[:200]}"
+            if r.status_code in (409, 422):
+                # sha périmé : repartir du fichier distant et rejouer les modifications
+                try:
+                    _, doc, sha, etag = self._fetch(conditional=False)
+                except Exception as e:
+                    error = f"Impossible de contacter GitHub : {e}"
+                    continue
+                with self._lock:
+                    self._base, self._sha, self._etag = doc, sha, etag
+                    self._doc = self._replay()
+            elif r.status_code < 500 and r.status_code != 429:
+                break       # erreur définitive (droits, requête invalide…)
+
+        # Abandon : la modification est retirée du cache, qui repart du fichier
+        # distant relu sans condition (ou du dernier document distant connu)
+        try:
+            status, doc, sha, etag = self._fetch(conditional=False)
+        except Exception:
+            status = None
+        with self._lock:
+            self._pending.pop(0)
+            if status is not None:
+                self._base, self._sha, self._etag = doc, sha, etag
+            else:
+                self._etag = None
+            self._doc = self._replay()
+            self._loaded_at = time.monotonic()
+            self.last_error = error
+        return False
+
+    def flush(self, timeout=None):
+        """Attend la fin des écritures en cours."""
+        self._writer.submit(lambda: None).result(timeout)
+
+
+def open_store(github_cfg=None, local_path=None, **kwargs):
+    """
+    Store GitHub si `github_cfg` (token / repo / path / branch) est fourni,
+    sinon fichier JSON local `local_path`.
+    """
+    if github_cfg:
+        return GitHubMappingStore(github_cfg["repo"], github_cfg["path"], github_cfg["token"],
+                                  github_cfg.get("branch", "main"), **kwargs)
+    return LocalMappingStore(local_path)
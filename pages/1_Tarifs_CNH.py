@@ -5,7 +5,10 @@ Transforme les fichiers tarif Case / New Holland (réplique du PowerQuery)
 avec comparaison Case/NH, préfixe "CASE", et 3 modes d'export.
 """
 
+import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from pathlib import Path
 
 import pandas as pd
@@ -14,9 +17,30 @@ import streamlit as st
 # Permet d'importer theme.py / tarif_core.py situés à la racine du projet
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 
-from theme import apply_theme, page_header          # noqa: E402
+from theme import (                                  # noqa: E402
+    PERF_LOG, apply_theme, page_header, perf_expander, perf_options,
+)
+import perf                                          # noqa: E402
 import tarif_core as tc                              # noqa: E402
 
+# Nb de processus pour le découpage des gros fichiers (défaut : nb de cœurs)
+WORKERS = int(os.environ.get("TARIF_WORKERS", "0")) or None
+# Au-delà de ce volume (Mo, fichiers du mode cumulés), lecture et export en flux
+# par lots : ni le texte décodé ni le tableau complet ne sont gardés en mémoire
+# (pas de cache disque dans ce cas). Mode différentiel : toujours en mémoire.
+STREAM_MIN_BYTES = int(os.environ.get("TARIF_STREAM_MIN_MB", "64")) << 20
+PREVIEW_ROWS = 300
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+# Formats de sortie : libellé -> (extension, type MIME, bouton de téléchargement).
+# Parquet / Feather (types conservés, relecture rapide) seulement si pyarrow est installé.
+EXPORT_FORMATS = {
+    "Excel (.xlsx)": ("xlsx", XLSX_MIME, "📊 Télécharger en Excel (.xlsx)"),
+    "CSV (.csv)": ("csv", "text/csv", "📄 Télécharger en CSV (.csv)"),
+    "Parquet (.parquet)": ("parquet", "application/vnd.apache.parquet", "🧱 Télécharger en Parquet (.parquet)"),
+    "Feather (.feather)": ("feather", "application/vnd.apache.arrow.file", "🧱 Télécharger en Feather (.feather)"),
+}
+MODE_DIFF = "Différentiel (ancienne → nouvelle version)"
+
 st.set_page_config(page_title="Tarifs CNH → Excel", page_icon="📑", layout="wide")
 apply_theme()
 page_header(
@@ -24,6 +48,7 @@ page_header(
     "Transformation des tarifs Case & New Holland — réplique fidèle du PowerQuery",
     "📑",
 )
+perf_enabled, perf_memory = perf_options()
 
 # ==================== 1. CHARGEMENT DES FICHIERS ====================
 st.markdown('<div class="section-title">📂 Fichiers tarif (.txt)</div>', unsafe_allow_html=True)
@@ -54,7 +79,7 @@ with st.expander("⚙️ Table des remises (Code CNH → Taux)  —  0.5 = 50 %"
 st.markdown('<div class="section-title">🎯 Contenu à exporter</div>', unsafe_allow_html=True)
 mode = st.radio(
     "Mode",
-    ["Case uniquement", "New Holland uniquement", "Tous cumulé (Case + New Holland)"],
+    ["Case uniquement", "New Holland uniquement", "Tous cumulé (Case + New Holland)", MODE_DIFF],
     horizontal=True, label_visibility="collapsed",
 )
 
@@ -65,11 +90,57 @@ if mode == "Case uniquement":
         "dans le tarif Case (comparaison Case ↔ New Holland — nécessite les 2 fichiers)"
     )
 
+prev_file = None
+if mode == MODE_DIFF:
+    diff_brand = st.radio("Catalogue comparé", ["Case", "New Holland"], horizontal=True)
+    prev_file = st.file_uploader(
+        f"Version **précédente** du tarif {diff_brand} (.txt)", type=["txt"], key="up_prev"
+    )
+    st.caption(
+        "Le fichier chargé plus haut pour ce catalogue est la nouvelle version. Seules les "
+        "références ajoutées, supprimées ou dont le Prix tarif, le Prix net ou le Code remise "
+        "a changé sont exportées."
+    )
+
+fmt = st.radio(
+    "Format de sortie",
+    [f for f, (ext, *_) in EXPORT_FORMATS.items() if ext in ("xlsx", "csv") or tc.columnar_available()],
+    horizontal=True,
+    help="Seul le format choisi est produit : la génération est plus rapide. "
+         "Parquet / Feather : formats binaires typés, relus en moins d'une seconde par les traitements en aval.",
+)
+compression = None
+if EXPORT_FORMATS[fmt][0] in ("parquet", "feather"):
+    choices = tc.PARQUET_COMPRESSIONS if EXPORT_FORMATS[fmt][0] == "parquet" else tc.FEATHER_COMPRESSIONS
+    compression = st.selectbox("Compression", choices, help="zstd : bon compromis taille / vitesse.")
+
 generate = st.button("🚀 Générer le fichier", type="primary")
 
 # ==================== 4. TRAITEMENT ====================
-def _read(file):
-    return file.getvalue().decode("utf-8", errors="replace")
+def _parse(file, remise_map, workers=WORKERS):
+    # Moteur colonnaire + cache disque : un fichier déjà traité (même contenu,
+    # même table de remise) est relu en quelques millisecondes.
+    # Gros fichiers : découpage réparti sur `workers` processus.
+    return tc.parse_tarif_cached(file.getvalue(), remise_map, engine="columnar", workers=workers)
+
+
+def _stream(files, remise_map, stats, nh_refs=None):
+    """
+    Lots des fichiers `files` lus en flux (iter_tarif_batches). `stats` reçoit au
+    fil de l'eau le nb de lignes, l'aperçu et le nb de désignations préfixées
+    « CASE » (si `nh_refs`).
+    """
+    for file in files:
+        file.seek(0)
+        for batch in tc.iter_tarif_batches(file, remise_map):
+            if nh_refs is not None:
+                batch, n = tc.apply_case_prefix(batch, nh_refs, inplace=True)
+                stats["prefixes"] += n
+            if stats["rows"] < PREVIEW_ROWS:
+                stats["head"].append(batch.head(PREVIEW_ROWS - stats["rows"]))
+            stats["rows"] += len(batch)
+            yield batch
+
 
 if generate:
     remise_map = {
@@ -79,62 +150,107 @@ if generate:
     }
 
     nb_prefixes = None
+    diff_counts = None
     df = None
     fname = "TARIF"
+    recording = (
+        perf.recording(f"Tarifs CNH — {mode}", memory=perf_memory, log_path=PERF_LOG)
+        if perf_enabled else nullcontext()
+    )
 
     try:
-        with st.spinner("Transformation en cours…"):
+        with st.spinner("Transformation en cours…"), recording as rec:
+            files, nh_refs = [], None
             if mode == "New Holland uniquement":
                 if nh_file is None:
                     st.error("⚠️ Chargez le fichier **New Holland**.")
                     st.stop()
-                df = tc.parse_tarif_txt(_read(nh_file), remise_map)
+                files = [nh_file]
                 fname = "TARIF_NewHolland"
 
             elif mode == "Case uniquement":
                 if case_file is None:
                     st.error("⚠️ Chargez le fichier **Case**.")
                     st.stop()
-                df = tc.parse_tarif_txt(_read(case_file), remise_map)
+                files = [case_file]
                 fname = "TARIF_Case"
                 if prefix_case:
                     if nh_file is None:
                         st.error("⚠️ Le préfixe « CASE » nécessite aussi le fichier **New Holland**.")
                         st.stop()
-                    nh_refs = set(tc.parse_tarif_txt(_read(nh_file), remise_map)["Référence pièce"])
-                    df, nb_prefixes = tc.apply_case_prefix(df, nh_refs)
+                    nh_refs = tc.tarif_refs(nh_file.getvalue())
                     fname = "TARIF_Case_prefixe"
 
+            elif mode == MODE_DIFF:
+                new_file = case_file if diff_brand == "Case" else nh_file
+                if new_file is None or prev_file is None:
+                    st.error(f"⚠️ Chargez la nouvelle et la précédente version du tarif **{diff_brand}**.")
+                    st.stop()
+                # Versions découpées via le cache disque : le tarif du mois précédent
+                # déjà traité n'est pas re-découpé
+                df = tc.diff_tarifs(prev_file.getvalue(), new_file.getvalue(), remise_map, workers=WORKERS)
+                diff_counts = tc.diff_summary(df)
+                fname = f"TARIF_{diff_brand.replace(' ', '')}_delta"
+
             else:  # Tous cumulé (sans comparaison)
-                parts = []
-                if case_file is not None:
-                    parts.append(tc.parse_tarif_txt(_read(case_file), remise_map))
-                if nh_file is not None:
-                    parts.append(tc.parse_tarif_txt(_read(nh_file), remise_map))
-                if not parts:
+                files = [f for f in (case_file, nh_file) if f is not None]
+                if not files:
                     st.error("⚠️ Chargez au moins un fichier (Case et/ou New Holland).")
                     st.stop()
-                df = pd.concat(parts, ignore_index=True)
                 fname = "TARIF_cumule"
 
-            # Sérialisation — CSV toujours ; xlsx seulement si sous la limite Excel
-            csv_bytes = tc.to_csv_bytes(df)
-            xlsx_bytes = None
-            if len(df) <= 1_048_576:
-                xlsx_bytes = tc.to_xlsx_bytes(df)
+            stats, source = None, df
+            if files and sum(f.size for f in files) >= STREAM_MIN_BYTES:
+                stats = {"rows": 0, "head": [], "prefixes": 0}
+                source = _stream(files, remise_map, stats, nh_refs)
+            elif files:
+                if len(files) == 1:
+                    df = _parse(files[0], remise_map)
+                else:
+                    # Case et New Holland découpés simultanément : le budget de
+                    # processus est partagé entre les deux fichiers
+                    per_file = max(1, (WORKERS or os.cpu_count() or 1) // len(files))
+                    with perf.span("tarif.parse_case_nh"), ThreadPoolExecutor(max_workers=2) as pool:
+                        parts = list(pool.map(lambda f: _parse(f, remise_map, per_file), files))
+                    df = pd.concat(parts, ignore_index=True)
+                if nh_refs is not None:
+                    df, nb_prefixes = tc.apply_case_prefix(df, nh_refs, inplace=True)
+                source = df
+
+            # Sérialisation — uniquement le format demandé ;
+            # xlsx au-delà de la limite Excel : une feuille par tranche de 1 048 575 lignes
+            ext = EXPORT_FORMATS[fmt][0]
+            if ext == "parquet":
+                data = tc.to_parquet_bytes(source, compression)
+            elif ext == "feather":
+                data = tc.to_feather_bytes(source, compression)
+            else:
+                data = tc.to_xlsx_bytes(source) if ext == "xlsx" else tc.to_csv_bytes(source)
+
+            if stats is not None:
+                df_head = pd.concat(stats["head"], ignore_index=True) if stats["head"] \
+                    else pd.DataFrame(columns=tc.COLS)
+                n_rows = stats["rows"]
+                if nh_refs is not None:
+                    nb_prefixes = stats["prefixes"]
             else:
-                st.warning(
-                    f"{len(df):,} lignes dépassent la limite Excel (1 048 576). "
-                    "Export xlsx désactivé — utilisez le CSV.".replace(",", " ")
+                df_head, n_rows = df.head(PREVIEW_ROWS), len(df)
+            if ext == "xlsx" and n_rows >= tc.XLSX_MAX_ROWS:
+                st.info(
+                    f"{n_rows:,} lignes dépassent la limite d'une feuille Excel (1 048 576) : "
+                    f"classeur réparti sur {tc.xlsx_sheet_count(n_rows)} feuilles.".replace(",", " ")
                 )
 
         st.session_state["tarif_result"] = {
-            "df_head": df.head(300),
-            "n_rows": len(df),
+            "df_head": df_head,
+            "n_rows": n_rows,
+            "n_cols": len(df_head.columns),
             "nb_prefixes": nb_prefixes,
-            "xlsx": xlsx_bytes,
-            "csv": csv_bytes,
+            "diff_counts": diff_counts,
+            "data": data,
+            "ext": ext,
             "fname": fname,
+            "perf": rec.report() if rec else None,
         }
     except Exception as e:
         st.error(f"Erreur pendant la transformation : {e}")
@@ -145,28 +261,25 @@ if res:
     st.success("✅ Fichier généré.")
     m1, m2, m3 = st.columns(3)
     m1.metric("Lignes", f"{res['n_rows']:,}".replace(",", " "))
-    m2.metric("Colonnes", len(tc.COLS))
+    m2.metric("Colonnes", res["n_cols"])
     if res["nb_prefixes"] is not None:
         m3.metric("Réf. préfixées « CASE »", f"{res['nb_prefixes']:,}".replace(",", " "))
+    if res["diff_counts"] is not None:
+        m3.metric("Ajouts / suppressions / modifications",
+                  " / ".join(f"{n:,}".replace(",", " ") for n in res["diff_counts"].values()))
 
-    st.markdown('<div class="section-title">👁️ Aperçu (300 premières lignes)</div>', unsafe_allow_html=True)
+    st.markdown(f'<div class="section-title">👁️ Aperçu ({PREVIEW_ROWS} premières lignes)</div>',
+                unsafe_allow_html=True)
     st.dataframe(res["df_head"], use_container_width=True, height=380)
 
     st.markdown('<div class="section-title">⬇️ Téléchargement</div>', unsafe_allow_html=True)
-    d1, d2 = st.columns(2)
-    if res["xlsx"] is not None:
-        d1.download_button(
-            "📊 Télécharger en Excel (.xlsx)",
-            data=res["xlsx"], file_name=f"{res['fname']}.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            use_container_width=True,
-        )
-    else:
-        d1.button("📊 Excel indisponible (trop de lignes)", disabled=True, use_container_width=True)
-    d2.download_button(
-        "📄 Télécharger en CSV (.csv)",
-        data=res["csv"], file_name=f"{res['fname']}.csv",
-        mime="text/csv", use_container_width=True,
+    mime, label = next((m, l) for e, m, l in EXPORT_FORMATS.values() if e == res["ext"])
+    st.download_button(
+        label,
+        data=res["data"], file_name=f"{res['fname']}.{res['ext']}",
+        mime=mime, use_container_width=True,
     )
+    if res["perf"]:
+        perf_expander(res["perf"], f"{res['fname']}_performance.json")
 else:
     st.info("Chargez un fichier, choisissez le mode d'export, puis cliquez sur **Générer**.")
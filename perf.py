@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+Instrumentation légère des étapes de traitement : temps écoulé, temps CPU et
+pic mémoire (tracemalloc) par étape.
+
+    with perf.recording("Tarifs CNH", memory=True) as rec:
+        ...                         # code instrumenté par span() / @timed()
+    rec.report()                    # -> dict sérialisable en JSON
+
+Les étapes sont déclarées dans le code par `with span("tarif.parse"):` ou par
+le décorateur `@timed("tarif.parse")`. Hors d'un bloc recording() (cas normal),
+elles ne coûtent qu'une lecture de ContextVar. Les étapes exécutées dans les
+threads ou processus d'un pool ne sont pas enregistrées (le ContextVar n'y est
+pas propagé) : seule l'étape englobante du thread appelant est mesurée.
+"""
+
+import contextvars
+import functools
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+
+_NULL_SPAN = nullcontext()
+_recorder = contextvars.ContextVar("perf_recorder", default=None)
+
+
+class Recorder:
+    """Étapes mesurées pendant un bloc recording(), dans leur ordre d'ouverture."""
+
+    def __init__(self, label="", memory=False):
+        self.label   = label
+        self.memory  = memory
+        self.started = datetime.now(timezone.utc)
+        self.total_s = None
+        self.spans   = []       # dicts name / depth / wall_s / cpu_s / peak_mb
+        self._stack  = []       # étapes ouvertes
+
+    def _mark_peak(self):
+        # Le pic tracemalloc est global : on le reporte sur les étapes ouvertes
+        # avant de le réinitialiser pour l'étape suivante.
+        peak = tracemalloc.get_traced_memory()[1]
+        for s in self._stack:
+            s.peak = max(s.peak, peak)
+        tracemalloc.reset_peak()
+
+    def report(self):
+        return {
+            "label":   self.label,
+            "started": self.started.isoformat(timespec="seconds"),
+            "total_s": self.total_s,
+            "memory":  self.memory,
+            "spans":   self.spans,
+        }
+
+    def to_json(self, indent=2):
+        return json.dumps(self.report(), ensure_ascii=False, indent=indent)
+
+    def write_log(self, path):
+        """Ajoute le rapport en une ligne JSON à la fin du fichier `path`."""
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(self.to_json(indent=None) + "\n")
+
+
+class _Span:
+    __slots__ = ("rec", "entry", "wall", "cpu", "mem0", "peak")
+
+    def __init__(self, rec, name):
+        self.rec   = rec
+        self.entry = {"name": name, "depth": len(rec._stack), "wall_s": None, "cpu_s": None, "peak_mb": None}
+
+    def __enter__(self):
+        rec = self.rec
+        rec.spans.append(self.entry)
+        if rec.memory:
+            rec._mark_peak()
+            self.mem0 = self.peak = tracemalloc.get_traced_memory()[0]
+        rec._stack.append(self)
+        self.cpu  = time.process_time()
+        self.wall = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self.wall
+        cpu  = time.process_time() - self.cpu
+        rec  = self.rec
+        if rec.memory:
+            rec._mark_peak()
+            self.entry["peak_mb"] = round((self.peak - self.mem0) / 2**20, 3)
+        rec._stack.pop()
+        self.entry["wall_s"] = round(wall, 6)
+        self.entry["cpu_s"]  = round(cpu, 6)
+        return False
+
+
+def span(name):
+    """Contexte mesurant l'étape `name` (sans effet hors d'un bloc recording())."""
+    rec = _recorder.get()
+    return _NULL_SPAN if rec is None else _Span(rec, name)
+
+
+def timed(name):
+    """Décorateur : l'appel de la fonction est mesuré comme l'étape `name`."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            rec = _recorder.get()
+            if rec is None:
+                return fn(*args, **kwargs)
+            with _Span(rec, name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+@contextmanager
+def recording(label="", memory=False, log_path=None):
+    """
+    Active la mesure des étapes dans le bloc ; retourne le Recorder.
+    `memory` : pic mémoire par étape via tracemalloc (ralentit le traitement).
+    `log_path` : le rapport y est ajouté en une ligne JSON en fin de bloc.
+    """
+    rec = Recorder(label, memory)
+    token = _recorder.set(rec)
+    start_tracing = memory and not tracemalloc.is_tracing()
+    if start_tracing:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        yield rec
+    finally:
+        rec.total_s = round(time.perf_counter() - start, 6)
+        _recorder.reset(token)
+        if start_tracing:
+            tracemalloc.stop()
+        if log_path:
+            rec.write_log(log_path)
@@ -14,12 +14,40 @@ Réplique fidèle du PowerQuery existant (requête "tariff") :
 Fonctions additionnelles (demande utilisateur) :
   - comparaison Case / New Holland : préfixe "CASE " sur la désignation
     des références présentes UNIQUEMENT dans le tarif Case
-  - export xlsx / csv
+    (tarif_refs : lecture des seules références, sans découpage complet)
+  - export xlsx / csv, et Parquet / Feather si pyarrow est installé
+  - lecture en flux par lots (iter_tarif_batches) pour les très gros fichiers
+  - écriture incrémentale csv / xlsx vers un fichier (write_csv, write_xlsx)
+  - découpage parallèle multi-processus des gros fichiers (parse_tarif_parallel)
+  - cache disque des tarifs découpés, indexé par empreinte du fichier (parse_tarif_cached)
+  - types compacts pour réduire l'empreinte mémoire (compact_dtypes)
+  - mesure des étapes (temps, CPU, mémoire) via perf.span / perf.timed
+  - différentiel entre deux versions d'un tarif (diff_tarifs) : ajouts,
+    suppressions et changements de prix / code remise uniquement
+
+Deux moteurs de découpage produisent exactement le même DataFrame :
+  - "python"   : boucle ligne à ligne (référence, fidèle au PowerQuery)
+  - "columnar" : découpage et conversions colonne par colonne (gros catalogues)
 """
 
+import codecs
+import hashlib
 import io
+import json
+import mmap
+import multiprocessing
+import os
+import stat
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
 import pandas as pd
 
+from perf import span, timed
+
 # Offsets de découpage en largeur fixe (positions de début de chaque colonne).
 # Issus directement du PowerQuery :
 #   Csv.Document(..., 15, {0,18,58,59,60,68,79,92,97,101,102,107,112,113,116}, ...)
@@ -54,6 +82,53 @@ DEFAULT_REMISE = {
 
 CASE_PREFIX = "CASE "
 
+# Moteurs disponibles pour parse_tarif_txt.
+ENGINES = ("python", "columnar")
+
+# Préfixe de la ligne d'en-tête d'un fichier tarif CNH (ignorée au découpage).
+HEADER_PREFIX = "CNEUR01FR"
+
+# Lecture en flux : taille des blocs lus et nombre de lignes par lot.
+STREAM_CHUNK_BYTES = 1 << 20
+STREAM_BATCH_ROWS = 100_000
+
+# Nombre maximal de lignes d'une feuille Excel (en-tête compris).
+XLSX_MAX_ROWS = 1_048_576
+
+# Découpage parallèle : en dessous de ce volume, le mode série est plus rapide
+# (démarrage des processus, transfert des résultats).
+PARALLEL_MIN_BYTES = 8 << 20
+
+# Export CSV : moteurs disponibles pour write_csv et nb de lignes sérialisées par bloc.
+CSV_ENGINES = ("auto", "pyarrow", "python", "pandas")
+CSV_CHUNK_ROWS = 20_000
+
+# Démarrage des processus du découpage parallèle : jamais "fork", risqué depuis
+# un processus multi-thread (serveur Streamlit) — "forkserver" si disponible.
+PROCESS_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+# Export vers fichier temporaire : reste en mémoire sous ce seuil, puis bascule sur disque.
+SPOOL_MAX_BYTES = 32 << 20
+
+# Cache disque des tarifs déjà découpés (partagé entre les sessions de l'application).
+# Dossier propre à l'utilisateur système (droits 0700) ; surchargeable par la
+# variable d'environnement TARIF_CACHE_DIR.
+CACHE_DIR = Path(os.environ.get("TARIF_CACHE_DIR") or Path(tempfile.gettempdir()) / (
+    f"tarif_cnh_cache-{os.getuid()}" if hasattr(os, "getuid") else "tarif_cnh_cache"))
+CACHE_MAX_BYTES = 512 << 20
+CACHE_VERSION = 2           # à incrémenter à chaque changement du schéma de parse_tarif_txt
+
+# Colonnes de codes à faible cardinalité (stockées en "category" par compact_dtypes).
+CODE_COLS = [
+    "Type", "Libre", "Première ligne de produit", "Code remise",
+    "PCC", "Code retour", "Famille Mistral",
+]
+
+# Colonnes entières pouvant être vides : toujours "Int64" (entier nullable), que le
+# fichier ait ou non des valeurs vides — fichier entier, lots et morceaux
+# parallèles partagent ainsi le même schéma (csv : « 20260105 », jamais « .0 »).
+NULLABLE_INT_COLS = ["Date du prix", "Quantité", "MPC"]
+
 
 def _to_int(s, default=0):
     """Convertit un champ texte en entier (tolérant aux espaces / champ vide)."""
@@ -74,13 +149,21 @@ def _split_line(line):
     return seg
 
 
-def parse_tarif_txt(text, remise_map=None):
+@timed("tarif.parse")
+def parse_tarif_txt(text, remise_map=None, engine="python"):
     """
     Transforme le contenu texte d'un tarif CNH en DataFrame (colonnes = COLS).
     `remise_map` : dict Code CNH -> taux (float). Défaut = DEFAULT_REMISE.
+    `engine`     : "python" (ligne à ligne) ou "columnar" (vectorisé, plus rapide
+                   sur les gros fichiers). Les deux donnent un résultat identique.
+    Types fixes : NULLABLE_INT_COLS en "Int64", taux et prix net en float64.
     """
     if remise_map is None:
         remise_map = DEFAULT_REMISE
+    if engine == "columnar":
+        return _typed(_parse_columnar(text, remise_map))
+    if engine != "python":
+        raise ValueError(f"Moteur inconnu : {engine!r} (attendu : {', '.join(ENGINES)})")
 
     rows = []
     for line in text.splitlines():
@@ -91,7 +174,7 @@ def parse_tarif_txt(text, remise_map=None):
         seg = _split_line(line)
         ref = seg[0].strip()
         # Ligne d'en-tête du fichier (ex: CNEUR01FR_FR20260105) -> ignorée
-        if not ref or ref.startswith("CNEUR01FR"):
+        if not ref or ref.startswith(HEADER_PREFIX):
             continue
 
         desc = seg[1].rstrip()
@@ -120,42 +203,990 @@ def parse_tarif_txt(text, remise_map=None):
             quantite, prem_ligne, code_remise, taux, pcc, mpc, code_retour, famille,
         ])
 
-    return pd.DataFrame(rows, columns=COLS)
+    df = pd.DataFrame(rows, columns=COLS)
+    for col in NULLABLE_INT_COLS:
+        # Construit depuis les entiers Python : pas de passage par float64
+        i = COLS.index(col)
+        df[col] = pd.array([row[i] for row in rows], dtype="Int64")
+    return _typed(df)
+
+
+def _typed(df):
+    """Schéma fixe d'un tarif découpé, quel que soit son contenu (même vide)."""
+    types = {c: "Int64" for c in NULLABLE_INT_COLS}
+    types.update({"Taux de remise": "float64", "Prix net": "float64"})
+    return df.astype(types)
+
+
+# ---------- Moteur colonnaire ----------
+def _char_matrix(lines):
+    """
+    Range les lignes dans une matrice de caractères (n lignes x largeur fixe, UCS-4),
+    complétée par des NUL. Chaque colonne d'OFFSETS devient une simple tranche.
+    """
+    arr = np.array(lines, dtype=str)
+    width = max(arr.dtype.itemsize // 4, OFFSETS[-1] + 1)
+    arr = arr.astype(f"U{width}")
+    return arr.view(np.uint32).reshape(len(lines), width)
+
+
+def _segment(chars, i):
+    """Segment n° i (sous-matrice de caractères) selon OFFSETS."""
+    stop = OFFSETS[i + 1] if i + 1 < len(OFFSETS) else None
+    return chars[:, OFFSETS[i]:stop]
+
+
+def _text(seg):
+    """Sous-matrice de caractères -> tableau de chaînes (NUL de remplissage retirés)."""
+    seg = np.ascontiguousarray(seg)
+    return seg.view(f"U{max(seg.shape[1], 1)}").ravel()
+
+
+def _int_column(seg, default):
+    """
+    Équivalent vectorisé de `_to_int` sur un segment.
+    Retourne (valeurs int64, masque des valeurs présentes).
+    Sur un champ ASCII sans signe ni "_", `_to_int` revient à concaténer les
+    chiffres : ce cas (le seul rencontré en pratique) est traité en bloc ;
+    les autres repassent par `_to_int`.
+    """
+    is_digit = (seg >= ord("0")) & (seg <= ord("9"))
+    n_digits = is_digit.sum(axis=1)
+    special = (seg >= 128) | (seg == ord("+")) | (seg == ord("-")) | (seg == ord("_"))
+    plain = ~special.any(axis=1) & (n_digits <= 18)
+    fast = plain & (n_digits > 0)
+
+    # Poids décimal de chaque chiffre = 10 ** (nb de chiffres situés à sa droite)
+    rank = is_digit[:, ::-1].cumsum(axis=1)[:, ::-1] - 1
+    digits = np.where(is_digit, seg.astype(np.int64) - ord("0"), 0)
+    values = (digits * 10 ** np.where(is_digit, rank, 0).astype(np.int64)).sum(axis=1)
+    values[~fast] = 0
+    valid = fast.copy()
+
+    slow = np.flatnonzero(~plain)
+    if len(slow):
+        raw = _text(seg[slow])
+        for k, i in enumerate(slow):
+            v = _to_int(str(raw[k]), None)
+            if v is not None:
+                values[i] = v
+                valid[i] = True
+    if default is not None:
+        values[~valid] = default
+        valid[:] = True
+    return values, valid
+
+
+def _nullable(values, valid):
+    """Valeurs int64 + masque des valeurs présentes -> colonne "Int64" (vide = <NA>)."""
+    return pd.arrays.IntegerArray(values, ~valid)
+
+
+def _round2(x):
+    """
+    round(x, 2) élément par élément, identique au round() Python.
+    np.round (x * 100 arrondi) peut diverger sur les demis ; ces cas limites
+    sont recalculés avec round().
+    """
+    out = np.round(x, 2)
+    scaled = np.abs(x * 100)
+    edge = np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6)
+    for i in edge:
+        out[i] = round(float(x[i]), 2)
+    return out
+
+
+def _parse_columnar(text, remise_map):
+    """Moteur "columnar" de parse_tarif_txt : mêmes règles, appliquées colonne par colonne."""
+    with span("tarif.split_lines"):
+        lines = text.splitlines()
+        if not lines:
+            return pd.DataFrame([], columns=COLS)
+        chars = _char_matrix(lines)
+        del lines
+
+    # Lignes vides et ligne d'en-tête (ex: CNEUR01FR_FR20260105) -> ignorées
+    ref = np.char.strip(_text(_segment(chars, 0)))
+    keep = (ref != "") & ~np.char.startswith(ref, HEADER_PREFIX)
+    if not keep.any():
+        return pd.DataFrame([], columns=COLS)
+    if not keep.all():
+        chars, ref = chars[keep], ref[keep]
+
+    def text_col(i):
+        return np.char.strip(_text(_segment(chars, i)))
+
+    date_prix = _nullable(*_int_column(_segment(chars, 4), None))
+    prix_tarif = _int_column(_segment(chars, 5), 0)[0] / 100
+    poids_kg = _int_column(_segment(chars, 6), 0)[0] / 1000
+    quantite = _nullable(*_int_column(_segment(chars, 7), None))
+    code_remise = text_col(9)
+    mpc_values, mpc_valid = _int_column(_segment(chars, 11), None)
+
+    # Famille Mistral = 3 premiers caractères du MPC converti en texte
+    # (même règle que le moteur "python")
+    famille = np.where(mpc_valid, mpc_values.astype("U20"), text_col(11)).astype("U3")
+
+    with span("tarif.remise"):
+        taux = pd.Series(code_remise).map(remise_map)
+        found = taux.notna().to_numpy()
+        if found.any():
+            prix_net = np.full(len(ref), np.nan)
+            prix_net[found] = _round2(prix_tarif[found] * (1 - taux.to_numpy(dtype=float)[found]))
+        else:
+            taux = np.full(len(ref), None, dtype=object)
+            prix_net = np.full(len(ref), None, dtype=object)
+
+    return pd.DataFrame({
+        "Référence pièce": ref,
+        "Description Pièces": np.char.rstrip(_text(_segment(chars, 1))),
+        "Type": text_col(2),
+        "Libre": text_col(3),
+        "Date du prix": date_prix,
+        "Prix tarif": prix_tarif,
+        "Prix net": prix_net,
+        "Poids kg": poids_kg,
+        "Quantité": quantite,
+        "Première ligne de produit": text_col(8),
+        "Code remise": code_remise,
+        "Taux de remise": taux,
+        "PCC": text_col(10),
+        "MPC": _nullable(mpc_values, mpc_valid),
+        "Code retour": text_col(12),
+        "Famille Mistral": famille,
+    }, columns=COLS)
+
+
+# ---------- Lecture en flux ----------
+def iter_tarif_batches(fileobj, remise_map=None, batch_rows=STREAM_BATCH_ROWS,
+                       chunk_bytes=STREAM_CHUNK_BYTES, engine="columnar", encoding="utf-8"):
+    """
+    Lit un tarif CNH depuis un fichier binaire (ou tout objet avec .read(n))
+    par blocs de `chunk_bytes` et produit des DataFrames d'au plus `batch_rows`
+    lignes, sans jamais charger le texte complet en mémoire.
+    Mêmes règles et mêmes types que parse_tarif_txt (NULLABLE_INT_COLS en
+    "Int64") ; l'index est continu d'un lot à l'autre. Les exports (csv,
+    xlsx, Parquet) sont identiques à ceux du fichier entier.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    pending = ""
+    lines = []
+    start = 0
+    while True:
+        chunk = fileobj.read(chunk_bytes)
+        final = not chunk
+        text = pending + decoder.decode(chunk, final=final)
+        # Une ligne n'est découpée qu'une fois son "\n" reçu
+        cut = len(text) if final else text.rfind("\n") + 1
+        lines.extend(text[:cut].splitlines())
+        pending = text[cut:]
+
+        while len(lines) >= batch_rows or (final and lines):
+            batch, lines = lines[:batch_rows], lines[batch_rows:]
+            df = parse_tarif_txt("\n".join(batch), remise_map, engine)
+            if df.empty:
+                continue
+            df.index = pd.RangeIndex(start, start + len(df))
+            start += len(df)
+            yield df
+        if final:
+            return
+
+
+def _as_batches(data):
+    """DataFrame ou itérable de DataFrames -> itérateur de lots (au moins un)."""
+    if isinstance(data, pd.DataFrame):
+        yield data
+        return
+    empty = True
+    for batch in data:
+        empty = False
+        yield batch
+    if empty:
+        yield _typed(pd.DataFrame([], columns=COLS))
+
+
+# ---------- Découpage parallèle ----------
+def _line_ranges(raw, n):
+    """Découpe `raw` en au plus `n` plages d'octets [début, fin) alignées sur les fins de ligne."""
+    size = len(raw)
+    bounds = [0]
+    for k in range(1, n):
+        pos = raw.find(b"\n", max(size * k // n, bounds[-1]))
+        if pos == -1:
+            break
+        if pos + 1 > bounds[-1]:
+            bounds.append(pos + 1)
+    if bounds[-1] < size:
+        bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _parse_range(path, start, stop, remise_map, engine):
+    """Tâche d'un processus : découpe la plage [start, stop) du fichier `path` (mmap)."""
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        text = mm[start:stop].decode("utf-8", errors="replace")
+    return parse_tarif_txt(text, remise_map, engine)
+
+
+def _concat_parts(parts):
+    """
+    Concatène des morceaux découpés séparément (même schéma fixe que
+    parse_tarif_txt sur le fichier entier).
+    """
+    parts = [p for p in parts if not p.empty]
+    if not parts:
+        return _typed(pd.DataFrame([], columns=COLS))
+    return pd.concat(parts, ignore_index=True)
+
+
+def parse_tarif_parallel(data, remise_map=None, workers=None, engine="columnar",
+                         min_bytes=PARALLEL_MIN_BYTES):
+    """
+    parse_tarif_txt réparti sur plusieurs processus.
+    `data` : octets du fichier (UTF-8) ou chemin du fichier.
+    Le fichier est découpé en plages alignées sur les fins de ligne ; chaque
+    processus lit sa plage par mmap (pas de transfert du texte), les résultats
+    sont concaténés dans l'ordre d'origine. Résultat identique au mode série.
+    `workers` : nb de processus (défaut : nb de cœurs). Un fichier de moins de
+    `min_bytes` octets, ou workers <= 1, est découpé en série.
+    """
+    if remise_map is None:
+        remise_map = DEFAULT_REMISE
+    workers = workers or os.cpu_count() or 1
+    is_path = isinstance(data, (str, os.PathLike))
+    size = os.path.getsize(data) if is_path else len(data)
+    if workers <= 1 or not size or size < min_bytes:
+        raw = Path(data).read_bytes() if is_path else bytes(data)
+        with span("tarif.decode"):
+            text = raw.decode("utf-8", errors="replace")
+        return parse_tarif_txt(text, remise_map, engine)
+
+    tmp = None
+    if is_path:
+        path = os.fspath(data)
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            ranges = _line_ranges(mm, workers)
+    else:
+        fd, tmp = tempfile.mkstemp(suffix=".txt")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        path = tmp
+        ranges = _line_ranges(data, workers)
+    try:
+        pool = ProcessPoolExecutor(max_workers=min(workers, len(ranges)),
+                                   mp_context=multiprocessing.get_context(PROCESS_START_METHOD))
+        with span("tarif.parse_parallel"), pool:
+            futures = [
+                pool.submit(_parse_range, path, start, stop, remise_map, engine)
+                for start, stop in ranges
+            ]
+            return _concat_parts([f.result() for f in futures])
+    finally:
+        if tmp:
+            os.unlink(tmp)
+
+
+# ---------- Cache disque ----------
+def cache_key(raw, remise_map=None):
+    """Empreinte SHA-256 des octets du fichier + de la table de remise (+ CACHE_VERSION)."""
+    if remise_map is None:
+        remise_map = DEFAULT_REMISE
+    h = hashlib.sha256(f"v{CACHE_VERSION}:".encode("ascii"))
+    h.update(raw)
+    h.update(json.dumps(sorted(remise_map.items()), default=str).encode("utf-8"))
+    return h.hexdigest()
+
+
+def _private_dir(path):
+    """
+    Crée au besoin le dossier `path` (droits 0700) et vérifie qu'il n'est
+    modifiable que par l'utilisateur courant. False si le dossier est
+    inutilisable ou appartient à un autre utilisateur (cache désactivé).
+    """
+    try:
+        path.mkdir(mode=0o700, parents=True, exist_ok=True)
+        st = path.lstat()
+        if not stat.S_ISDIR(st.st_mode):
+            return False
+        if hasattr(os, "getuid"):
+            if st.st_uid != os.getuid():
+                return False
+            if st.st_mode & 0o077:
+                os.chmod(path, 0o700)
+    except OSError:
+        return False
+    return True
+
+
+def _evict(cache_dir, max_bytes):
+    """Supprime les entrées les moins récemment utilisées au-delà de `max_bytes`."""
+    entries = []
+    for path in cache_dir.glob("*.feather"):
+        try:
+            st = path.stat()
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            path.unlink()
+        except OSError:
+            pass
+        total -= size
+
+
+def parse_tarif_cached(raw, remise_map=None, engine="columnar",
+                       cache_dir=None, max_bytes=CACHE_MAX_BYTES, workers=1):
+    """
+    parse_tarif_txt avec cache disque : `raw` = octets du fichier tarif (UTF-8).
+    Le résultat est conservé en Feather (types pandas préservés, aucun code
+    exécuté à la relecture), indexé par cache_key ; un fichier déjà vu avec la
+    même table de remise est relu sans re-découpage.
+    Éviction LRU (date de dernier accès) au-delà de `max_bytes`.
+    Sans pyarrow, ou si le dossier n'est pas privé (_private_dir), pas de cache.
+    `workers` > 1 : découpage parallèle (parse_tarif_parallel) en cas d'absence du cache.
+    """
+    cache_dir = Path(cache_dir or CACHE_DIR)
+    if not columnar_available() or not _private_dir(cache_dir):
+        return parse_tarif_parallel(raw, remise_map, workers, engine)
+
+    path = cache_dir / f"{cache_key(raw, remise_map)}.feather"
+    try:
+        with span("tarif.cache_read"):
+            df = pd.read_feather(path)
+        os.utime(path)
+        return df
+    except Exception:
+        # Absent, tronqué ou illisible (fichier d'une autre version de pandas…) : on redécoupe
+        pass
+
+    df = parse_tarif_parallel(raw, remise_map, workers, engine)
+    tmp = None
+    try:
+        # Écriture atomique : un autre processus ne lit jamais un fichier partiel
+        fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        with span("tarif.cache_write"), os.fdopen(fd, "wb") as f:
+            df.to_feather(f)
+        os.replace(tmp, path)
+        tmp = None
+        _evict(cache_dir, max_bytes)
+    except Exception:
+        # Cache non écrit (disque plein, type non sérialisable…) : sans conséquence
+        pass
+    finally:
+        if tmp:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+    return df
+
+
+# ---------- Types compacts ----------
+def _float32_lossless(values):
+    """True si float32 restitue exactement les valeurs ET leur écriture texte (export identique)."""
+    x32 = values.astype(np.float32)
+    same = (x32.astype(np.float64) == values) | np.isnan(values)
+    if not same.all():
+        return False
+    ok = ~np.isnan(values)
+    return bool((x32[ok].astype(str) == values[ok].astype(str)).all())
+
+
+def _int32_fits(values):
+    info = np.iinfo(np.int32)
+    return len(values) == 0 or (values.min() >= info.min and values.max() <= info.max)
+
+
+def _string_dtype():
+    """Stockage compact des chaînes (Arrow) si pyarrow est installé, sinon None."""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return None
+    return pd.StringDtype("pyarrow")
+
+
+def compact_dtypes(df):
+    """
+    Version du DataFrame tarif à empreinte mémoire réduite, sans perte :
+      - colonnes de codes (CODE_COLS) en "category" si peu de valeurs distinctes
+      - entiers en int32 / Int32 quand les valeurs tiennent
+      - flottants en float32 seulement si valeurs et écriture texte identiques
+      - références et désignations en chaînes Arrow si pyarrow est disponible
+    Les exports csv / xlsx produits à partir du résultat sont identiques.
+    Retourne (df compact, rapport {"before", "after", "saved", "columns"}) — octets.
+    """
+    before = df.memory_usage(deep=True, index=False)
+    types = {}
+    str_dtype = _string_dtype()
+    for col in df.columns:
+        s = df[col]
+        if col in CODE_COLS and s.nunique(dropna=False) <= max(len(s) // 2, 1):
+            types[col] = "category"
+        elif str_dtype is not None and col in ("Référence pièce", "Description Pièces"):
+            types[col] = str_dtype
+        elif pd.api.types.is_integer_dtype(s.dtype):
+            valid = s.dropna().to_numpy(dtype=np.int64)
+            if _int32_fits(valid):
+                types[col] = "Int32" if pd.api.types.is_extension_array_dtype(s.dtype) else "int32"
+        elif s.dtype == np.float64 and _float32_lossless(s.to_numpy()):
+            types[col] = "float32"
+    out = df.astype(types)
+    after = out.memory_usage(deep=True, index=False)
+    report = {
+        "before": int(before.sum()),
+        "after": int(after.sum()),
+        "saved": int(before.sum() - after.sum()),
+        "columns": {c: (int(before[c]), int(after[c])) for c in df.columns},
+    }
+    return out, report
+
+
+# Sauts de ligne de str.splitlines autres que \n et \r\n : octets seuls et
+# caractères U+0085 / U+2028 / U+2029 encodés en UTF-8. Si le fichier en
+# contient, tarif_refs repasse par le texte décodé.
+_OTHER_BREAK_BYTES = [b"\x0b", b"\x0c", b"\x1c", b"\x1d", b"\x1e"]
+_OTHER_BREAK_CHARS = [b"\xc2\x85", b"\xe2\x80\xa8", b"\xe2\x80\xa9"]
+REFS_CHUNK_LINES = 1 << 16
+
+
+def _other_line_breaks(raw, buf):
+    """True si `raw` (vue uint8 `buf`) contient un autre saut de ligne que \n et \r\n."""
+    if any(sep in raw for sep in _OTHER_BREAK_BYTES):
+        return True
+    if b"\r" in raw and raw.count(b"\r") != raw.count(b"\r\n"):
+        return True             # \r seul
+    for seq in _OTHER_BREAK_CHARS:
+        if seq[-1:] not in raw:
+            continue
+        # Séquence complète : positions du 1er octet, puis filtrage octet par octet
+        pos = np.flatnonzero(buf[:len(buf) - len(seq) + 1] == seq[0])
+        for k in range(1, len(seq)):
+            pos = pos[buf[pos + k] == seq[k]]
+        if len(pos):
+            return True
+    return False
+
+
+def _text_refs(text):
+    width = OFFSETS[1]
+    return {line[:width].strip() for line in text.splitlines()}
 
 
-def apply_case_prefix(df_case, nh_refs):
+@timed("tarif.refs")
+def tarif_refs(data):
+    """
+    Jeu des références pièce d'un tarif CNH, sans découpage complet :
+    seul le premier champ (18 caractères) de chaque ligne est lu.
+    `data` : octets du fichier (UTF-8) ou texte déjà décodé.
+    Mêmes exclusions que parse_tarif_txt (lignes vides, en-tête CNEUR01FR).
+
+    Sur des octets, le fichier n'est pas décodé : les 18 premiers octets de
+    chaque ligne sont extraits en bloc (numpy, par paquets de REFS_CHUNK_LINES
+    lignes) et seules les références distinctes sont décodées. Une ligne dont
+    le champ n'est pas en ASCII simple est décodée seule.
+    """
+    if isinstance(data, str):
+        refs = _text_refs(data)
+    else:
+        raw = bytes(data)
+        buf = np.frombuffer(raw, dtype=np.uint8)
+        if _other_line_breaks(raw, buf):
+            refs = _text_refs(raw.decode("utf-8", errors="replace"))
+        else:
+            refs = _byte_refs(raw, buf)
+    refs.discard("")
+    return {r for r in refs if not r.startswith(HEADER_PREFIX)}
+
+
+def _byte_refs(raw, buf):
+    """Références (non filtrées) lues dans les octets `raw` (vue uint8 `buf`, lignes \n ou \r\n)."""
+    width = OFFSETS[1]
+    ends = np.append(np.flatnonzero(buf == 0x0A), len(buf))
+    starts = np.append(0, ends[:-1] + 1)
+    # Lignes de moins de `width` octets (vides, fin de fichier…) : décodées une à une
+    full = ends - starts >= width
+    refs = {raw[s:e].decode("utf-8", errors="replace").strip()
+            for s, e in zip(starts[~full].tolist(), ends[~full].tolist())}
+    if not full.any():
+        return refs
+    # Champ de chaque ligne lu dans une vue glissante sur les octets (sans copie du fichier)
+    windows = np.lib.stride_tricks.sliding_window_view(buf, width)
+    starts, ends = starts[full], ends[full]
+    for lo in range(0, len(starts), REFS_CHUNK_LINES):
+        s = starts[lo:lo + REFS_CHUNK_LINES]
+        field = windows[s]
+        # Non-ASCII (caractères multi-octets) ou NUL (perdu par numpy) : ligne décodée seule
+        special = ((field >= 0x80) | (field == 0)).any(axis=1)
+        plain = field[~special].view(f"S{width}").ravel().astype(f"U{width}")
+        refs.update(np.char.strip(plain).tolist())
+        for i in (np.flatnonzero(special) + lo).tolist():
+            refs.add(raw[starts[i]:ends[i]].decode("utf-8", errors="replace")[:width].strip())
+    return refs
+
+
+@timed("tarif.prefix")
+def apply_case_prefix(df_case, nh_refs, inplace=False):
     """
     Préfixe "CASE " la désignation des références présentes UNIQUEMENT dans Case
     (c'est-à-dire absentes du jeu de références New Holland `nh_refs`).
     Les références communes ne sont pas modifiées.
+    `inplace=True` modifie `df_case` directement (pas de copie du DataFrame).
     Retourne (df modifié, nb de lignes préfixées).
     """
-    df = df_case.copy()
+    df = df_case if inplace else df_case.copy()
     mask = ~df["Référence pièce"].isin(nh_refs)
-    df.loc[mask, "Description Pièces"] = (
-        CASE_PREFIX + df.loc[mask, "Description Pièces"].astype(str).str.lstrip()
-    )
-    return df, int(mask.sum())
+    n = int(mask.sum())
+    if n:
+        df.loc[mask, "Description Pièces"] = (
+            CASE_PREFIX + df.loc[mask, "Description Pièces"].astype(str).str.lstrip()
+        )
+    return df, n
+
+
+# ---------- Différentiel entre deux versions d'un tarif ----------
+# Colonnes comparées et statuts des lignes du différentiel.
+DIFF_COLS = ["Prix tarif", "Prix net", "Code remise"]
+DIFF_ADDED, DIFF_REMOVED, DIFF_CHANGED = "ajout", "suppression", "modification"
+
+
+def _as_tarif(data, remise_map, workers):
+    """DataFrame déjà découpé, ou octets du fichier (découpés via le cache disque)."""
+    if isinstance(data, pd.DataFrame):
+        return data
+    return parse_tarif_cached(bytes(data), remise_map, workers=workers)
+
+
+def _differs(old, new):
+    """Masque des valeurs différentes ; deux valeurs vides (None / NaN) sont égales."""
+    old_na, new_na = pd.isna(old), pd.isna(new)
+    with np.errstate(invalid="ignore"):
+        equal = (old == new) | (old_na & new_na)
+    return ~equal
+
+
+@timed("tarif.diff")
+def diff_tarifs(old, new, remise_map=None, columns=DIFF_COLS, workers=1):
+    """
+    Différentiel entre deux versions d'un tarif CNH, jointes sur la Référence pièce.
+    `old` / `new` : DataFrames de parse_tarif_txt, ou octets des fichiers
+    (découpés via parse_tarif_cached : une version déjà vue n'est pas re-découpée).
+    Seules les lignes ajoutées, supprimées ou dont une colonne de `columns` a
+    changé sont retournées : Statut, Référence pièce, Description Pièces, puis
+    "<colonne> (ancien)" / "<colonne> (nouveau)" pour chaque colonne comparée.
+    Ordre : ajouts et modifications dans l'ordre du nouveau tarif, puis suppressions.
+    En cas de référence en double, la première ligne de chaque tarif l'emporte.
+    """
+    key = "Référence pièce"
+    old = _as_tarif(old, remise_map, workers).drop_duplicates(key).set_index(key)
+    new = _as_tarif(new, remise_map, workers).drop_duplicates(key).set_index(key)
+
+    # Jointure par index de hachage (pas de tri) : ancienne ligne alignée sur chaque nouvelle
+    in_old = new.index.isin(old.index)
+    prev = old.reindex(new.index)
+    changed = np.zeros(len(new), dtype=bool)
+    for col in columns:
+        changed |= _differs(prev[col].to_numpy(), new[col].to_numpy())
+    keep = ~in_old | (in_old & changed)
+    removed = ~old.index.isin(new.index)
+
+    def part(status, refs, desc, before, after):
+        cols = {"Statut": status, key: refs, "Description Pièces": desc}
+        for col in columns:
+            cols[f"{col} (ancien)"] = before[col]
+            cols[f"{col} (nouveau)"] = after[col]
+        return pd.DataFrame(cols)
+
+    kept = new[keep]
+    gone = old[removed]
+    # Colonnes "(nouveau)" des suppressions : vides, du type de la colonne d'origine
+    none = {c: new[c].iloc[:0].reindex(range(len(gone))).to_numpy() for c in columns}
+    parts = [
+        part(np.where(in_old[keep], DIFF_CHANGED, DIFF_ADDED), kept.index.to_numpy(),
+             kept["Description Pièces"].to_numpy(),
+             {c: prev[c].to_numpy()[keep] for c in columns}, {c: kept[c].to_numpy() for c in columns}),
+        part(DIFF_REMOVED, gone.index.to_numpy(), gone["Description Pièces"].to_numpy(),
+             {c: gone[c].to_numpy() for c in columns}, none),
+    ]
+    diff = pd.concat([p for p in parts if len(p)] or parts[:1], ignore_index=True)
+    return diff.astype({f"{c} ({side})": new[c].dtype for c in columns for side in ("ancien", "nouveau")})
+
+
+def diff_summary(diff):
+    """Nb de lignes par statut : {"ajout": n, "suppression": n, "modification": n}."""
+    counts = diff["Statut"].value_counts()
+    return {status: int(counts.get(status, 0)) for status in (DIFF_ADDED, DIFF_REMOVED, DIFF_CHANGED)}
+
+
+def _xlsx_rows(df):
+    """Lignes d'un DataFrame prêtes pour openpyxl (valeurs <NA> -> cellule vide)."""
+    na_cols = [
+        c for c in df.columns
+        if pd.api.types.is_extension_array_dtype(df[c]) and df[c].isna().any()
+    ]
+    if na_cols:
+        df = df.astype({c: object for c in na_cols})
+        for c in na_cols:
+            df[c] = df[c].where(df[c].notna(), None)
+    for row in df.itertuples(index=False, name=None):
+        yield list(row)
+
+
+@contextmanager
+def _open_dest(dest):
+    """Chemin -> fichier ouvert en écriture binaire ; objet fichier -> inchangé (non fermé)."""
+    if isinstance(dest, (str, os.PathLike)):
+        with open(dest, "wb") as f:
+            yield f
+    else:
+        yield dest
+
+
+@timed("export.xlsx")
+def write_xlsx(data, dest, sheet_name="tariff", max_rows=XLSX_MAX_ROWS):
+    """
+    Écrit un DataFrame ou un itérable de lots dans un classeur xlsx.
+    `dest` : chemin ou fichier binaire. Les lignes sont poussées au fil de l'eau
+    dans le classeur write_only d'openpyxl, lot par lot.
+    Au-delà de `max_rows` lignes par feuille (en-tête compris, limite Excel par
+    défaut), la suite est écrite dans de nouvelles feuilles `sheet_name`_2,
+    `sheet_name`_3…, chacune avec l'en-tête, en un seul passage.
+    Retourne le nombre de lignes écrites (hors en-tête).
+    """
+    from openpyxl import Workbook
+
+    if max_rows < 2:
+        raise ValueError(f"max_rows doit être au moins 2 (en-tête + 1 ligne) : {max_rows}")
+    wb = Workbook(write_only=True)
+    ws, header, room = None, None, 0
+    n_rows = 0
+    for batch in _as_batches(data):
+        if ws is None:
+            header   = list(batch.columns)
+            ws, room = wb.create_sheet(xlsx_sheet_name(sheet_name, 1)), max_rows - 1
+            ws.append(header)
+        for row in _xlsx_rows(batch):
+            if not room:
+                ws, room = wb.create_sheet(xlsx_sheet_name(sheet_name, len(wb.worksheets) + 1)), max_rows - 1
+                ws.append(header)
+            ws.append(row)
+            room -= 1
+        n_rows += len(batch)
+    with _open_dest(dest) as f:
+        wb.save(f)
+    return n_rows
+
+
+def xlsx_sheet_name(sheet_name, number):
+    """Nom de la feuille n° `number` (1 = `sheet_name`), limité aux 31 caractères Excel."""
+    if number == 1:
+        return sheet_name[:31]
+    suffix = f"_{number}"
+    return sheet_name[:31 - len(suffix)] + suffix
+
+
+def xlsx_sheet_count(n_rows, max_rows=XLSX_MAX_ROWS):
+    """Nb de feuilles écrites par write_xlsx pour `n_rows` lignes (hors en-tête)."""
+    return max(1, -(-n_rows // (max_rows - 1)))
+
+
+# ---------- Export CSV ----------
+# Sérialisation colonne par colonne, octet pour octet identique à
+# DataFrame.to_csv(sep=";", index=False) : flottants au format repr
+# (20260105.0, 0.25, 1e-05), valeur vide -> champ vide, guillemets seulement
+# autour des textes contenant ';', '"' ou un saut de ligne. Les lignes sont
+# assemblées par blocs de CSV_CHUNK_ROWS et écrites directement en octets.
+# Types non pris en charge (dates, durées…) : le bloc passe par to_csv.
+def _csv_quote(values):
+    """Liste de textes -> mêmes textes, entre guillemets là où to_csv en met."""
+    for i, v in enumerate(values):
+        if ";" in v or '"' in v or "\n" in v:
+            values[i] = '"' + v.replace('"', '""') + '"'
+    return values
+
+
+def _csv_text_python(s):
+    """Colonne -> liste de textes formatés comme to_csv ; None si type non pris en charge."""
+    dtype = s.dtype
+    if isinstance(dtype, np.dtype) and dtype.kind in "fiub":
+        values = s.to_numpy()
+        if dtype == np.float64:
+            out = list(map(repr, values.tolist()))
+        else:
+            out = values.astype(str).tolist()
+        if dtype.kind == "f":
+            for i in np.flatnonzero(np.isnan(values)):
+                out[i] = ""
+        return out
+    if dtype.kind in "mMc" or pd.api.types.is_float_dtype(dtype) or isinstance(
+            dtype, (pd.DatetimeTZDtype, pd.PeriodDtype, pd.IntervalDtype)):
+        return None
+    if isinstance(dtype, pd.CategoricalDtype) and not pd.api.types.is_string_dtype(dtype.categories):
+        return None
+    out = [("" if v is None else str(v)) for v in s.to_numpy(dtype=object, na_value=None)]
+    return out if pd.api.types.is_integer_dtype(dtype) or pd.api.types.is_bool_dtype(dtype) else _csv_quote(out)
+
+
+def _csv_float_arrow(values):
+    """float64 -> textes repr, via la conversion Arrow (repr Python pour les cas où elle diffère)."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    text = pc.cast(pa.array(values, from_pandas=True), pa.string())
+    absv = np.abs(values)
+    # Arrow écrit 1e+16 / 1.5e-05 / 20260105 autrement que repr : notation
+    # scientifique et très petites ou très grandes valeurs -> repr ; entiers -> ".0"
+    with np.errstate(invalid="ignore"):
+        slow = (pc.match_substring(text.fill_null(""), "e").to_numpy(zero_copy_only=False)
+                | ((absv < 1e-4) & (values != 0)) | (absv >= 1e16))
+        integral = ~slow & (values == np.floor(values))
+    text = pc.if_else(integral, pc.binary_join_element_wise(text, ".0", ""), text)
+    if slow.any():
+        idx  = np.flatnonzero(slow)
+        text = pc.replace_with_mask(text, slow, pa.array(list(map(repr, values[idx].tolist())), pa.string()))
+    return text.fill_null("")
+
+
+def _arrow_contiguous(arr):
+    """Colonne Arrow en plusieurs morceaux (résultat d'un pd.concat…) -> un seul tableau."""
+    return arr.combine_chunks() if hasattr(arr, "combine_chunks") else arr
+
+
+def _csv_text_arrow(s):
+    """Colonne -> tableau Arrow de textes formatés comme to_csv ; None si type non pris en charge."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    dtype = s.dtype
+    if dtype == np.float64:
+        return _csv_float_arrow(s.to_numpy())
+    if isinstance(dtype, pd.StringDtype):
+        text = _arrow_contiguous(pa.array(s, from_pandas=True).cast(pa.string()).fill_null(""))
+        quote = pc.match_substring_regex(text, '[;"\n]')
+        if pc.any(quote).as_py():
+            quoted = pc.binary_join_element_wise('"', pc.replace_substring(text, '"', '""'), '"', "")
+            text = pc.if_else(quote, quoted, text)
+        return text
+    if pd.api.types.is_integer_dtype(dtype) and not isinstance(dtype, pd.CategoricalDtype):
+        return _arrow_contiguous(pc.cast(pa.array(s, from_pandas=True), pa.string()).fill_null(""))
+    text = _csv_text_python(s)
+    return None if text is None else pa.array(text, pa.string())
 
 
-def to_xlsx_bytes(df, sheet_name="tariff"):
+def _csv_chunk_python(chunk):
+    columns = [_csv_text_python(chunk[c]) for c in chunk.columns]
+    if any(c is None for c in columns):
+        return None
+    return "".join([line + "\n" for line in map(";".join, zip(*columns))]).encode("utf-8")
+
+
+def _csv_chunk_arrow(chunk):
+    import pyarrow.compute as pc
+
+    columns = [_csv_text_arrow(chunk[c]) for c in chunk.columns]
+    if any(c is None for c in columns):
+        return None
+    lines = _arrow_contiguous(pc.binary_join_element_wise(pc.binary_join_element_wise(*columns, ";"), "", "\n"))
+    # Octets des lignes mises bout à bout = tampon de données du tableau Arrow
+    offsets = np.frombuffer(lines.buffers()[1], dtype=np.int32)[lines.offset:lines.offset + len(lines) + 1]
+    return memoryview(lines.buffers()[2])[offsets[0]:offsets[-1]]
+
+
+def _csv_engine(engine):
+    if engine not in CSV_ENGINES:
+        raise ValueError(f"Moteur CSV inconnu : {engine!r} (attendu : {', '.join(CSV_ENGINES)})")
+    if engine == "auto":
+        return "pyarrow" if columnar_available() else "python"
+    if engine == "pyarrow":
+        _pyarrow()
+    return engine
+
+
+@timed("export.csv")
+def write_csv(data, dest, engine="auto", chunk_rows=CSV_CHUNK_ROWS):
+    """
+    Écrit un DataFrame ou un itérable de lots en CSV (';', UTF-8 BOM).
+    `dest` : chemin ou fichier binaire. Les lignes sont sérialisées par blocs
+    de `chunk_rows` et écrites au fil de l'eau ; l'en-tête n'est écrit qu'une fois.
+    `engine` : "pyarrow" (formatage vectoriel), "python", "pandas" (to_csv) ou
+    "auto" (pyarrow s'il est installé) — même fichier, octet pour octet.
+    Retourne le nombre de lignes écrites (hors en-tête).
+    """
+    engine = _csv_engine(engine)
+    chunk_csv = {"pyarrow": _csv_chunk_arrow, "python": _csv_chunk_python}.get(engine)
+    n_rows = 0
+    with _open_dest(dest) as f:
+        f.write(codecs.BOM_UTF8)
+        for i, batch in enumerate(_as_batches(data)):
+            # Une seule colonne : to_csv écrit "" pour une valeur vide
+            if chunk_csv is None or len(batch.columns) < 2:
+                f.write(batch.to_csv(index=False, sep=";", header=(i == 0)).encode("utf-8"))
+                n_rows += len(batch)
+                continue
+            if i == 0:
+                f.write((";".join(_csv_quote([str(c) for c in batch.columns])) + "\n").encode("utf-8"))
+            for start in range(0, len(batch), chunk_rows):
+                chunk = batch.iloc[start:start + chunk_rows]
+                out = chunk_csv(chunk)
+                f.write(out if out is not None else chunk.to_csv(index=False, sep=";", header=False).encode("utf-8"))
+            n_rows += len(batch)
+    return n_rows
+
+
+def spooled_export(data, fmt, max_size=SPOOL_MAX_BYTES):
+    """
+    Exporte vers un fichier temporaire "spooled" (en mémoire jusqu'à `max_size`
+    octets, puis sur disque) et le retourne rembobiné, prêt à être lu.
+    `fmt` : "csv", "xlsx", "parquet" ou "feather" (compression par défaut).
+    """
+    writers = {"csv": write_csv, "xlsx": write_xlsx, "parquet": write_parquet, "feather": write_feather}
+    if fmt not in writers:
+        raise ValueError(f"Format inconnu : {fmt!r} (attendu : {', '.join(writers)})")
+    tmp = tempfile.SpooledTemporaryFile(max_size=max_size, mode="w+b")
+    writers[fmt](data, tmp)
+    tmp.seek(0)
+    return tmp
+
+
+def to_xlsx_bytes(df, sheet_name="tariff", max_rows=XLSX_MAX_ROWS):
     """
     Sérialise un DataFrame en classeur xlsx (bytes).
     Utilise le mode streaming d'openpyxl (write_only) : ~40 % plus rapide
     et bien moins gourmand en mémoire que pandas.to_excel sur gros volumes.
+    Accepte aussi un itérable de lots (ex: iter_tarif_batches). Au-delà de
+    la limite Excel, les lignes sont réparties sur plusieurs feuilles (write_xlsx).
     """
-    from openpyxl import Workbook
+    bio = io.BytesIO()
+    write_xlsx(df, bio, sheet_name, max_rows)
+    return bio.getvalue()
 
-    wb = Workbook(write_only=True)
-    ws = wb.create_sheet(sheet_name)
-    ws.append(list(df.columns))
-    for row in df.itertuples(index=False, name=None):
-        ws.append(list(row))
+
+def to_csv_bytes(df, engine="auto"):
+    """
+    Sérialise un DataFrame en CSV (bytes) — séparateur ';', UTF-8 BOM (Excel-friendly).
+    Accepte aussi un itérable de lots (ex: iter_tarif_batches) : en-tête écrit une fois.
+    `engine` : voir write_csv.
+    """
+    bio = io.BytesIO()
+    write_csv(df, bio, engine)
+    return bio.getvalue()
+
+
+# ---------- Export colonnaire (Parquet / Feather) ----------
+# Formats binaires typés, relus en une fraction de seconde par les traitements
+# en aval (pd.read_parquet / pd.read_feather). Nécessitent pyarrow (dépendance
+# optionnelle) ; les lots (iter_tarif_batches) sont écrits au fil de l'eau.
+PARQUET_COMPRESSIONS = ("zstd", "snappy", "gzip", "brotli", "lz4", "none")
+FEATHER_COMPRESSIONS = ("zstd", "lz4", "none")
+
+
+def columnar_available():
+    """True si pyarrow est installé (exports Parquet / Feather possibles)."""
+    return _string_dtype() is not None
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("Les exports Parquet / Feather nécessitent pyarrow (pip install pyarrow).") from None
+    return pyarrow
+
+
+def _columnar_frame(df):
+    """
+    Types conservés à l'export colonnaire : taux / prix en float (même vides),
+    Date du prix (AAAAMMJJ) en datetime — date invalide ou vide -> valeur nulle.
+    """
+    types = {c: "float64" for c in ("Prix tarif", "Prix net", "Poids kg", "Taux de remise") if c in df.columns}
+    out = df.astype(types)
+    if "Date du prix" in out.columns:
+        out["Date du prix"] = pd.to_datetime(
+            out["Date du prix"].astype("Int64").astype("string"), format="%Y%m%d", errors="coerce"
+        )
+    return out
+
+
+def _arrow_tables(data):
+    """DataFrame ou lots -> tables Arrow de même schéma (Date du prix en date32)."""
+    pa = _pyarrow()
+    schema = None
+    for batch in _as_batches(data):
+        table = pa.Table.from_pandas(_columnar_frame(batch), preserve_index=False)
+        i = table.schema.get_field_index("Date du prix")
+        if i >= 0:
+            table = table.set_column(i, pa.field("Date du prix", pa.date32()), table.column(i).cast(pa.date32()))
+        # Schéma du 1er lot imposé aux suivants (colonne entièrement vide d'un lot, etc.)
+        schema = schema or table.schema
+        yield table.cast(schema)
+
+
+@timed("export.parquet")
+def write_parquet(data, dest, compression="zstd", compression_level=None):
+    """
+    Écrit un DataFrame ou un itérable de lots en Parquet (un groupe de lignes
+    par lot). `dest` : chemin ou fichier binaire ; `compression` : voir
+    PARQUET_COMPRESSIONS. Retourne le nombre de lignes écrites.
+    """
+    if compression not in PARQUET_COMPRESSIONS:
+        raise ValueError(f"Compression inconnue : {compression!r} (attendu : {', '.join(PARQUET_COMPRESSIONS)})")
+    import pyarrow.parquet as pq
+
+    n_rows, writer = 0, None
+    with _open_dest(dest) as f:
+        try:
+            for table in _arrow_tables(data):
+                if writer is None:
+                    writer = pq.ParquetWriter(f, table.schema, compression=compression,
+                                              compression_level=compression_level)
+                writer.write_table(table)
+                n_rows += table.num_rows
+        finally:
+            if writer is not None:
+                writer.close()
+    return n_rows
+
+
+@timed("export.feather")
+def write_feather(data, dest, compression="zstd"):
+    """
+    Écrit un DataFrame ou un itérable de lots en Feather v2 (fichier Arrow IPC).
+    `dest` : chemin ou fichier binaire ; `compression` : voir FEATHER_COMPRESSIONS.
+    Retourne le nombre de lignes écrites.
+    """
+    if compression not in FEATHER_COMPRESSIONS:
+        raise ValueError(f"Compression inconnue : {compression!r} (attendu : {', '.join(FEATHER_COMPRESSIONS)})")
+    pa = _pyarrow()
+    options = pa.ipc.IpcWriteOptions(compression=None if compression == "none" else compression)
+
+    n_rows, writer = 0, None
+    with _open_dest(dest) as f:
+        try:
+            for table in _arrow_tables(data):
+                if writer is None:
+                    writer = pa.ipc.new_file(f, table.schema, options=options)
+                writer.write_table(table)
+                n_rows += table.num_rows
+        finally:
+            if writer is not None:
+                writer.close()
+    return n_rows
+
+
+def to_parquet_bytes(df, compression="zstd"):
+    """Sérialise un DataFrame (ou des lots) en Parquet (bytes). Voir write_parquet."""
     bio = io.BytesIO()
-    wb.save(bio)
+    write_parquet(df, bio, compression)
     return bio.getvalue()
 
 
-def to_csv_bytes(df):
-    """Sérialise un DataFrame en CSV (bytes) — séparateur ';', UTF-8 BOM (Excel-friendly)."""
-    return df.to_csv(index=False, sep=";").encode("utf-8-sig")
+def to_feather_bytes(df, compression="zstd"):
+    """Sérialise un DataFrame (ou des lots) en Feather (bytes). Voir write_feather."""
+    bio = io.BytesIO()
+    write_feather(df, bio, compression)
+    return bio.getvalue()
@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+"""Les modules de l'application sont à la racine du dépôt (pas de package)."""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+Tests de la persistance des mappings (mapping_store).
+Le backend GitHub est testé contre un serveur HTTP local qui imite l'API
+contents (GET avec ETag / If-None-Match, PUT avec contrôle du sha).
+"""
+
+import base64
+import hashlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import mapping_store as ms
+
+pytest.importorskip("requests")
+
+LEGACY = {"purchase_order": "PO", "vendor_ref": "Ref", "description": "Desc", "quantite": "Qty"}
+
+
+# ==================== SERVEUR DE SUBSTITUTION ====================
+class ContentsAPI:
+    """État du fichier distant et compteurs des requêtes reçues."""
+
+    def __init__(self):
+        self.content   = None       # octets du fichier, None = 404
+        self.sha       = None
+        self.conflict  = 409        # statut renvoyé pour un sha périmé
+        self.fail_puts = 0          # nb de PUT à faire échouer (502)
+        self.statuses  = []         # (méthode, statut) de chaque réponse
+
+    def set(self, doc):
+        self.content = json.dumps(doc).encode("utf-8")
+        self.sha     = hashlib.sha1(self.content).hexdigest()
+
+    def document(self):
+        return json.loads(self.content)
+
+
+def _handler(api):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, body=None, headers=()):
+            api.statuses.append((self.command, status))
+            data = json.dumps(body).encode("utf-8") if body is not None else b""
+            self.send_response(status)
+            for key, value in headers:
+                self.send_header(key, value)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if api.content is None:
+                return self._send(404, {"message": "Not Found"})
+            etag = f'"{api.sha}"'
+            if self.headers.get("If-None-Match") == etag:
+                return self._send(304)
+            body = {"content": base64.b64encode(api.content).decode(), "sha": api.sha}
+            self._send(200, body, [("ETag", etag)])
+
+        def do_PUT(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            if api.fail_puts:
+                api.fail_puts -= 1
+                return self._send(502, {"message": "Bad Gateway"})
+            if api.content is not None and body.get("sha") != api.sha:
+                return self._send(api.conflict, {"message": "sha mismatch"})
+            api.content = base64.b64decode(body["content"])
+            api.sha     = hashlib.sha1(api.content).hexdigest()
+            self._send(200, {"content": {"sha": api.sha}})
+
+    return Handler
+
+
+@pytest.fixture
+def api():
+    state  = ContentsAPI()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _handler(state))
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    state.url = f"http://127.0.0.1:{server.server_address[1]}"
+    yield state
+    server.shutdown()
+    server.server_close()
+
+
+def github_store(api, **kwargs):
+    kwargs.setdefault("backoff", 0.01)
+    return ms.GitHubMappingStore("org/repo", "mapping_saved.json", "token", api_url=api.url, **kwargs)
+
+
+# ==================== BACKEND GITHUB ====================
+def test_github_legacy_flat_mapping(api):
+    api.set(LEGACY)
+    store = github_store(api)
+    assert store.get(ms.DEFAULT_SUPPLIER, ms.DEFAULT_NAME) == LEGACY
+
+
+def test_github_missing_file_is_empty(api):
+    assert github_store(api).mappings("KUH") == {}
+
+
+def test_github_refresh_not_modified(api):
+    api.set({"version": 2, "fournisseurs": {"KUH": {"A": {"vendor_ref": "Ref"}}}})
+    store = github_store(api)
+    assert store.get("KUH", "A") == {"vendor_ref": "Ref"}
+    assert store.refresh()
+    assert api.statuses[-1] == ("GET", 304)
+    assert store.get("KUH", "A") == {"vendor_ref": "Ref"}
+
+
+def test_github_save_is_cached_then_written(api):
+    api.set(LEGACY)
+    store  = github_store(api)
+    future = store.save(408, "format A", {"vendor_ref": "X"})
+    assert store.get("408", "format A") == {"vendor_ref": "X"}
+    assert future.result(5)
+    doc = api.document()
+    assert doc["fournisseurs"]["408"]["format A"] == {"vendor_ref": "X"}
+    assert doc["fournisseurs"][ms.DEFAULT_SUPPLIER][ms.DEFAULT_NAME] == LEGACY
+
+
+@pytest.mark.parametrize("status", [409, 422])
+def test_github_conflict_replays_pending_changes(api, status):
+    api.set({"version": 2, "fournisseurs": {}})
+    api.conflict = status
+    store = github_store(api)
+    store.mappings("KUH")                                   # sha chargé
+    github_store(api).save("AUT", "x", {"a": 1}).result(5)  # écriture concurrente
+
+    assert store.save("KUH", "B", {"vendor_ref": "Y"}).result(5)
+    assert ("PUT", status) in api.statuses
+    assert api.document()["fournisseurs"] == {"AUT": {"x": {"a": 1}}, "KUH": {"B": {"vendor_ref": "Y"}}}
+    assert store.last_error is None
+
+
+def test_github_transient_errors_are_retried(api):
+    api.set({"version": 2, "fournisseurs": {}})
+    store = github_store(api, retries=3)
+    api.fail_puts = 2
+    assert store.save("KUH", "A", {"v": 1}).result(5)
+    assert [s for m, s in api.statuses if m == "PUT"] == [502, 502, 200]
+    assert api.document()["fournisseurs"]["KUH"] == {"A": {"v": 1}}
+
+
+def test_github_gives_up_after_retries(api):
+    api.set({"version": 2, "fournisseurs": {}})
+    store = github_store(api, retries=2)
+    api.fail_puts = 10
+    assert not store.save("KUH", "A", {"v": 1}).result(5)
+    assert [s for m, s in api.statuses if m == "PUT"] == [502, 502, 502]
+    assert "502" in store.last_error
+    # L'écriture abandonnée n'apparaît plus, y compris après relecture (304)
+    assert store.mappings("KUH") == {}
+    assert store.refresh()
+    assert store.mappings("KUH") == api.document()["fournisseurs"].get("KUH", {}) == {}
+
+
+def test_github_give_up_keeps_other_pending_changes(api):
+    api.set({"version": 2, "fournisseurs": {"AUT": {"x": {"a": 1}}}})
+    store = github_store(api, retries=0)
+    api.fail_puts = 1
+    failed = store.save("KUH", "A", {"v": 1})
+    kept   = store.save("KUH", "B", {"v": 2})
+    assert not failed.result(5)
+    assert kept.result(5)
+    assert store.mappings("KUH") == {"B": {"v": 2}}
+    assert api.document()["fournisseurs"] == {"AUT": {"x": {"a": 1}}, "KUH": {"B": {"v": 2}}}
+
+
+# ==================== BACKEND LOCAL ====================
+def test_local_legacy_and_numeric_supplier(tmp_path):
+    path = tmp_path / "mapping_saved.json"
+    path.write_text(json.dumps(LEGACY), encoding="utf-8")
+    store = ms.LocalMappingStore(path)
+    assert store.get(ms.DEFAULT_SUPPLIER) == LEGACY
+
+    assert store.save(408, "A", {"v": 1}).result()
+    reloaded = ms.LocalMappingStore(path)
+    assert reloaded.mappings(408) == {"A": {"v": 1}}
+    assert reloaded.get(ms.DEFAULT_SUPPLIER) == LEGACY
+
+    assert reloaded.delete("408", "A").result()
+    assert ms.LocalMappingStore(path).mappings(408) == {}
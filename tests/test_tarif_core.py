@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""Tests du moteur des tarifs CNH (tarif_core)."""
+
+import codecs
+import io
+import os
+
+import pandas as pd
+import pytest
+
+import tarif_core as tc
+from benchmarks import datagen
+
+
+def _reference_csv(df):
+    """Export CSV de référence : ce qu'ouvrent aujourd'hui les utilisateurs Excel."""
+    return codecs.BOM_UTF8 + df.to_csv(index=False, sep=";").encode("utf-8")
+
+
+# ==================== EXPORT CSV ====================
+CSV_ENGINES = [e for e in ("python", "pyarrow") if e != "pyarrow" or tc.columnar_available()]
+
+
+@pytest.fixture(scope="module")
+def two_tarifs():
+    old = datagen.cnh_tarif_text(2000, seed=1)
+    new = datagen.cnh_tarif_text(2000, seed=2)
+    return old, new
+
+
+@pytest.mark.parametrize("engine", CSV_ENGINES)
+def test_csv_concat_frame(engine, two_tarifs):
+    # Colonnes Arrow en plusieurs morceaux (mode « Tous cumulé »)
+    df = pd.concat([tc.parse_tarif_txt(t, engine="columnar") for t in two_tarifs], ignore_index=True)
+    df.loc[3, "Description Pièces"] = 'A;B "x"'
+    df.loc[4, "Description Pièces"] = "ligne\ncoupée"
+    assert tc.to_csv_bytes(df, engine) == _reference_csv(df)
+
+
+@pytest.mark.parametrize("engine", CSV_ENGINES)
+def test_csv_diff_frame(engine, two_tarifs):
+    old, new = (t.encode("utf-8") for t in two_tarifs)
+    diff = tc.diff_tarifs(old, new)
+    assert tc.to_csv_bytes(diff, engine) == _reference_csv(diff)
+
+
+@pytest.mark.parametrize("engine", CSV_ENGINES)
+def test_csv_batches_match_whole_file(engine, two_tarifs):
+    # Lots de 300 lignes, dont certains sans valeur vide dans une colonne
+    text = two_tarifs[0]
+    whole = tc.parse_tarif_txt(text, engine="columnar")
+    batches = tc.iter_tarif_batches(io.BytesIO(text.encode("utf-8")), batch_rows=300, chunk_bytes=4096)
+    assert tc.to_csv_bytes(batches, engine) == _reference_csv(whole)
+
+
+@pytest.mark.parametrize("engine", CSV_ENGINES)
+def test_csv_batches_without_blanks(engine):
+    # Aucune valeur vide dans tout le fichier : entiers écrits sans « .0 »
+    text = "\n".join(_line(f"5{i:03d}", prix=str(i), qte=str(i % 4)) for i in range(50))
+    whole = tc.parse_tarif_txt(text, engine="columnar")
+    batches = tc.iter_tarif_batches(io.BytesIO(text.encode("utf-8")), batch_rows=7)
+    out = tc.to_csv_bytes(batches, engine)
+    assert out == tc.to_csv_bytes(whole, engine) == _reference_csv(whole)
+    assert b";20260105;" in out and b"20260105.0" not in out
+
+
+# ==================== EXPORT XLSX ====================
+@pytest.mark.parametrize("n_rows, sheets", [(12, 3), (8, 2), (3, 1), (0, 1)])
+def test_xlsx_split_over_sheets(n_rows, sheets):
+    openpyxl = pytest.importorskip("openpyxl")
+    df = pd.DataFrame({"Référence pièce": [f"R{i}" for i in range(n_rows)], "Prix tarif": range(n_rows)})
+    bio = io.BytesIO()
+    # Lots de 5 lignes : les changements de feuille tombent au milieu d'un lot
+    batches = [df.iloc[i:i + 5] for i in range(0, n_rows, 5)] or [df]
+    assert tc.write_xlsx(batches, bio, sheet_name="t" * 40, max_rows=5) == n_rows
+    assert tc.xlsx_sheet_count(n_rows, max_rows=5) == sheets
+
+    wb = openpyxl.load_workbook(io.BytesIO(bio.getvalue()), read_only=True)
+    assert wb.sheetnames == ["t" * 31] + [f"{'t' * 29}_{k}" for k in range(2, sheets + 1)]
+    rows = []
+    for ws in wb.worksheets:
+        header, *data = ws.iter_rows(values_only=True)
+        assert header == ("Référence pièce", "Prix tarif")
+        assert 0 < len(data) <= 4 or n_rows == 0
+        rows += data
+    assert rows == list(df.itertuples(index=False, name=None))
+
+
+# ==================== MOTEURS DE DÉCOUPAGE ====================
+def _line(ref, prix="", poids="", qte="", date="20260105", remise="A", mpc="12345", desc="PIECE"):
+    """Ligne de tarif CNH en largeur fixe (champs complétés / tronqués à leur largeur)."""
+    values = [ref, desc, "A", "X", date, prix, poids, qte, "ABCD", remise, "P1234", mpc, "Y", "001"]
+    widths = [b - a for a, b in zip(tc.OFFSETS, tc.OFFSETS[1:])] + [3]
+    return "".join(str(v).ljust(w)[:w] for v, w in zip(values, widths))
+
+
+HEADER = f"{tc.HEADER_PREFIX}_FR20260105"
+
+EDGE_LINES = [
+    # Signe, "_", espaces internes, chiffres non ASCII (int() les accepte)
+    _line("1001", prix="+12345", poids="-250", qte="-3"),
+    _line("1002", prix="1_234_5", poids="12 34", qte="_7"),
+    _line("1003", prix="١٢٣٤٥", poids="１２３", qte="٣", mpc="٠٠١٢٣"),
+    _line("1004", prix="12a34", poids="x", qte="--", date="2026-01-05", mpc="AB1"),
+    _line("1005", prix="", poids="", qte="", date="", mpc=""),
+    _line("1006", desc="DÉSIGNATION ÉTÉ ÀÇ"),
+    _line("1007", prix="99999999999"),
+] + [
+    # Demi-centimes : Prix tarif impair * (1 - 0,50) -> arrondi round() Python
+    _line(f"2{i:03d}", prix=str(i), remise=code) for i in range(1, 400, 2) for code in ("A", "H")
+]
+
+ENGINE_CASES = {
+    "synthetic":   datagen.cnh_tarif_text(3000, seed=3),
+    "edge_cases":  "\r\n".join([HEADER] + EDGE_LINES) + "\r\n",
+    "empty":       "",
+    "blank_lines": "\n\n  \n",
+    "header_only": HEADER + "\r\n",
+    "no_remise":   "\n".join(_line(f"3{i:03d}", prix=str(i), remise="?") for i in range(20)),
+    "partial_nulls": "\n".join([_line("4001", qte="5"), _line("4002", qte="")]),
+}
+
+
+@pytest.mark.parametrize("case", ENGINE_CASES)
+def test_engines_equivalent(case):
+    text = ENGINE_CASES[case]
+    expected = tc.parse_tarif_txt(text, engine="python")
+    pd.testing.assert_frame_equal(tc.parse_tarif_txt(text, engine="columnar"), expected)
+    assert (expected.dtypes[tc.NULLABLE_INT_COLS] == "Int64").all()
+
+
+def test_edge_cases_values():
+    df = tc.parse_tarif_txt("\n".join(EDGE_LINES[:3]), engine="columnar").set_index("Référence pièce")
+    assert df.loc["1001", "Prix tarif"] == 123.45
+    assert df.loc["1001", "Poids kg"] == -0.25
+    assert df.loc["1002", "Prix tarif"] == 123.45
+    assert df.loc["1003", "Prix tarif"] == 123.45
+    assert df.loc["1003", "Famille Mistral"] == "123"
+
+
+REFS_CASES = {
+    "synthetic": ENGINE_CASES["synthetic"].encode("utf-8"),
+    "edge_cases": ENGINE_CASES["edge_cases"].encode("utf-8"),
+    "crlf": ENGINE_CASES["edge_cases"].replace("\n", "\r\n").encode("utf-8"),
+    "lone_cr": ("\r".join(EDGE_LINES[:4])).encode("utf-8"),
+    "unicode_breaks": "\u2028".join(EDGE_LINES[:3]).encode("utf-8") + "\x85 R9\n".encode("utf-8"),
+    "form_feed": "\x0c".join(EDGE_LINES[:3]).encode("utf-8"),
+    "special_refs": b"\n".join([
+        _line("RÉF-ÀÇ").encode("utf-8"),                     # multi-octets : champ de 18 caractères
+        _line("\x1fR1\x1f").encode("utf-8"),                # \x1f retiré par str.strip
+        b"R2\x00" + _line("")[3:].encode("utf-8"),          # NUL conservé
+        b"\xffR3" + _line("")[3:].encode("utf-8"),          # UTF-8 invalide
+        b"R4-TRES-LONGUE-REFERENCE-XYZ" + b" " * 80,
+        b"   ", b"R5", b"",
+        f"{HEADER}".encode("utf-8"),
+    ]),
+    "no_trailing_newline": _line("R6").encode("utf-8"),
+    "empty": b"",
+}
+
+
+@pytest.mark.parametrize("case", REFS_CASES)
+def test_tarif_refs_bytes_match_text(case, monkeypatch):
+    monkeypatch.setattr(tc, "REFS_CHUNK_LINES", 3)
+    raw = REFS_CASES[case]
+    assert tc.tarif_refs(raw) == tc.tarif_refs(raw.decode("utf-8", errors="replace"))
+
+
+def test_parallel_matches_serial(two_tarifs):
+    # Processus démarrés en forkserver/spawn : _parse_range doit rester importable
+    text = two_tarifs[0].encode("utf-8")
+    expected = tc.parse_tarif_txt(text.decode("utf-8"), engine="python")
+    got = tc.parse_tarif_parallel(text, workers=2, engine="python", min_bytes=0)
+    pd.testing.assert_frame_equal(got, expected)
+
+
+# ==================== CACHE DISQUE ====================
+needs_pyarrow = pytest.mark.skipif(not tc.columnar_available(), reason="pyarrow non installé")
+
+
+@needs_pyarrow
+def test_cache_roundtrip_private_dir(tmp_path):
+    raw = ENGINE_CASES["synthetic"].encode("utf-8")
+    cache_dir = tmp_path / "cache"
+    first = tc.parse_tarif_cached(raw, cache_dir=cache_dir)
+    files = list(cache_dir.glob("*.feather"))
+    assert len(files) == 1
+    assert cache_dir.stat().st_mode & 0o777 == 0o700 or not hasattr(os, "getuid")
+    pd.testing.assert_frame_equal(tc.parse_tarif_cached(raw, cache_dir=cache_dir), first)
+    pd.testing.assert_frame_equal(first, tc.parse_tarif_txt(raw.decode("utf-8"), engine="columnar"))
+
+
+@needs_pyarrow
+@pytest.mark.parametrize("content", [b"", b"garbage", b"\x80\x04\x95 pickle"])
+def test_cache_unreadable_entry_is_a_miss(tmp_path, content):
+    raw = ENGINE_CASES["edge_cases"].encode("utf-8")
+    (tmp_path / f"{tc.cache_key(raw)}.feather").write_bytes(content)
+    df = tc.parse_tarif_cached(raw, cache_dir=tmp_path)
+    pd.testing.assert_frame_equal(df, tc.parse_tarif_txt(raw.decode("utf-8"), engine="columnar"))
+    pd.testing.assert_frame_equal(pd.read_feather(tmp_path / f"{tc.cache_key(raw)}.feather"), df)
+
+
+@pytest.mark.skipif(not hasattr(os, "getuid"), reason="droits POSIX")
+def test_cache_shared_dir_is_made_private(tmp_path):
+    shared = tmp_path / "shared"
+    shared.mkdir(mode=0o777)
+    os.chmod(shared, 0o777)
+    assert tc._private_dir(shared)
+    assert shared.stat().st_mode & 0o777 == 0o700
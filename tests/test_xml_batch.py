@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""Traitement par lots : noms des XML écrits (xml_batch)."""
+
+import pytest
+
+import xml_batch
+from benchmarks import datagen
+
+
+def test_writer_distinct_names_are_not_prefixed(tmp_path):
+    writer = xml_batch.OutputWriter(tmp_path)
+    writer.write("a/cmd1.xlsx", [("IN_TRANS_1KUH1.xml", b"1")])
+    writer.write("a/cmd2.xlsx", [("IN_TRANS_2KUH1.xml", b"2")])
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["IN_TRANS_1KUH1.xml", "IN_TRANS_2KUH1.xml"]
+
+
+def test_writer_collision_prefixes_every_source(tmp_path):
+    writer = xml_batch.OutputWriter(tmp_path)
+    writer.write("a/cmd1.xlsx", [("IN_TRANS_1KUH1.xml", b"premier"), ("IN_TRANS_1KUH2.xml", b"seul")])
+    written = writer.write("a/cmd2.xlsx", [("IN_TRANS_1KUH1.xml", b"second")])
+    writer.write("a/cmd3.xlsx", [("IN_TRANS_1KUH1.xml", b"troisieme")])
+
+    assert written == [str(tmp_path / "cmd2_IN_TRANS_1KUH1.xml")]
+    assert {p.name: p.read_bytes() for p in tmp_path.iterdir()} == {
+        "cmd1_IN_TRANS_1KUH1.xml": b"premier",
+        "cmd2_IN_TRANS_1KUH1.xml": b"second",
+        "cmd3_IN_TRANS_1KUH1.xml": b"troisieme",
+        "IN_TRANS_1KUH2.xml":      b"seul",
+    }
+
+
+def test_writer_same_stem_collision_fails(tmp_path):
+    writer = xml_batch.OutputWriter(tmp_path)
+    writer.write("a/cmd.xlsx", [("IN_TRANS_1KUH1.xml", b"a")])
+    with pytest.raises(ValueError, match="cmd_IN_TRANS_1KUH1.xml"):
+        writer.write("b/cmd.xlsx", [("IN_TRANS_1KUH1.xml", b"b")])
+    assert (tmp_path / "IN_TRANS_1KUH1.xml").read_bytes() == b"a"
+
+
+def test_run_keeps_both_files_sharing_a_po(tmp_path):
+    data = datagen.write_dataset(tmp_path / "data", 200, 20)
+    paths = {p.name: p for p in data}
+    copy = tmp_path / "data" / "copie.xlsx"
+    copy.write_bytes(paths["purchase_A.xlsx"].read_bytes())
+    out = tmp_path / "out"
+    out.mkdir()
+    ctx = xml_batch.load_context(paths["infos.xlsx"], paths["stock.csv"], paths["tarif.txt"], out)
+
+    failures = xml_batch.run([str(paths["purchase_A.xlsx"]), str(copy)], ctx, workers=1)
+
+    names = sorted(p.name for p in out.iterdir())
+    assert failures == 0
+    assert len(names) == 4
+    assert [n.removeprefix("copie_") for n in names[:2]] == [n.removeprefix("purchase_A_") for n in names[2:]]
+    assert (out / names[0]).read_bytes() == (out / names[2]).read_bytes()
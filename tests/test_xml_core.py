@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+Tests de la génération des XML de commande (xml_core).
+
+Les fichiers de tests/golden/ ont été produits par la version d'origine de
+create_xml (ElementTree + indent_xml) à partir des entrées ci-dessous : les
+XML agence 00 (UTF-8) et A1 (ISO-8859-1) doivent leur rester identiques à
+l'octet près. Textes avec &, <, > et caractères hors Latin-1 (Ω, “ ”, €) :
+échappement et références de caractères en ISO-8859-1.
+"""
+
+import io
+import os
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+import xml_core as xc
+from benchmarks import datagen
+
+GOLDEN = Path(__file__).parent / "golden"
+
+INFOS = pd.DataFrame({
+    "donnee": ["nomfact", "adr1fact", "paysfact", "villefact", "cpfact", "code_client",
+               "nomadrlivr", "adr1livr", "adr2livr", "payslivr", "villelivr", "cplivr",
+               "emaillivr", "mtport", "mtht", "identifiant", "remise : A", "remise : B"],
+    "valeur": ["Société Dupont & Fils", "1 rue <Haute>", "FR", "Saint-Étienne", "42000", "C001",
+               "Dépôt Ω “Nord”", "ZI > Sud", "", "FR", "Lyon", "69001",
+               "depot@example.com", "0", "12.5", "A&B", "0.3", "0.25"],
+})
+
+TARIF = pd.DataFrame({
+    "Article": ["R1", "R2", "R3", "R<4>", "R5"],
+    "Prix":    [10.0, 2.01, 99.995, 1.005, 0.0],
+    "Remise":  ["A", "B", None, "A", "Z"],
+})
+
+STOCK = pd.DataFrame({"Fournisseur": ["408"] * 3, "Référence Frn": ["R1", "R<4>", "R9"]})
+
+PURCHASE = pd.DataFrame({
+    "_purchase_order": ["4500012345"] * 8,
+    "_vendor_ref":     ["R1", "R2", "R3", "R<4>", "R5", "R9", "HORS&TARIF", "R1"],
+    "_description":    ["Filtre à huile", "Joint <torique> & co", "Écrou “M12”", "Ω-ring 20 €",
+                        "", "Vis TH 10x40", "Pièce 'spéciale'", "Filtre à huile"],
+    "_quantite":       [1.0, 2.5, 10.0, 0.0, 3.0, 1.0, 4.0, 12.0],
+    "_prixvente":      [12.5, 0.99, 100.0, 1.25, 0.0, 3.333, 7.0, 12.5],
+}, index=[0, 1, 2, 3, 4, 5, 6, 9])
+
+
+@pytest.fixture(scope="module")
+def order_xmls():
+    config = xc.compile_infos(INFOS)
+    index  = xc.build_tarif_index(TARIF, config.remises)
+    return xc.generate_order_xmls(PURCHASE, xc.stock_index(STOCK), config, index)
+
+
+@pytest.mark.parametrize("agence", ["00", "A1"])
+def test_order_xml_matches_golden(order_xmls, agence):
+    xml, num = order_xmls[agence]
+    assert num == f"4500012345{xc.AGENCE_SUFFIXES[agence]}"
+    assert xml == (GOLDEN / f"order_{agence}.xml").read_bytes()
+
+
+def test_split_orders_single_po_matches_order_xmls():
+    # Un seul n° de PO (lignes numérotées depuis 0) : mêmes fichiers que generate_order_xmls
+    config   = xc.compile_infos(INFOS)
+    index    = xc.build_tarif_index(TARIF, config.remises)
+    stock    = xc.stock_index(STOCK)
+    purchase = PURCHASE.reset_index(drop=True)
+    files    = xc.generate_split_xmls(purchase, stock, config, index, workers=1)
+    expected = xc.generate_order_xmls(purchase, stock, config, index)
+    assert {name: xml for name, xml, _ in files} == {f"IN_TRANS_{num}.xml": xml for xml, num in expected.values()}
+
+
+MULTI_PO = pd.DataFrame({
+    "_purchase_order": ["PO-A", "PO-B", "PO-A", None, "PO-B", "PO-A"],
+    "_vendor_ref":     ["R1", "R2", "R2", "R1", "R1", "R9"],
+    "_description":    ["a", "b", "c", "d", "e", "f"],
+    "_quantite":       [1.0, 2.0, 3.0, 4.0, 5.0, 6.0],
+    "_prixvente":      [1.0, 2.0, 3.0, 4.0, 5.0, 6.0],
+})
+
+
+def test_split_orders_several_pos():
+    groups = xc.split_orders(MULTI_PO, xc.stock_index(STOCK))
+    # Ordre d'apparition des PO, lignes renumérotées dans chaque PO ; PO vide ignoré
+    assert [(po, agence, data.index.tolist(), data["_description"].tolist())
+            for po, agence, data in groups] == [
+        ("PO-A", "00", [0, 2], ["a", "f"]),
+        ("PO-A", "A1", [1], ["c"]),
+        ("PO-B", "00", [1], ["e"]),
+        ("PO-B", "A1", [0], ["b"]),
+    ]
+
+
+def test_split_xmls_several_pos_match_single_po_files():
+    config = xc.compile_infos(INFOS)
+    index  = xc.build_tarif_index(TARIF, config.remises)
+    stock  = xc.stock_index(STOCK)
+    files  = xc.generate_split_xmls(MULTI_PO, stock, config, index, workers=1)
+    expected = {}
+    for po in ("PO-A", "PO-B"):
+        single = MULTI_PO[MULTI_PO["_purchase_order"] == po].reset_index(drop=True)
+        expected.update({f"IN_TRANS_{num}.xml": xml
+                         for xml, num in xc.generate_order_xmls(single, stock, config, index).values()})
+    assert {name: xml for name, xml, _ in files} == expected
+    assert len(files) == 4
+
+
+# ==================== AGENCES 00 / A1 ====================
+def test_split_agences_partial_quantities():
+    stock = xc.stock_index(pd.DataFrame({
+        "Référence Frn": ["R1", "R2", "R1", "R3"],
+        "Qté":           ["2", "0", "3", "10"],
+    }), qty_col="Qté")
+    purchase = pd.DataFrame({
+        "_vendor_ref": ["R1", "R1", "R1", "R2", "R9", "R3", "R3"],
+        "_quantite":   [3.0, 4.0, 1.0, 2.0, 1.0, 0.0, 10.0],
+    }, index=[10, 11, 12, 13, 14, 15, 16])
+    agence_00, agence_A1 = xc.split_agences(purchase, stock)
+    # R1 : 5 en stock -> 3 + 2 en 00, le reste (2 + 1) en A1 ; ligne 11 répartie
+    assert agence_00["_quantite"].to_dict() == {10: 3.0, 11: 2.0, 15: 0.0, 16: 10.0}
+    assert agence_A1["_quantite"].to_dict() == {11: 2.0, 12: 1.0, 13: 2.0, 14: 1.0}
+    assert purchase["_quantite"].tolist() == [3.0, 4.0, 1.0, 2.0, 1.0, 0.0, 10.0]
+
+
+def test_split_agences_presence_only():
+    agence_00, agence_A1 = xc.split_agences(PURCHASE, xc.stock_index(STOCK))
+    assert agence_00.index.tolist() == [0, 3, 5, 9]
+    assert agence_A1.index.tolist() == [1, 2, 4, 6]
+
+
+# ==================== FICHIER INFOS ====================
+@pytest.mark.parametrize("key", ["identifiant", "code_client"])
+def test_compile_infos_missing_required_key(key):
+    with pytest.raises(ValueError, match=key):
+        xc.compile_infos(INFOS[INFOS["donnee"] != key])
+
+
+def test_compile_infos_requires_a_remise_line():
+    no_remise = INFOS[~INFOS["donnee"].str.startswith("remise")]
+    with pytest.raises(ValueError, match="remise :"):
+        xc.compile_infos(no_remise)
+    assert xc.compile_infos(no_remise, required=()).remises == {}
+
+
+# ==================== INDEX TARIF SUR DISQUE ====================
+def test_evict_indexes_only_removes_index_dirs(tmp_path):
+    for i, name in enumerate(["a" * 64, "b" * 64, "c" * 64, "notes", "A" * 64, "d" * 63]):
+        (tmp_path / name).mkdir()
+        os.utime(tmp_path / name, (i, i))
+    xc._evict_indexes(tmp_path, keep=1)
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted(["c" * 64, "notes", "A" * 64, "d" * 63])
+
+
+@pytest.mark.skipif(not hasattr(os, "getuid"), reason="droits POSIX")
+def test_tarif_store_shared_dir_is_made_private(tmp_path):
+    index_dir = tmp_path / "index"
+    index_dir.mkdir()
+    index_dir.chmod(0o777)
+    path = xc.build_tarif_store(datagen.supplier_tarif_bytes(20), index_dir)
+    assert path.parent == index_dir
+    assert index_dir.stat().st_mode & 0o777 == 0o700
+
+
+def test_tarif_store_unusable_dir_falls_back(tmp_path):
+    blocker = tmp_path / "index"
+    blocker.write_bytes(b"")
+    raw  = datagen.supplier_tarif_bytes(20)
+    path = xc.build_tarif_store(raw, blocker)
+    assert path.parent != blocker and (path / "refs.npy").exists()
+    assert xc.build_tarif_store(raw, blocker) == path
+
+
+# ---------- Lecture du tarif ----------
+def _read_fwf(raw, columns):
+    """Lecture d'origine (pd.read_fwf), sans inférence de type (chaînes)."""
+    tarif = pd.read_fwf(io.BytesIO(raw), colspecs=xc.TARIF_COLSPECS, names=xc.TARIF_COLUMNS,
+                        encoding="latin1", dtype=str)
+    tarif = tarif[tarif["Prix"].str.contains(r"^\d", na=False)].copy()
+    tarif["Prix"] = tarif["Prix"].str.replace(",", ".").astype(float)
+    return tarif[list(columns)].reset_index(drop=True)
+
+
+@pytest.mark.parametrize("columns", [xc.TARIF_USED_COLUMNS, xc.TARIF_COLUMNS])
+def test_read_tarif_matches_read_fwf(columns):
+    raw = datagen.supplier_tarif_bytes(200, seed=4)
+    lines = raw.splitlines()
+    # Ligne vide, ligne courte, prix non numérique, désignation accentuée, champ Remise vide
+    raw += b"\n".join([
+        b"",
+        lines[1][:25],
+        lines[2][:20] + b"PRIX".ljust(10) + lines[2][30:],
+        lines[3][:44] + "DÉSIGNATION ÉTÉ".encode("latin1").ljust(25) + lines[3][69:],
+        lines[4][:30] + b" " * 6 + lines[4][36:],
+    ]) + b"\n"
+    got = xc.read_tarif(raw, columns)
+    pd.testing.assert_frame_equal(got, _read_fwf(raw, columns))
+
+
+def test_tarif_store_matches_tarif_index(tmp_path):
+    raw = datagen.supplier_tarif_bytes(300, seed=3)
+    # Référence en double (la 1re ligne l'emporte) ; code remise C absent de la table
+    raw += raw.splitlines()[5][:20] + b"1,00".ljust(10) + b"C\n"
+    remises = {"A": 0.3, "B": 0.25}
+    index = xc.build_tarif_index(xc.read_tarif(raw), remises)
+    store = xc.tarif_store(raw, remises, tmp_path)
+    refs  = list(index) + ["ABSENTE", ""]
+    assert len(store) == len(index)
+    assert [store.get(r, None) for r in refs] == [index.get(r) for r in refs]
+    assert xc.prix_achat(store, refs) == xc.prix_achat(index, refs)
+    net, found = store.lookup(refs)
+    assert found.tolist() == [True] * len(index) + [False, False]
@@ -5,8 +5,13 @@ Palette Groupe Dubreuil : bleu marine (#003660) + jaune (#FFDD32).
 
 apply_theme()  -> injecte le CSS moderne (à appeler après st.set_page_config)
 page_header()  -> en-tête "hero" stylisé en haut de chaque page
+perf_options() / perf_expander() -> mesures de performance (voir perf.py)
 """
 
+import json
+import os
+
+import pandas as pd
 import streamlit as st
 
 # ---------- Palette Groupe Dubreuil ----------
@@ -130,3 +135,38 @@ def page_header(title: str, subtitle: str = "", icon: str = "🛠️"):
         """,
         unsafe_allow_html=True,
     )
+
+
+# ---------- Mesures de performance ----------
+# Journal JSON (une ligne par traitement mesuré) si la variable PERF_LOG est définie.
+PERF_LOG = os.environ.get("PERF_LOG") or None
+
+
+def perf_options():
+    """Cases de la barre latérale -> (mesure activée, pic mémoire inclus)."""
+    enabled = st.sidebar.checkbox("⏱️ Mesurer les performances", key="perf_enabled")
+    memory = enabled and st.sidebar.checkbox(
+        "Inclure la mémoire (plus lent)", key="perf_memory",
+        help="Pic mémoire par étape via tracemalloc : ralentit sensiblement le traitement.",
+    )
+    return enabled, memory
+
+
+def perf_expander(report, file_name="performance.json"):
+    """Expander "Performance" : tableau des étapes (rapport perf.Recorder) + export JSON."""
+    with st.expander(f"⏱️ Performance — {report['label']} : {report['total_s']:.2f} s"):
+        rows = [
+            {
+                "Étape": "\u2003" * s["depth"] + s["name"],
+                "Durée (s)": s["wall_s"],
+                "CPU (s)": s["cpu_s"],
+                "Pic mémoire (Mo)": s["peak_mb"],
+            }
+            for s in report["spans"]
+        ]
+        st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+        st.download_button(
+            "⬇️ Exporter (JSON)",
+            data=json.dumps(report, ensure_ascii=False, indent=2),
+            file_name=file_name, mime="application/json",
+        )
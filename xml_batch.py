@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+Génération des XML de commande en ligne de commande (sans Streamlit).
+
+Traite un lot de fichiers purchase (dossier ou motifs glob) avec les mêmes
+règles que la page gen_files.py. Les fichiers de référence (infos, stock,
+tarif) sont lus une seule fois ; les fichiers purchase sont traités en
+parallèle par un pool de processus. Si deux fichiers purchase produisent le
+même nom de XML (même n° de PO), leurs sorties sont préfixées par le nom du
+fichier source au lieu de s'écraser.
+
+Exemple :
+    python -m xml_batch --infos infos.xlsx --stock stock.csv --tarif tarif.txt \\
+        --out sortie/ commandes/*.xlsx
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import xml_core as xc
+from mapping_store import DEFAULT_NAME, DEFAULT_SUPPLIER, LocalMappingStore
+
+# Contexte partagé par les processus du pool (fichiers de référence déjà préparés)
+_CTX = None
+
+
+def _init_worker(ctx):
+    global _CTX
+    _CTX = ctx
+
+
+def expand_inputs(patterns):
+    """Dossiers -> fichiers .xlsx qu'ils contiennent ; autres entrées -> motifs glob."""
+    files = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            files.extend(sorted(str(p) for p in Path(pattern).glob("*.xlsx")))
+        else:
+            files.extend(sorted(glob.glob(pattern)))
+    return list(dict.fromkeys(files))
+
+
+def load_context(infos_path, stock_path, tarif_path, out_dir, mapping=None, split_orders=False,
+                 fournisseur=None, stock_qty=None):
+    """
+    Lit et prépare une fois pour toutes les fichiers de référence.
+    `fournisseur` / `stock_qty` : voir xml_core.stock_index.
+    """
+    infos = xc.compile_infos(xc.read_infos(infos_path))
+    return {
+        "infos":       infos,
+        "stock":       xc.load_stock_index(stock_path, fournisseur, stock_qty),
+        # Index sur disque : reconstruit seulement si le tarif a changé ;
+        # transmis aux processus par son chemin (rouvert en mmap)
+        "tarif_index": xc.tarif_store(Path(tarif_path).read_bytes(), infos.remises),
+        "mapping":     mapping,
+        "split_orders": split_orders,
+        "out_dir":     str(out_dir),
+    }
+
+
+def process_purchase(path, ctx=None):
+    """
+    Un fichier purchase -> XML agence 00 / A1 (écrits ensuite par OutputWriter).
+    Retourne (chemin, [(nom de fichier, octets XML)], nb de lignes, durée en s).
+    """
+    ctx = ctx or _CTX
+    start = time.perf_counter()
+    with open(path, "rb") as f:
+        raw, fmt = xc.load_purchase_autodetect(f)
+
+    mapping = ctx["mapping"] or (xc.FORMAT_SPECS[fmt] if fmt else None)
+    if mapping is None:
+        raise ValueError("format non reconnu — fournir un mapping (--mapping)")
+    missing = [v for v in mapping.values() if v and v not in raw.columns]
+    if missing:
+        raise ValueError(f"colonnes du mapping introuvables : {missing}")
+    purchase = xc.normalize_purchase(raw, mapping)
+
+    if ctx["split_orders"]:
+        # Un XML par n° de PO × agence (les fichiers sont déjà traités en parallèle)
+        files = xc.generate_split_xmls(
+            purchase, ctx["stock"], ctx["infos"], ctx["tarif_index"], workers=1
+        )
+    else:
+        xmls = xc.generate_order_xmls(
+            purchase, ctx["stock"], ctx["infos"], ctx["tarif_index"]
+        )
+        files = [(f"IN_TRANS_{num}.xml", xml) for xml, num in xmls.values() if num]  # num vide : agence sans ligne
+
+    return path, [(name, xml) for name, xml, *_ in files], len(purchase), time.perf_counter() - start
+
+
+class OutputWriter:
+    """
+    Écrit les XML du lot dans `out_dir`. Deux fichiers purchase qui produisent
+    le même nom (même n° de PO) ne s'écrasent pas : toutes les sorties en
+    conflit sont préfixées par le nom du fichier source (<source>_IN_TRANS_….xml),
+    y compris celle déjà écrite, quel que soit l'ordre de fin des processus.
+    """
+
+    def __init__(self, out_dir):
+        self.out_dir = Path(out_dir)
+        self.owners = {}        # nom -> fichier purchase qui l'a produit en premier
+        self.conflicts = set()  # noms produits par plusieurs fichiers purchase
+        self.written = {}       # chemin écrit -> fichier purchase source
+
+    def _prefixed(self, source, name):
+        return self.out_dir / f"{Path(source).stem}_{name}"
+
+    def _check_free(self, target, source):
+        owner = self.written.get(target, source)
+        if owner != source:
+            raise ValueError(f"{target.name} déjà produit par {owner} (fichiers purchase de même nom ?)")
+
+    def write(self, source, files):
+        """Écrit les (nom, octets XML) de `source`. Retourne les chemins écrits."""
+        written = []
+        for name, xml in files:
+            owner = self.owners.setdefault(name, source)
+            if owner != source and name not in self.conflicts:
+                # Première collision : la sortie déjà écrite est renommée elle aussi
+                first, renamed = self.out_dir / name, self._prefixed(owner, name)
+                self._check_free(renamed, owner)
+                if self._prefixed(source, name) == renamed:
+                    raise ValueError(f"{renamed.name} déjà produit par {owner} (fichiers purchase de même nom ?)")
+                self.conflicts.add(name)
+                del self.written[first]
+                self.written[renamed] = owner
+                first.replace(renamed)
+                print(f"ATTENTION  {name} produit par {owner} et {source} : "
+                      f"sorties préfixées par le nom du fichier source", file=sys.stderr)
+            target = self._prefixed(source, name) if name in self.conflicts else self.out_dir / name
+            self._check_free(target, source)
+            self.written[target] = source
+            target.write_bytes(xml)
+            written.append(str(target))
+        return written
+
+
+def run(files, ctx, workers=None):
+    """Traite `files` (en parallèle si workers > 1). Retourne le nb d'échecs."""
+    failures = 0
+    writer = OutputWriter(ctx["out_dir"])  # écritures dans ce processus : collisions de noms détectées
+
+    def report(path, result):
+        nonlocal failures
+        try:
+            _, files, n_lines, elapsed = result()
+            written = writer.write(path, files)
+        except Exception as e:
+            failures += 1
+            print(f"ÉCHEC  {path} : {e}", file=sys.stderr)
+        else:
+            print(f"OK     {path} — {n_lines} lignes, {len(written)} XML, {elapsed:.2f} s")
+
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(files) <= 1:
+        for path in files:
+            report(path, lambda: process_purchase(path, ctx))
+        return failures
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(ctx,)) as pool:
+        futures = {pool.submit(process_purchase, path): path for path in files}
+        for future in as_completed(futures):
+            report(futures[future], future.result)
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m xml_batch",
+        description="Génère les XML de commande (agences 00 / A1) pour un lot de fichiers purchase.",
+    )
+    parser.add_argument("purchases", nargs="+", help="fichiers, dossiers ou motifs glob (.xlsx)")
+    parser.add_argument("--infos", required=True, help="fichier infos (.xlsx)")
+    parser.add_argument("--stock", required=True, help="fichier stock (.csv)")
+    parser.add_argument("--tarif", required=True, help="fichier tarif (.txt)")
+    parser.add_argument("--out", default=".", help="dossier de sortie des XML (défaut : .)")
+    parser.add_argument("--mapping", help="mapping des colonnes (.json, ex: mapping_saved.json)")
+    parser.add_argument("--mapping-name", default=DEFAULT_NAME,
+                        help=f"nom du mapping enregistré à utiliser (défaut : {DEFAULT_NAME})")
+    parser.add_argument("--split-orders", action="store_true",
+                        help="un XML par n° de PO × agence (exports consolidés multi-commandes)")
+    parser.add_argument("--fournisseur", help="ne garder du stock que ce code Fournisseur (ex: 408)")
+    parser.add_argument("--stock-qty", metavar="COLONNE",
+                        help="colonne des quantités du stock : une ligne partiellement en stock "
+                             "est répartie entre les agences 00 et A1")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="nb de processus (défaut : nb de cœurs)")
+    args = parser.parse_args(argv)
+
+    files = expand_inputs(args.purchases)
+    if not files:
+        parser.error("aucun fichier purchase trouvé")
+
+    Path(args.out).mkdir(parents=True, exist_ok=True)
+    start = time.perf_counter()
+    try:
+        ctx = load_context(args.infos, args.stock, args.tarif, args.out, split_orders=args.split_orders,
+                           fournisseur=args.fournisseur, stock_qty=args.stock_qty)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.mapping:
+        # Mapping du fournisseur (identifiant du fichier infos), sinon mapping commun
+        store = LocalMappingStore(args.mapping)
+        ctx["mapping"] = store.get(ctx["infos"].identifiant, args.mapping_name) \
+            or store.get(DEFAULT_SUPPLIER, args.mapping_name)
+        if ctx["mapping"] is None:
+            parser.error(f"mapping « {args.mapping_name} » introuvable dans {args.mapping}")
+    print(f"Fichiers de référence chargés en {time.perf_counter() - start:.2f} s")
+
+    failures = run(files, ctx, args.workers)
+    print(f"{len(files) - failures}/{len(files)} fichier(s) traité(s) en {time.perf_counter() - start:.2f} s")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,930 @@
+# -*- coding: utf-8 -*-
+"""
+Moteur de génération des XML de commande fournisseur (agences 00 / A1).
+
+Indépendant de Streamlit : utilisé par la page gen_files.py et par le
+traitement par lots en ligne de commande (xml_batch.py).
+  - lecture des fichiers de référence : infos (xlsx), stock (csv), tarif (txt)
+  - détection du format du fichier purchase et normalisation des colonnes
+  - répartition des lignes : agence 00 (références en stock) / A1 (le reste)
+  - écriture du XML de commande (IN_TRANS_<n° de transaction>.xml)
+  - exports multi-commandes : un XML par n° de PO × agence, regroupés en ZIP
+  - index du tarif fournisseur sur disque (TarifStore), reconstruit seulement
+    quand le fichier tarif change
+"""
+
+import atexit
+import hashlib
+import io
+import multiprocessing
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import zipfile
+from collections import OrderedDict
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from types import MappingProxyType
+from xml.sax.saxutils import escape
+
+import numpy as np
+import pandas as pd
+
+from perf import span, timed
+from tarif_core import _private_dir
+
+# ==================== MAPPING DES FORMATS CONNUS ====================
+# Chaque format mappe les colonnes du fichier fournisseur vers les champs internes.
+# "prix_unitaire": None → calculé depuis valeur_ligne / quantite
+FORMAT_SPECS = {
+    "Format A – Ancien (Qty Pu / Pu Value)": {
+        "purchase_order": "Purchase Order",
+        "vendor_ref":     "Vendor Product Number",
+        "description":    "Product Description",
+        "quantite":       "Qty Pu",
+        "valeur_ligne":   "Pu Value",
+        "prix_unitaire":  None,
+        "discount1":      "Disc1",   # colonne la plus courante dans le Format A — mappable manuellement
+    },
+    "Format B – Nouveau (Purchase Row Quantity)": {
+        "purchase_order": "Po Number",
+        "vendor_ref":     "Vendor Product Number",
+        "description":    "Product Description",
+        "quantite":       "Purchase Row Quantity",
+        "valeur_ligne":   "Purchase Row Value Euro",
+        "prix_unitaire":  "Gross Value Per Unit",
+        "discount1":      "Discount 1",
+    },
+}
+
+FORMAT_SIGNATURES = {
+    "Format A – Ancien (Qty Pu / Pu Value)":           ["Qty Pu", "Pu Value", "Purchase Order"],
+    "Format B – Nouveau (Purchase Row Quantity)": ["Purchase Row Quantity", "Gross Value Per Unit", "Po Number"],
+}
+
+
+# ==================== CHARGEMENT DU FICHIER PURCHASE ====================
+# Le classeur est lu une seule fois (openpyxl en lecture seule, en flux) ;
+# la détection du format porte sur les HEADER_SCAN_ROWS premières lignes,
+# puis le DataFrame est construit à partir des lignes déjà lues, avec le
+# même analyseur que pd.read_excel (mêmes types, mêmes noms de colonnes).
+HEADER_SCAN_ROWS = 40
+
+
+def _convert_cell(cell):
+    """Valeur d'une cellule, convertie comme le fait pd.read_excel (moteur openpyxl)."""
+    from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+
+    if cell.value is None:
+        return ""
+    if cell.data_type == TYPE_ERROR:
+        return float("nan")
+    if cell.data_type == TYPE_NUMERIC:
+        val = int(cell.value)
+        return val if val == cell.value else float(cell.value)
+    return cell.value
+
+
+def read_sheet_rows(src):
+    """
+    Lignes de la 1re feuille d'un classeur xlsx (chemin ou fichier), en une passe.
+    Cellules vides finales et lignes vides finales retirées, lignes complétées
+    à la même largeur — comme pd.read_excel.
+    """
+    from openpyxl import load_workbook
+
+    if hasattr(src, "seek"):
+        src.seek(0)
+    wb = load_workbook(src, read_only=True, data_only=True, keep_links=False)
+    try:
+        ws = wb.worksheets[0]
+        ws.reset_dimensions()
+        rows, last = [], -1
+        for n, row in enumerate(ws.iter_rows()):
+            values = [_convert_cell(c) for c in row]
+            while values and values[-1] == "":
+                values.pop()
+            if values:
+                last = n
+            rows.append(values)
+    finally:
+        wb.close()
+
+    rows = rows[:last + 1]
+    if rows:
+        width = max(len(r) for r in rows)
+        rows = [r + [""] * (width - len(r)) for r in rows]
+    return rows
+
+
+def frame_from_rows(rows, header_row=0):
+    """DataFrame à partir des lignes lues, en-tête à la ligne `header_row` (noms nettoyés)."""
+    from pandas.errors import EmptyDataError
+    from pandas.io.parsers import TextParser
+
+    try:
+        df = TextParser([list(r) for r in rows], header=header_row, skip_blank_lines=False).read()
+    except EmptyDataError:
+        df = pd.DataFrame()
+    df.columns = df.columns.astype(str).str.replace("\ufeff", "", regex=False).str.strip()
+    return df
+
+
+def _detect_format(cols):
+    for fmt_name, signature in FORMAT_SIGNATURES.items():
+        if all(c in cols for c in signature):
+            return fmt_name
+    return None
+
+
+@timed("xml.read_purchase")
+def load_purchase_autodetect(uploaded_file):
+    """
+    Tente de détecter le format automatiquement.
+    Retourne (df, nom_format) si trouvé, sinon (df_brut, None) pour mapping manuel.
+    """
+    rows = read_sheet_rows(uploaded_file)
+
+    # Tentative header ligne 1 (Format B)
+    if rows:
+        header = {str(v).replace("\ufeff", "").strip() for v in rows[0]}
+        fmt_name = _detect_format(header)
+        if fmt_name:
+            return frame_from_rows(rows, 0), fmt_name
+
+    # Tentative header dynamique (Format A)
+    for i, row in enumerate(rows[:HEADER_SCAN_ROWS]):
+        if any(str(v).strip() == "Vendor Product Number" for v in row):
+            df = frame_from_rows(rows, i)
+            # Header trouvé mais format inconnu → mapping manuel (None)
+            return df, _detect_format(set(df.columns))
+
+    # Aucune détection → retourner header ligne 1 pour mapping manuel
+    return frame_from_rows(rows, 0), None
+
+
+# ==================== NORMALISATION ====================
+@timed("xml.normalize")
+def normalize_purchase(df, spec):
+    """
+    Purchase brut + mapping -> DataFrame compact des colonnes normalisées
+    (_purchase_order, _vendor_ref, _description, _quantite, _prix_unitaire,
+    _discount1, _prixvente), index 0..n-1. Les colonnes d'origine ne sont pas
+    recopiées : seules les colonnes du mapping sont lues, une fois chacune.
+    """
+    # ── Filtrer les lignes sans référence fournisseur (ex : ligne de total) ──
+    vendor     = df[spec["vendor_ref"]]
+    vendor_str = vendor.astype(str).str.strip()
+    keep       = vendor.notna() & (vendor_str != "") & (vendor_str != "nan")
+
+    def column(key):
+        return df[spec[key]][keep].reset_index(drop=True)
+
+    def numeric(key):
+        return pd.to_numeric(column(key), errors="coerce").fillna(0)
+
+    out = pd.DataFrame({
+        "_purchase_order": column("purchase_order").astype(str),
+        "_vendor_ref":     vendor_str[keep].reset_index(drop=True),
+        "_description":    column("description").astype(str),
+        "_quantite":       numeric("quantite"),
+    })
+
+    if spec.get("prix_unitaire"):
+        out["_prix_unitaire"] = numeric("prix_unitaire")
+    elif spec.get("valeur_ligne"):
+        out["_prix_unitaire"] = (numeric("valeur_ligne") / out["_quantite"].replace(0, float("nan"))).fillna(0)
+    else:
+        out["_prix_unitaire"] = 0.0
+
+    # ── Remise ligne (Discount 1) : format -35 → taux 0.35 ──
+    if spec.get("discount1") and spec["discount1"] in df.columns:
+        # La valeur est négative (ex : -35), on prend la valeur absolue pour le taux
+        out["_discount1"] = numeric("discount1").abs() / 100
+    else:
+        out["_discount1"] = 0.0
+
+    # ── Prix de vente HT = prix unitaire * (1 - remise) arrondi à 2 décimales ──
+    out["_prixvente"] = (out["_prix_unitaire"] * (1 - out["_discount1"])).round(2)
+    return out
+
+
+# ==================== FICHIERS DE RÉFÉRENCE ====================
+# Découpage en largeur fixe du fichier tarif fournisseur (.txt)
+TARIF_COLSPECS = [(0,10),(10,20),(20,30),(30,36),(36,44),(44,69),(69,84),(84,94),
+                  (94,102),(102,105),(105,109),(109,115),(115,119),(119,134)]
+TARIF_COLUMNS  = ['Monnaie','Article','Prix','Remise','Date','Designation','Code EAN',
+                  'Poids','Societe','PDR','Qte','Cond','VoirLP','HS Code']
+# Colonnes utilisées par la génération XML (les autres sont lues à la demande)
+TARIF_USED_COLUMNS = ('Article', 'Prix', 'Remise')
+
+# Suffixe du n° de transaction par agence
+AGENCE_SUFFIXES = {"00": "KUH1", "A1": "KUH2"}
+
+
+@timed("xml.read_infos")
+def read_infos(src):
+    """Fichier infos (xlsx, colonnes 'donnee' / 'valeur'). `src` : chemin ou fichier."""
+    infos = pd.read_excel(src, header=0)
+    if 'donnee' not in infos.columns or 'valeur' not in infos.columns:
+        raise ValueError("Les colonnes 'donnee' et 'valeur' sont absentes du fichier infos.")
+    return infos
+
+
+@timed("xml.read_stock")
+def read_stock(src, columns=None):
+    """
+    Fichier stock (csv ';', latin1). `src` : chemin ou fichier.
+    `columns` : colonnes à lire (les autres ne sont pas parsées ; une colonne
+    absente du fichier est ignorée). None = toutes.
+    """
+    usecols = None
+    if columns is not None:
+        wanted  = set(columns)
+        usecols = lambda c: c in wanted
+    return pd.read_csv(src, sep=';', dtype={'Fournisseur': str, 'Référence Frn': str},
+                       encoding='latin1', usecols=usecols)
+
+
+def _read_bytes(src):
+    """Octets d'un fichier : chemin, objet fichier ou octets déjà lus."""
+    if isinstance(src, (bytes, bytearray, memoryview)):
+        return bytes(src)
+    if hasattr(src, "read"):
+        if hasattr(src, "seek"):
+            src.seek(0)
+        return src.read()
+    with open(src, "rb") as f:
+        return f.read()
+
+
+@timed("xml.read_tarif")
+def read_tarif(src, columns=TARIF_USED_COLUMNS):
+    """
+    Fichier tarif fournisseur (txt largeur fixe, latin1). `src` : chemin, fichier ou octets.
+    Ne garde que les lignes dont le Prix commence par un chiffre ; Prix converti en float.
+
+    Le fichier est découpé en bloc : toutes les lignes sont rangées dans une
+    matrice d'octets de largeur fixe, chaque colonne de TARIF_COLSPECS en est une
+    tranche. Seules les colonnes `columns` sont extraites (défaut : celles utilisées
+    par la génération XML ; None = toutes). Les champs sont des chaînes sans les
+    espaces de bord (vide -> NaN) ; Prix est un float.
+    """
+    columns = TARIF_COLUMNS if columns is None else [c for c in TARIF_COLUMNS if c in columns]
+    spans = dict(zip(TARIF_COLUMNS, TARIF_COLSPECS))
+    lines = _read_bytes(src).splitlines()
+    width = TARIF_COLSPECS[-1][1]
+    chars = np.array(lines, dtype=f"S{width}").view(np.uint8).reshape(len(lines), width)
+
+    def field(name):
+        start, stop = spans[name]
+        return np.char.strip(np.ascontiguousarray(chars[:, start:stop]).view(f"S{stop - start}").ravel())
+
+    # Lignes dont le Prix commence par un chiffre (les autres : en-têtes, vides…)
+    prix = field('Prix')
+    first = prix.astype("S1")
+    keep = (first >= b"0") & (first <= b"9")
+    prix = prix[keep]
+
+    data = {}
+    for name in columns:
+        if name == 'Prix':
+            data[name] = np.char.replace(prix, b",", b".").astype(float) if len(prix) else np.zeros(0)
+        else:
+            values = pd.Series(np.char.decode(field(name)[keep], "latin1"))
+            data[name] = values.where(values != "", np.nan)
+    return pd.DataFrame(data, columns=columns)
+
+
+@timed("xml.tarif_index")
+def build_tarif_index(tarif, remise_mapping):
+    """
+    Index Article -> prix d'achat net (non arrondi) = Prix * (1 - taux de remise).
+    Calcul vectorisé sur tout le tarif ; en cas de référence en double,
+    la première ligne du tarif l'emporte.
+    """
+    first = tarif.drop_duplicates(subset="Article", keep="first")
+    taux  = first['Remise'].map(remise_mapping).fillna(0).astype(float)
+    prix  = first['Prix'].astype(float) * (1 - taux)
+    return dict(zip(first['Article'], prix))
+
+
+# ==================== INDEX STOCK ====================
+# Le stock (jusqu'à plusieurs millions de lignes) est réduit une fois en
+# StockIndex : références uniques dans un pd.Index (table de hachage construite
+# une fois, recherche d'un lot par get_indexer) et, si demandé, quantité
+# disponible par référence pour répartir une ligne entre les agences 00 et A1.
+class StockIndex:
+    """
+    Références en stock et quantités disponibles (None si non suivies).
+    Se comporte comme un ensemble de références (in, len, itération).
+    """
+
+    def __init__(self, refs, qty=None):
+        self.refs = pd.Index(refs)
+        self.qty  = None if qty is None else np.asarray(qty, dtype=float)
+        if not self.refs.is_unique:
+            raise ValueError("StockIndex : références en double")
+        # Construit dès maintenant la table de hachage réutilisée par chaque locate
+        self.refs.get_indexer(self.refs[:1])
+
+    def __len__(self):
+        return len(self.refs)
+
+    def __iter__(self):
+        return iter(self.refs)
+
+    def __contains__(self, ref):
+        return ref in self.refs
+
+    def locate(self, refs):
+        """Lot de références -> positions dans l'index (-1 si absente du stock)."""
+        return self.refs.get_indexer(refs)
+
+
+def stock_index(stock, fournisseur=None, qty_col=None):
+    """
+    DataFrame stock (read_stock) -> StockIndex.
+    `fournisseur` : ne garder que les lignes de ce code Fournisseur (ex. '408').
+    `qty_col`     : colonne des quantités en stock, sommées par référence
+                    (valeur non numérique -> 0) ; None = présence seule.
+    """
+    with span("xml.stock_index"):
+        missing = [c for c in ('Référence Frn', qty_col) if c and c not in stock.columns]
+        if fournisseur is not None and 'Fournisseur' not in stock.columns:
+            missing.append('Fournisseur')
+        if missing:
+            raise ValueError(f"Colonnes absentes du fichier stock : {missing}")
+
+        keep = stock['Référence Frn'].notna()
+        if fournisseur is not None:
+            keep &= stock['Fournisseur'].str.strip() == str(fournisseur).strip()
+        refs = stock.loc[keep, 'Référence Frn']
+        if qty_col is None:
+            return StockIndex(refs.unique())
+        qty = pd.to_numeric(stock.loc[keep, qty_col], errors='coerce').fillna(0)
+        qty = qty.groupby(refs.to_numpy(), sort=False).sum()
+        return StockIndex(qty.index, qty.to_numpy())
+
+
+def stock_columns(fournisseur=None, qty_col=None):
+    """Colonnes du fichier stock utiles à stock_index (argument `columns` de read_stock)."""
+    return ['Référence Frn'] + (['Fournisseur'] if fournisseur is not None else []) + ([qty_col] if qty_col else [])
+
+
+def load_stock_index(src, fournisseur=None, qty_col=None):
+    """Fichier stock -> StockIndex, en ne lisant que les colonnes utiles."""
+    return stock_index(read_stock(src, stock_columns(fournisseur, qty_col)), fournisseur, qty_col)
+
+
+# ==================== INDEX TARIF SUR DISQUE ====================
+# Le tarif fournisseur (mis à jour au plus une fois par mois) est compilé une
+# fois en tableaux numpy, dans un dossier nommé par l'empreinte SHA-256 du
+# fichier : références triées, prix et code remise. Ils sont ouverts en
+# mmap : ouverture en quelques ms, recherche d'un lot de références par
+# recherche dichotomique. Les taux de remise (fichier infos) sont appliqués
+# à la lecture : un changement de remise ne demande pas de reconstruction.
+# Dossier propre à l'utilisateur (droits 0700, comme le cache des tarifs CNH) :
+# un index déposé par un autre utilisateur fausserait les prix d'achat.
+# Emplacement surchargeable par la variable d'environnement TARIF_INDEX_DIR.
+TARIF_INDEX_DIR  = Path(os.environ.get("TARIF_INDEX_DIR") or Path(tempfile.gettempdir()) / (
+    f"tarif_fournisseur_index-{os.getuid()}" if hasattr(os, "getuid") else "tarif_fournisseur_index"))
+TARIF_INDEX_KEEP = 4        # nb de versions du tarif conservées (les plus récemment utilisées)
+# Nom d'un dossier d'index : sha256 du fichier tarif ; tout autre dossier est laissé en place
+TARIF_INDEX_NAME = re.compile(r"[0-9a-f]{64}")
+
+
+_fallback_index_dir = None
+
+
+def _index_dir(index_dir):
+    """
+    Dossier d'index utilisable : `index_dir` s'il est privé à l'utilisateur,
+    sinon un dossier temporaire privé propre au processus.
+    """
+    global _fallback_index_dir
+    index_dir = Path(index_dir or TARIF_INDEX_DIR)
+    if _private_dir(index_dir):
+        return index_dir
+    if _fallback_index_dir is None:
+        _fallback_index_dir = Path(tempfile.mkdtemp(prefix="tarif_fournisseur_index-"))
+        atexit.register(shutil.rmtree, _fallback_index_dir, True)
+    return _fallback_index_dir
+
+
+def _evict_indexes(index_dir, keep):
+    entries = []
+    for path in index_dir.iterdir():
+        try:
+            if TARIF_INDEX_NAME.fullmatch(path.name) and path.is_dir():
+                entries.append((path.stat().st_mtime, path))
+        except OSError:
+            continue
+    for _, path in sorted(entries, reverse=True)[keep:]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+@timed("xml.build_tarif_store")
+def build_tarif_store(raw, index_dir=None, keep=TARIF_INDEX_KEEP):
+    """
+    Octets du fichier tarif -> dossier de l'index sur disque (construit s'il n'existe pas).
+    En cas de référence en double, la première ligne du tarif l'emporte
+    (comme build_tarif_index). Un dossier `index_dir` partagé ou appartenant
+    à un autre utilisateur est remplacé par un dossier temporaire privé.
+    """
+    index_dir = _index_dir(index_dir)
+    path = index_dir / hashlib.sha256(raw).hexdigest()
+    if (path / "refs.npy").exists():
+        os.utime(path)
+        return path
+
+    tarif = read_tarif(raw).dropna(subset=["Article"]).drop_duplicates(subset="Article", keep="first")
+    refs  = tarif['Article'].to_numpy(dtype=str)
+    order = np.argsort(refs, kind="stable")
+    codes, remise_idx = np.unique(tarif['Remise'].fillna("").to_numpy(dtype=str), return_inverse=True)
+
+    # Écriture dans un dossier temporaire puis renommage : jamais d'index partiel
+    tmp = None
+    try:
+        tmp = Path(tempfile.mkdtemp(dir=index_dir, prefix=".tmp"))
+        np.save(tmp / "prix.npy", tarif['Prix'].to_numpy(dtype=float)[order])
+        np.save(tmp / "remise_idx.npy", remise_idx.astype(np.int32)[order])
+        np.save(tmp / "remise_codes.npy", codes)
+        np.save(tmp / "refs.npy", refs[order])
+        os.replace(tmp, path)
+    except OSError:
+        # Index construit entre-temps par un autre processus
+        if tmp is not None:
+            shutil.rmtree(tmp, ignore_errors=True)
+        if not (path / "refs.npy").exists():
+            raise
+    _evict_indexes(index_dir, keep)
+    return path
+
+
+class TarifStore:
+    """
+    Index Article -> prix d'achat net (non arrondi) = Prix * (1 - taux de remise),
+    lu sur disque (build_tarif_store). S'utilise comme l'index de
+    build_tarif_index : get(ref, défaut) ; lookup(refs) pour un lot.
+    """
+
+    def __init__(self, path, remise_mapping):
+        self.path       = Path(path)
+        self.remises    = dict(remise_mapping)
+        self.refs       = np.load(self.path / "refs.npy", mmap_mode="r")
+        self.prix       = np.load(self.path / "prix.npy", mmap_mode="r")
+        self.remise_idx = np.load(self.path / "remise_idx.npy", mmap_mode="r")
+        # Taux par code remise : code absent ou taux vide -> 0 (comme build_tarif_index)
+        codes = np.load(self.path / "remise_codes.npy")
+        self.rates = pd.Series(codes).map(self.remises).fillna(0).to_numpy(dtype=float)
+
+    def __reduce__(self):
+        # Pool de processus : seul le chemin est transmis, l'index est rouvert en mmap
+        return type(self), (self.path, self.remises)
+
+    def __len__(self):
+        return len(self.refs)
+
+    def lookup(self, refs):
+        """Lot de références -> (prix d'achat nets, masque des références trouvées)."""
+        query = np.asarray(list(refs), dtype=str)
+        if not len(self.refs) or not len(query):
+            return np.zeros(len(query)), np.zeros(len(query), dtype=bool)
+        pos   = np.minimum(np.searchsorted(self.refs, query), len(self.refs) - 1)
+        found = self.refs[pos] == query
+        pos   = pos[found]
+        net   = np.zeros(len(query))
+        net[found] = self.prix[pos] * (1 - self.rates[self.remise_idx[pos]])
+        return net, found
+
+    def get(self, ref, default=0.0):
+        net, found = self.lookup([ref])
+        return float(net[0]) if found[0] else default
+
+
+def tarif_store(raw, remise_mapping, index_dir=None):
+    """Octets du fichier tarif -> TarifStore (index reconstruit seulement si le fichier a changé)."""
+    return TarifStore(build_tarif_store(raw, index_dir), remise_mapping)
+
+
+def prix_achat(tarif_index, refs):
+    """
+    Prix d'achat nets (non arrondis, float Python) d'un lot de références ;
+    0.0 pour une référence absente. `tarif_index` : dict build_tarif_index ou TarifStore.
+    """
+    if isinstance(tarif_index, TarifStore):
+        return tarif_index.lookup(refs)[0].tolist()
+    return [tarif_index.get(r, 0.0) for r in refs]
+
+
+# ==================== CONFIGURATION INFOS ====================
+# Le fichier infos est compilé une fois en InfosConfig : dict donnee -> valeur
+# (1re occurrence), table de remise et identifiant, en lecture seule. Il est
+# passé tel quel aux fonctions XML (aucun parcours du DataFrame par commande).
+REMISE_PREFIX = 'remise :'
+# Données contrôlées dès le chargement du fichier infos : sans elles, les XML
+# seraient générés avec des valeurs par défaut (identifiant 'INCONNU', prix
+# d'achat sans remise). REMISE_PREFIX : au moins une ligne 'remise : X'.
+REQUIRED_INFOS = ('identifiant', 'nomfact', 'code_client', REMISE_PREFIX)
+
+
+@dataclass(frozen=True)
+class InfosConfig:
+    """Fichier infos compilé (immuable). Voir compile_infos."""
+    values: Mapping            # donnee -> valeur
+    remises: Mapping           # lettre de remise -> taux
+    identifiant: str = 'INCONNU'
+
+    def __post_init__(self):
+        object.__setattr__(self, "values", MappingProxyType(dict(self.values)))
+        object.__setattr__(self, "remises", MappingProxyType(dict(self.remises)))
+
+    def __reduce__(self):
+        # MappingProxyType ne se sérialise pas (pool de processus de xml_batch)
+        return type(self), (dict(self.values), dict(self.remises), self.identifiant)
+
+    def get(self, key, default=""):
+        return self.values.get(key, default)
+
+
+@timed("xml.compile_infos")
+def compile_infos(infos, required=REQUIRED_INFOS):
+    """
+    DataFrame infos (read_infos) -> InfosConfig, en un seul parcours.
+      - values      : donnee -> valeur (la 1re occurrence l'emporte)
+      - remises     : lignes 'remise : X' -> {X: taux} (la dernière l'emporte)
+      - identifiant : préfixe de refagrizone, 'INCONNU' si absent
+    Lève ValueError si une clé de `required` manque (défaut : REQUIRED_INFOS ;
+    () = aucun contrôle) ou si une ligne de remise est mal formée (lettre
+    absente, taux non numérique).
+    """
+    values, remises = {}, {}
+    for key, value in zip(infos['donnee'], infos['valeur']):
+        values.setdefault(key, value)
+        if isinstance(key, str) and REMISE_PREFIX in key:
+            parts = key.split(': ')
+            try:
+                remises[parts[1].strip()] = float(value)
+            except (IndexError, TypeError, ValueError):
+                raise ValueError(f"Ligne de remise invalide dans le fichier infos : {key!r} = {value!r}") from None
+
+    missing = [key for key in required
+               if (not remises if key == REMISE_PREFIX else key not in values)]
+    if missing:
+        labels = [f"{key} X (au moins une ligne)" if key == REMISE_PREFIX else key for key in missing]
+        raise ValueError(f"Données absentes du fichier infos : {', '.join(labels)}")
+    return InfosConfig(values, remises, values.get('identifiant', 'INCONNU'))
+
+
+# ==================== CACHE DES FICHIERS DE RÉFÉRENCE ====================
+# Cache mémoire partagé par toutes les sessions du processus : clé = empreinte
+# SHA-256 du fichier chargé ; éviction LRU au-delà de REF_CACHE_MAX_BYTES
+# (taille estimée des structures préparées).
+REF_CACHE_MAX_BYTES = 256 << 20
+
+_ref_cache = OrderedDict()      # clé -> (valeur, taille estimée)
+_ref_cache_bytes = 0
+_ref_cache_lock = threading.Lock()
+
+
+def _approx_size(obj):
+    """Taille mémoire approximative (octets) d'une structure préparée."""
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(deep=True).sum())
+    if isinstance(obj, StockIndex):
+        return obj.refs.memory_usage(deep=True) * 3 + (obj.qty.nbytes if obj.qty is not None else 0)
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(_approx_size(k) + _approx_size(v) for k, v in obj.items())
+    if isinstance(obj, (tuple, list, set, frozenset)):
+        return sys.getsizeof(obj) + sum(_approx_size(v) for v in obj)
+    return sys.getsizeof(obj)
+
+
+def _cached(kind, raw, build, *params):
+    """Résultat de build() mis en cache sous (kind, sha256(raw), params)."""
+    global _ref_cache_bytes
+    key = (kind, hashlib.sha256(raw).hexdigest(), params)
+    with _ref_cache_lock:
+        if key in _ref_cache:
+            _ref_cache.move_to_end(key)
+            return _ref_cache[key][0]
+
+    value = build()
+    size = _approx_size(value)
+    with _ref_cache_lock:
+        if key not in _ref_cache:
+            _ref_cache[key] = (value, size)
+            _ref_cache_bytes += size
+        while _ref_cache_bytes > REF_CACHE_MAX_BYTES and len(_ref_cache) > 1:
+            _, (_, old_size) = _ref_cache.popitem(last=False)
+            _ref_cache_bytes -= old_size
+    return value
+
+
+def clear_reference_cache():
+    global _ref_cache_bytes
+    with _ref_cache_lock:
+        _ref_cache.clear()
+        _ref_cache_bytes = 0
+
+
+def cached_infos(raw, required=REQUIRED_INFOS):
+    """
+    Octets du fichier infos -> InfosConfig (compile_infos).
+    Lève ValueError si les colonnes 'donnee' / 'valeur' ou une clé `required` sont absentes.
+    """
+    return _cached("infos", raw, lambda: compile_infos(read_infos(io.BytesIO(raw)), required),
+                   tuple(required))
+
+
+def cached_stock_index(raw, fournisseur=None, qty_col=None):
+    """Octets du fichier stock -> StockIndex (load_stock_index)."""
+    return _cached("stock", raw, lambda: load_stock_index(io.BytesIO(raw), fournisseur, qty_col),
+                   fournisseur, qty_col)
+
+
+def cached_tarif_index(raw, remise_mapping):
+    """Octets du fichier tarif -> index Article -> prix d'achat net (build_tarif_index)."""
+    def build():
+        return build_tarif_index(read_tarif(io.BytesIO(raw)), remise_mapping)
+    return _cached("tarif", raw, build, tuple(sorted(remise_mapping.items())))
+
+
+def cached_tarif_store(raw, remise_mapping):
+    """Octets du fichier tarif -> TarifStore (index sur disque, voir tarif_store)."""
+    return _cached("tarif_store", raw, lambda: tarif_store(raw, remise_mapping),
+                   tuple(sorted(remise_mapping.items())))
+
+
+# ==================== RÉPARTITION PAR AGENCE ====================
+@timed("xml.split")
+def split_agences(purchase, stock):
+    """
+    Agence 00 = lignes servies par le stock ; agence A1 = les autres, en un
+    seul passage sur le purchase.
+    `stock` : StockIndex (ou DataFrame stock / jeu de références).
+    Si le StockIndex porte des quantités, le stock disponible d'une référence
+    est attribué aux lignes dans leur ordre : une ligne partiellement servie
+    est répartie entre les deux agences (_quantite ajustée de chaque côté,
+    même index). Sans quantités : présence de la référence dans le stock.
+    """
+    stock = _as_stock_index(stock)
+    pos   = stock.locate(purchase['_vendor_ref'])
+    found = pos >= 0
+    if stock.qty is None:
+        return purchase[found], purchase[~found]
+
+    want  = purchase['_quantite'].to_numpy(dtype=float, na_value=0.0)
+    asked = np.maximum(want, 0)
+    avail = np.where(found, stock.qty[pos], 0)
+    # Quantité déjà attribuée aux lignes précédentes de la même référence
+    before = pd.Series(asked).groupby(purchase['_vendor_ref'].to_numpy(), sort=False).cumsum().to_numpy() - asked
+    take   = np.minimum(np.maximum(avail - np.nan_to_num(before), 0), asked)
+    rest  = asked - take
+
+    in_00 = found & ((take > 0) | (want <= 0))
+    in_A1 = ~found | (rest > 0)
+    agence_00, agence_A1 = purchase[in_00], purchase[in_A1]
+    if (in_00 & in_A1).any():
+        agence_00 = agence_00.assign(_quantite=np.where(want <= 0, want, take)[in_00])
+        agence_A1 = agence_A1.assign(_quantite=np.where(found, rest, want)[in_A1])
+    return agence_00, agence_A1
+
+
+def _as_stock_index(stock):
+    if isinstance(stock, StockIndex):
+        return stock
+    if isinstance(stock, pd.DataFrame):
+        return stock_index(stock)
+    return StockIndex(pd.unique(pd.Series(list(stock), dtype=object).dropna()))
+
+
+# ==================== CRÉATION XML ====================
+# Écriture directe du document (sans arbre ElementTree) : même indentation
+# que l'ancien indent_xml, balises vides écrites <tag></tag>, texte échappé
+# comme ElementTree (&, <, >), caractères hors ISO-8859-1 en &#NNN; pour A1.
+XML_INDENT = "  "
+
+
+def _xml_text(value):
+    """Texte d'élément échappé ; None / NaN -> élément vide."""
+    if value is None or (isinstance(value, float) and value != value):
+        return ""
+    return escape(str(value))
+
+
+def _xml_escape_col(s):
+    """Échappement XML d'une colonne entière."""
+    return (s.astype(str)
+             .str.replace("&", "&amp;", regex=False)
+             .str.replace("<", "&lt;", regex=False)
+             .str.replace(">", "&gt;", regex=False))
+
+
+def _xml_leaf(tag, value=""):
+    return f"<{tag}>{_xml_text(value)}</{tag}>"
+
+
+def _xml_block(tag, children, level):
+    """Élément conteneur de niveau `level` ; `children` = fragments déjà sérialisés."""
+    if not children:
+        return f"<{tag}></{tag}>"
+    ind = "\n" + XML_INDENT * (level + 1)
+    return f"<{tag}>" + "".join(ind + c for c in children) + ind + f"</{tag}>"
+
+
+@timed("xml.lignes")
+def lignes_xml(data, agence, tarif_index, identifiant, level=2):
+    """
+    Fragments <ligne> de toutes les lignes de commande, calculés colonne par colonne.
+    NumLigtransaction = index de la ligne dans le purchase + 1.
+    """
+    if data.empty:
+        return []
+    ind = "\n" + XML_INDENT * (level + 1)
+
+    def leaf(tag, col):
+        return ind + f"<{tag}>" + col + f"</{tag}>"
+
+    refs       = data['_vendor_ref']
+    num        = pd.Series([f"{i + 1:05d}" for i in data.index], index=data.index)
+    refs_xml   = _xml_escape_col(refs)
+    qte        = data['_quantite'].map("{:.2f}".format)
+    prixachat  = pd.Series([f"{round(p, 2):.2f}" for p in prix_achat(tarif_index, refs)], index=data.index)
+    prixvente  = data['_prixvente'].map("{:.2f}".format)
+    codefour   = leaf("codefour", "408") if agence == "00" else ""
+
+    lignes = (
+        "<ligne>"
+        + leaf("NumLigtransaction", num)
+        + leaf("refagrizone", escape(f"{identifiant} ") + refs_xml)
+        + leaf("reffour", refs_xml)
+        + leaf("libelle", _xml_escape_col(data['_description']))
+        + leaf("qte", qte)
+        + leaf("prixachat", prixachat)
+        # Prix de vente HT = Gross Value Per Unit * ((100 - abs(Discount 1)) / 100)
+        + leaf("prixventeHT", prixvente)
+        + leaf("prixventeTTC", "0.00")
+        + codefour
+        + leaf("departlivr", "")
+        + ind + "</ligne>"
+    )
+    return lignes.tolist()
+
+
+@timed("xml.build")
+def create_xml(data, agence, suffix, config, tarif_index):
+    """
+    XML de commande d'une agence ("00" ou "A1") -> (octets, n° de transaction).
+    `config` : InfosConfig (compile_infos) ; `tarif_index` : build_tarif_index.
+    """
+    info = config.get
+
+    numtransaction = f"{data.iloc[0]['_purchase_order']}{suffix}" if not data.empty else ""
+    is_00          = agence == "00"
+
+    entete = [
+        _xml_leaf("numtransaction", numtransaction),
+        _xml_leaf("passtransaction", numtransaction),
+        _xml_leaf("agence", agence),
+    ]
+    if is_00:
+        entete += [_xml_leaf("code_edo"), _xml_leaf("nivcommande", "0")]
+
+    adrfact = [
+        _xml_leaf("emailfact", "vendor.invoices@kramp.com" if is_00 else ""),
+        _xml_leaf("nomfact", info('nomfact', 'Nom Facturation Inconnu')),
+        _xml_leaf("adr1fact", info('adr1fact', '')),
+    ]
+    if is_00:
+        adrfact += [_xml_leaf(tag) for tag in ["adr2fact","adr3fact","telephonefact","numtva","numsiret"]]
+    adrfact += [_xml_leaf(tag, info(tag, '')) for tag in ["paysfact","villefact","cpfact","code_client"]]
+    entete.append(_xml_block("adrfact", adrfact, 2))
+
+    adrlivr = []
+    if is_00:
+        adrlivr += [_xml_leaf("typadrlivr", "CL"), _xml_leaf("nominterloclivr", info('nomadrlivr', ''))]
+    adrlivr += [
+        _xml_leaf("emaillivr", "vendor.invoices@kramp.com" if is_00 else info('emaillivr', '')),
+        _xml_leaf("nomadrlivr", info('nomadrlivr', '')),
+        _xml_leaf("adr1livr", info('adr1livr', '')),
+        _xml_leaf("adr2livr", info('adr2livr', '')),
+    ]
+    if is_00:
+        adrlivr += [_xml_leaf("adr3livr"), _xml_leaf("telephonelivr")]
+    adrlivr += [_xml_leaf(tag, info(tag, '')) for tag in ["payslivr","villelivr","cplivr"]]
+    entete.append(_xml_block("adrlivr", adrlivr, 2))
+
+    if is_00:
+        livr = [_xml_leaf(tag) for tag in ["trans","mode","idrelai","departlivr","delailivr","infolivr"]]
+        entete += [_xml_block("livr", livr, 2), _xml_leaf("tauxwtva", "20")]
+
+    pied = [_xml_leaf("modepaiement", "TRANSFER")]
+    pied += [_xml_leaf(tag, info(tag, "")) for tag in ["mtport","mtht","remise","mttva","mtttc"]]
+    if is_00:
+        pied += [_xml_leaf(tag) for tag in ["numtvacee","domiciliation","rib","iban","bic"]]
+
+    transaction = _xml_block("transaction", [
+        _xml_block("entetetransaction", entete, 1),
+        _xml_block("lignes", lignes_xml(data, agence, tarif_index, config.identifiant), 1),
+        _xml_block("pied", pied, 1),
+    ], 0)
+
+    encoding        = "utf-8" if is_00 else "ISO-8859-1"
+    xml_declaration = f'<?xml version="1.0" encoding="{encoding.upper()}"?>\n'
+    with span("xml.encode"):
+        xml = (xml_declaration + transaction + "\n").encode(encoding, "xmlcharrefreplace")
+    return xml, numtransaction
+
+
+def generate_order_xmls(purchase, stock, config, tarif_index):
+    """
+    Pipeline complet pour un purchase normalisé : répartition 00 / A1 puis XML.
+    Retourne {agence: (octets XML, n° de transaction)}.
+    """
+    agence_00, agence_A1 = split_agences(purchase, stock)
+    return {
+        agence: create_xml(data, agence, AGENCE_SUFFIXES[agence], config, tarif_index)
+        for agence, data in (("00", agence_00), ("A1", agence_A1))
+    }
+
+
+# ==================== COMMANDES MULTIPLES ====================
+# Un export consolidé peut contenir plusieurs n° de PO : une commande (un XML)
+# par n° de PO × agence, générées en parallèle puis regroupées dans un ZIP.
+@timed("xml.split_orders")
+def split_orders(purchase, stock):
+    """
+    Purchase normalisé -> liste de (n° de PO, agence, lignes), un élément par
+    n° de PO × agence non vide, dans l'ordre d'apparition des PO. Les lignes
+    de chaque PO sont renumérotées depuis 0, comme si le fichier ne contenait
+    que cette commande (NumLigtransaction = rang de la ligne dans le PO + 1).
+    """
+    purchase = purchase[purchase["_purchase_order"].notna()]
+    # Index = rang de la ligne dans son PO, puis une seule répartition 00 / A1
+    ranked = purchase.set_axis(purchase.groupby("_purchase_order", sort=False).cumcount().to_numpy())
+    parts  = {
+        agence: dict(list(data.groupby("_purchase_order", sort=False)))
+        for agence, data in zip(("00", "A1"), split_agences(ranked, stock))
+    }
+    groups = []
+    for po in ranked["_purchase_order"].unique():
+        for agence in ("00", "A1"):
+            if po in parts[agence]:
+                groups.append((po, agence, parts[agence][po]))
+    return groups
+
+
+def _order_xml(data, agence, config, tarif_index):
+    """Une commande -> (nom de fichier, octets XML, nb de lignes)."""
+    xml, num = create_xml(data, agence, AGENCE_SUFFIXES[agence], config, tarif_index)
+    return f"IN_TRANS_{num}.xml", xml, len(data)
+
+
+@timed("xml.generate")
+def generate_split_xmls(purchase, stock, config, tarif_index, workers=None, processes=False):
+    """
+    Un XML par n° de PO × agence (split_orders) -> liste de
+    (nom de fichier IN_TRANS_<n°>.xml, octets XML, nb de lignes).
+
+    `workers` : taille du pool (défaut : nb de cœurs ; 1 = séquentiel).
+    `processes` : pool de processus au lieu de threads ; chaque tâche ne
+    reçoit alors que la partie de `tarif_index` utile à sa commande (un
+    TarifStore est transmis par son chemin et rouvert en mmap).
+    """
+    groups  = split_orders(purchase, stock)
+    workers = min(workers or os.cpu_count() or 1, len(groups))
+    if workers <= 1:
+        return [_order_xml(data, agence, config, tarif_index) for _, agence, data in groups]
+
+    if processes:
+        # Jamais "fork" depuis le serveur Streamlit multi-thread
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method))
+    else:
+        pool = ThreadPoolExecutor(max_workers=workers)
+    with pool:
+        futures = []
+        for _, agence, data in groups:
+            index = tarif_index
+            if processes and not isinstance(tarif_index, TarifStore):
+                refs  = data['_vendor_ref'].unique()
+                index = dict(zip(refs, prix_achat(tarif_index, refs)))
+            futures.append(pool.submit(_order_xml, data, agence, config, index))
+        return [f.result() for f in futures]
+
+
+@timed("xml.zip")
+def zip_xmls(files):
+    """[(nom de fichier, octets XML, …)] -> octets d'une archive ZIP."""
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, xml, *_ in files:
+            zf.writestr(name, xml)
+    return buf.getvalue()